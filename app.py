@@ -6,9 +6,10 @@ from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from werkzeug.middleware.proxy_fix import ProxyFix
 
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from utils.engine_profiles import REPORTS_BIND, engine_options, configure_engine
+from utils.instrumentation import init_instrumentation
+from utils.fragment_cache import init_fragment_cache
+from utils.assets import init_assets
 
 
 class Base(DeclarativeBase):
@@ -16,29 +17,100 @@ class Base(DeclarativeBase):
 
 
 db = SQLAlchemy(model_class=Base)
-# create the app
-app = Flask(__name__, template_folder='.')
-app.secret_key = os.environ.get("SESSION_SECRET")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
-
-# configure the database, relative to the app instance folder
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///customer_service.db")
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    "pool_recycle": 300,
-    "pool_pre_ping": True,
-}
-# initialize the app with the extension, flask-sqlalchemy >= 3.0.x
-db.init_app(app)
-
-with app.app_context():
-    # Make sure to import the models here or their tables won't be created
-    import models  # noqa: F401
-    
-    db.create_all()
-
-# Import routes after app is created to avoid circular imports
-from routes import *  # noqa: F401
-
-# Initialize the database with sample data
-with app.app_context():
-    initialize_db()
+
+
+def create_app():
+    """
+    Create and configure the Flask app.
+
+    Nothing here touches the database: tables, indexes, rollups and sample
+    data are managed with ``flask db upgrade`` and ``flask db seed`` so that
+    workers, tests and CLI invocations start without schema work and without
+    racing each other to seed.
+    """
+    app = Flask(__name__, template_folder='.')
+    app.secret_key = os.environ.get("SESSION_SECRET")
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
+
+    # Configure logging
+    app.config["LOG_LEVEL"] = os.environ.get("LOG_LEVEL", "INFO").upper()
+    logging.basicConfig(level=app.config["LOG_LEVEL"])
+
+    # configure the database, relative to the app instance folder
+    app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///customer_service.db")
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(app.config["SQLALCHEMY_DATABASE_URI"])
+    # optional read-only database (e.g. a replica) for analytics and exports
+    read_url = os.environ.get("READ_DATABASE_URL")
+    if read_url:
+        app.config["SQLALCHEMY_BINDS"] = {
+            REPORTS_BIND: {"url": read_url, **engine_options(read_url, read_only=True)}
+        }
+    # seconds a worker may serve recommendations from its in-memory catalog index
+    app.config["CATALOG_INDEX_MAX_AGE"] = int(os.environ.get("CATALOG_INDEX_MAX_AGE", 300))
+    # "customers who bought X also bought Y": neighbours used per product,
+    # neighbours stored per product (the spare ones absorb the drift of
+    # incremental updates between rebuilds), the minimum number of shared
+    # customers for a neighbour, the most a recommendation score can be
+    # raised by co-purchases (0 ranks by preferences and promotions only, as
+    # before co-purchases existed), and how long a worker may use its
+    # in-memory neighbour index
+    app.config["COPURCHASE_NEIGHBORS"] = int(os.environ.get("COPURCHASE_NEIGHBORS", 10))
+    app.config["COPURCHASE_STORED_NEIGHBORS"] = int(os.environ.get("COPURCHASE_STORED_NEIGHBORS", 20))
+    app.config["COPURCHASE_MIN_CUSTOMERS"] = int(os.environ.get("COPURCHASE_MIN_CUSTOMERS", 2))
+    app.config["COPURCHASE_MAX_BOOST"] = int(os.environ.get("COPURCHASE_MAX_BOOST", 2))
+    app.config["COPURCHASE_INDEX_MAX_AGE"] = int(os.environ.get("COPURCHASE_INDEX_MAX_AGE", 300))
+    # analytics and recommendation responses are cached for this many seconds
+    # unless a write invalidates them first
+    app.config["RESPONSE_CACHE_TTL"] = int(os.environ.get("RESPONSE_CACHE_TTL", 30))
+    app.config["RESPONSE_CACHE_MAX_ENTRIES"] = int(os.environ.get("RESPONSE_CACHE_MAX_ENTRIES", 1024))
+    # rendered template fragments are keyed by data version and kept in the
+    # same backend for up to this many seconds (0 disables fragment caching);
+    # the expiry also bounds how long a product rename takes to show in a
+    # cached purchase history
+    app.config["FRAGMENT_CACHE_TTL"] = int(os.environ.get("FRAGMENT_CACHE_TTL", 3600))
+    # "batch" queues /api/save_interaction writes and group-commits them every
+    # INTERACTION_BATCH_SIZE rows or INTERACTION_BATCH_INTERVAL_MS milliseconds
+    app.config["INTERACTION_WRITE_MODE"] = os.environ.get("INTERACTION_WRITE_MODE", "direct")
+    app.config["INTERACTION_BATCH_SIZE"] = int(os.environ.get("INTERACTION_BATCH_SIZE", 100))
+    app.config["INTERACTION_BATCH_INTERVAL_MS"] = int(os.environ.get("INTERACTION_BATCH_INTERVAL_MS", 20))
+    app.config["INTERACTION_WRITE_TIMEOUT"] = float(os.environ.get("INTERACTION_WRITE_TIMEOUT", 5))
+    app.config["INTERACTION_BATCH_MAX_ROWS"] = int(os.environ.get("INTERACTION_BATCH_MAX_ROWS", 5000))
+    # days of hourly analytics buckets kept; older data is only kept per day
+    app.config["TIMESERIES_HOURLY_DAYS"] = int(os.environ.get("TIMESERIES_HOURLY_DAYS", 14))
+    # days of activity (today included) covered by the segment analytics
+    app.config["SEGMENT_WINDOW_DAYS"] = int(os.environ.get("SEGMENT_WINDOW_DAYS", 30))
+    # live analytics stream: how often each process checks for writes made by
+    # other processes, the keepalive interval, how long one connection
+    # lasts before the browser reconnects, how many streams one process
+    # serves (keep it below the gunicorn threads per worker), and how long a
+    # dashboard turned away waits before trying again
+    app.config["ANALYTICS_STREAM_POLL_SECONDS"] = float(os.environ.get("ANALYTICS_STREAM_POLL_SECONDS", 5))
+    app.config["ANALYTICS_STREAM_HEARTBEAT_SECONDS"] = float(os.environ.get("ANALYTICS_STREAM_HEARTBEAT_SECONDS", 15))
+    app.config["ANALYTICS_STREAM_MAX_SECONDS"] = float(os.environ.get("ANALYTICS_STREAM_MAX_SECONDS", 300))
+    app.config["ANALYTICS_STREAM_MAX_SUBSCRIBERS"] = int(os.environ.get("ANALYTICS_STREAM_MAX_SUBSCRIBERS", 16))
+    app.config["ANALYTICS_STREAM_RETRY_SECONDS"] = int(os.environ.get("ANALYTICS_STREAM_RETRY_SECONDS", 60))
+    # statements and requests slower than this many milliseconds are logged
+    app.config["SLOW_QUERY_MS"] = float(os.environ.get("SLOW_QUERY_MS", 200))
+    app.config["SLOW_REQUEST_MS"] = float(os.environ.get("SLOW_REQUEST_MS", 1000))
+    # initialize the app with the extension, flask-sqlalchemy >= 3.0.x
+    db.init_app(app)
+    with app.app_context():
+        # Engines are created by init_app but do not connect until first use
+        for bind_key, engine in db.engines.items():
+            configure_engine(engine, read_only=bind_key == REPORTS_BIND)
+    # query counts and timings per request, Server-Timing headers and /metrics
+    init_instrumentation(app)
+    # {% cache %} tag for versioned template fragments
+    init_fragment_cache(app)
+    # fingerprinted, precompressed CSS and JavaScript built by `flask assets build`
+    init_assets(app)
+    return app
+
+
+app = create_app()
+
+# Models, routes and CLI commands register themselves on the app; importing
+# them after the app is created avoids circular imports
+import models  # noqa: E402,F401
+from routes import *  # noqa: E402,F401
+import commands  # noqa: E402,F401
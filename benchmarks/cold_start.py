@@ -0,0 +1,89 @@
+"""
+Measure worker cold start.
+
+Every run starts a fresh interpreter, imports the WSGI module the way a
+gunicorn worker does (``main:app``) and serves one request through the test
+client, so the numbers include interpreter start-up, imports, whatever the
+app does at import time and the first database round trip.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/cold_start.py --runs 20
+
+The database should already exist (``flask db upgrade`` and optionally
+``flask db seed``); it is not modified by the benchmark.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside the child interpreter and reports its own timings as JSON
+CHILD = """
+import json, time
+started = time.perf_counter()
+from main import app
+imported = time.perf_counter()
+response = app.test_client().get({path!r})
+served = time.perf_counter()
+print(json.dumps({{
+    "import_ms": (imported - started) * 1000,
+    "first_request_ms": (served - imported) * 1000,
+    "status": response.status_code
+}}))
+"""
+
+
+def run_once(path):
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-c", CHILD.format(path=path)],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - started) * 1000
+    return result
+
+
+def summarize(values):
+    return {
+        "min": min(values),
+        "median": statistics.median(values),
+        "max": max(values)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10, help="Cold starts to measure")
+    parser.add_argument("--path", default="/api/customers", help="Request served after the import")
+    parser.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = parser.parse_args()
+
+    # One warm-up run so the OS file cache does not skew the first sample
+    run_once(args.path)
+    runs = [run_once(args.path) for _ in range(args.runs)]
+
+    summary = {
+        "runs": args.runs,
+        "database_url": os.environ.get("DATABASE_URL", "(app default)"),
+        "statuses": sorted({run["status"] for run in runs}),
+    }
+    for metric in ("import_ms", "first_request_ms", "process_ms"):
+        summary[metric] = summarize([run[metric] for run in runs])
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"{args.runs} cold starts against {summary['database_url']} (statuses {summary['statuses']})")
+    for metric in ("import_ms", "first_request_ms", "process_ms"):
+        stats = summary[metric]
+        print(f"  {metric:<17} min {stats['min']:8.1f}  median {stats['median']:8.1f}  max {stats['max']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Latency benchmark for the main routes and utilities.
+
+Every case runs in-process through the Flask test client (or calls the
+utility directly inside a request context) against the configured
+database, and reports p50/p95/p99 latency and SQL statements per call.
+Customer IDs are drawn with a fixed seed, so runs against the same
+database are comparable across commits.
+
+Usage:
+    DATABASE_URL=sqlite:////tmp/bench.db flask db upgrade
+    DATABASE_URL=sqlite:////tmp/bench.db flask data generate --customers 100000 ...
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/suite.py --output before.json
+    ... change the code ...
+    DATABASE_URL=sqlite:////tmp/bench.db python benchmarks/suite.py --compare before.json
+
+The save_interaction case writes to the database; benchmark a copy.
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from flask import g  # noqa: E402
+from sqlalchemy import func  # noqa: E402
+
+from main import app  # noqa: E402
+from app import db  # noqa: E402
+from models import Customer, Product, Purchase, Interaction  # noqa: E402
+from utils.instrumentation import RequestTiming  # noqa: E402
+from utils.recommendation_engine import get_recommendations  # noqa: E402
+from utils.data_processor import get_customer_analytics  # noqa: E402
+from utils.response_cache import response_cache  # noqa: E402
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a non-empty list"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Benchmark:
+    def __init__(self, client, customer_ids, rng):
+        self.client = client
+        self.customer_ids = customer_ids
+        self.rng = rng
+
+    def customer(self):
+        return self.rng.choice(self.customer_ids)
+
+    def request(self, method, path, **kwargs):
+        response = self.client.open(path, method=method, **kwargs)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{method} {path} returned {response.status_code}")
+        # The instrumentation reports the statement count in Server-Timing
+        db_timing = response.headers.get("Server-Timing", "").split(",")[0]
+        return int(db_timing.split('desc="')[1].split()[0]) if 'desc="' in db_timing else 0
+
+    def call(self, function, *args):
+        with app.test_request_context():
+            g.request_timing = RequestTiming()
+            function(*args)
+            return g.request_timing.query_count
+
+    def cases(self):
+        """name -> callable running one iteration and returning its query count"""
+        return {
+            "GET /": lambda: self.request("GET", "/"),
+            "GET /customer/<id>": lambda: self.request("GET", f"/customer/{self.customer()}"),
+            "GET /analytics": lambda: self.request("GET", "/analytics"),
+            "GET /analytics (cold cache)": lambda: (response_cache.clear(), self.request("GET", "/analytics"))[1],
+            "GET /api/recommendations/<id>":
+                lambda: self.request("GET", f"/api/recommendations/{self.customer()}"),
+            "POST /api/save_interaction": lambda: self.request("POST", "/api/save_interaction", json={
+                "customer_id": self.customer(),
+                "interaction_type": "call",
+                "notes": "Benchmark interaction",
+                "recommendations": ""
+            }),
+            "get_recommendations": lambda: self.call(get_recommendations, self.customer()),
+            "get_customer_analytics": lambda: self.call(get_customer_analytics),
+        }
+
+
+def run_case(run_once, iterations, warmup):
+    for _ in range(warmup):
+        run_once()
+    latencies = []
+    queries = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        queries.append(run_once())
+        latencies.append((time.perf_counter() - started) * 1000)
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(latencies, 0.50),
+        "p95_ms": percentile(latencies, 0.95),
+        "p99_ms": percentile(latencies, 0.99),
+        "mean_ms": statistics.fmean(latencies),
+        "queries_per_call": statistics.fmean(queries),
+    }
+
+
+def compare(results, baseline):
+    print(f"\n{'case':<32} {'p50 before':>11} {'p50 after':>10} {'change':>8} {'queries':>12}", file=sys.stderr)
+    for name, result in results["cases"].items():
+        before = baseline.get("cases", {}).get(name)
+        if before is None:
+            continue
+        change = (result["p50_ms"] - before["p50_ms"]) / before["p50_ms"] * 100 if before["p50_ms"] else 0.0
+        print(f"{name:<32} {before['p50_ms']:>11.2f} {result['p50_ms']:>10.2f} {change:>+7.1f}% "
+              f"{before['queries_per_call']:>5.1f} -> {result['queries_per_call']:<5.1f}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--iterations", type=int, default=200, help="Timed calls per case")
+    parser.add_argument("--warmup", type=int, default=10, help="Untimed calls per case")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the customer IDs")
+    parser.add_argument("--case", action="append", help="Only run cases whose name contains this")
+    parser.add_argument("--output", help="Write the JSON results to this file (default: stdout)")
+    parser.add_argument("--compare", help="Print p50 changes against an earlier JSON result")
+    args = parser.parse_args()
+
+    with app.app_context():
+        customer_ids = [row[0] for row in db.session.query(Customer.id).order_by(Customer.id)]
+        counts = {
+            model.__table__.name: db.session.query(func.count(model.id)).scalar()
+            for model in (Customer, Product, Purchase, Interaction)
+        }
+    if not customer_ids:
+        sys.exit("The database has no customers; run flask data generate first")
+
+    bench = Benchmark(app.test_client(), customer_ids, random.Random(args.seed))
+    results = {
+        "revision": git_revision(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "database_url": app.config["SQLALCHEMY_DATABASE_URI"],
+        "dataset": counts,
+        "cases": {},
+    }
+    for name, run_once in bench.cases().items():
+        if args.case and not any(part in name for part in args.case):
+            continue
+        results["cases"][name] = result = run_case(run_once, args.iterations, args.warmup)
+        print(f"{name:<32} p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  "
+              f"p99 {result['p99_ms']:8.2f} ms  {result['queries_per_call']:5.1f} queries",
+              file=sys.stderr)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as handle:
+            handle.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as handle:
+            compare(results, json.load(handle))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,263 @@
+import time
+
+import click
+from flask.cli import AppGroup
+
+from app import app
+
+
+recommendations_cli = AppGroup('recommendations', help='Offline recommendation jobs.')
+
+
+@recommendations_cli.command('score')
+@click.option('--chunk-size', default=2000, show_default=True,
+              help='Customers scored per batched pass.')
+def score_recommendations(chunk_size):
+    """Score every customer in one batched pass and store the results."""
+    # NumPy is only needed by the offline job, keep it out of web workers
+    from utils.batch_scorer import run_batch_scoring
+
+    started = time.perf_counter()
+
+    def report(done):
+        click.echo(f'  scored {done} customers')
+
+    run = run_batch_scoring(chunk_size=chunk_size, progress=report)
+    elapsed = time.perf_counter() - started
+    click.echo(f'Run {run.id}: scored {run.customer_count} customers in {elapsed:.1f}s')
+
+
+@recommendations_cli.command('rebuild')
+@click.option('--workers', type=int, help='Worker processes (default: one per CPU).')
+@click.option('--chunk-size', default=2000, show_default=True,
+              help='Customers scored and committed per chunk.')
+@click.option('--shards', type=int, help='Customer id ranges for a new run (default: 4 per worker).')
+@click.option('--restart', is_flag=True, help='Start over instead of resuming an interrupted run.')
+def rebuild_recommendations(workers, chunk_size, shards, restart):
+    """Score every customer on a process pool, resuming an interrupted run."""
+    from utils.recommendation_rebuild import rebuild_recommendations as run_rebuild
+
+    announced = []
+
+    def report(status):
+        if not announced:
+            announced.append(True)
+            if status.resumed:
+                click.echo(f'Resuming run {status.run_id}: {status.done} of {status.total} '
+                           f'customers already scored')
+        click.echo(f'  {status.done}/{status.total} customers '
+                   f'({status.customers_per_second:,.0f} customers/s)')
+
+    started = time.perf_counter()
+    run = run_rebuild(workers=workers, chunk_size=chunk_size, shards=shards, restart=restart, progress=report)
+    click.echo(f'Run {run.id}: scored {run.customer_count} customers in {time.perf_counter() - started:.1f}s')
+
+
+@recommendations_cli.command('rebuild-copurchases')
+def rebuild_copurchase_counts():
+    """Recompute the co-purchase counts from the purchase history."""
+    from utils.copurchase import rebuild_copurchases
+
+    started = time.perf_counter()
+    rebuild_copurchases()
+    click.echo(f'Rebuilt co-purchase counts in {time.perf_counter() - started:.1f}s')
+
+
+analytics_cli = AppGroup('analytics', help='Analytics maintenance.')
+
+
+@analytics_cli.command('rebuild-rollups')
+def rebuild_analytics_rollups():
+    """Recompute the analytics rollup tables from the base tables."""
+    from utils.analytics_rollups import rebuild_rollups
+
+    started = time.perf_counter()
+    rebuild_rollups()
+    click.echo(f'Rebuilt analytics rollups in {time.perf_counter() - started:.1f}s')
+
+
+@analytics_cli.command('rebuild-timeseries')
+def rebuild_analytics_timeseries():
+    """Recompute the hourly and daily activity buckets from the base tables."""
+    from utils.timeseries import rebuild_timeseries
+
+    started = time.perf_counter()
+    rebuild_timeseries()
+    click.echo(f'Rebuilt time series buckets in {time.perf_counter() - started:.1f}s')
+
+
+@analytics_cli.command('rebuild-sketches')
+def rebuild_analytics_sketches():
+    """Recompute the segment analytics sketches from the base tables."""
+    from utils.segment_sketches import rebuild_segment_sketches
+
+    started = time.perf_counter()
+    rebuild_segment_sketches()
+    click.echo(f'Rebuilt segment sketches in {time.perf_counter() - started:.1f}s')
+
+
+db_cli = AppGroup('db', help='Database schema management.')
+
+
+@db_cli.command('upgrade')
+def upgrade_database():
+    """Create missing tables, indexes and analytics rollups."""
+    from utils.schema import upgrade_schema
+
+    upgrade_schema()
+    click.echo('Database schema is up to date')
+
+
+@db_cli.command('seed')
+def seed_database():
+    """Add the demo catalog, agent and customers to an empty database."""
+    from utils.sample_data import seed_sample_data
+
+    if seed_sample_data():
+        click.echo('Added sample data')
+    else:
+        click.echo('Database already has products, nothing to seed')
+
+
+@db_cli.command('check-plans')
+def check_query_plans():
+    """Fail if a hot query is planned as a full table scan (SQLite only)."""
+    from utils.schema import check_query_plans as find_bad_plans
+
+    problems = find_bad_plans()
+    for name, details in problems:
+        click.echo(f'{name}:', err=True)
+        for detail in details:
+            click.echo(f'    {detail}', err=True)
+    if problems:
+        raise click.ClickException(f'{len(problems)} hot queries are not using an index')
+    click.echo('All hot queries use an index')
+
+
+import_cli = AppGroup('import', help='Bulk import data from CSV or JSON Lines files.')
+
+
+def _import_command(kind, help_text):
+    @import_cli.command(kind, help=help_text)
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+                  help='Input format (default: guessed from the file extension).')
+    @click.option('--chunk-size', default=5000, show_default=True,
+                  help='Records per bulk INSERT and commit.')
+    def command(path, file_format, chunk_size):
+        from utils.bulk_import import iter_records, import_records
+
+        def report(stats):
+            click.echo(f'  {stats.imported} imported, {stats.skipped} skipped '
+                       f'({stats.rows_per_second:,.0f} rows/s)')
+
+        stats = import_records(kind, iter_records(path, file_format), chunk_size, progress=report)
+        for error in stats.errors:
+            click.echo(f'  skipped {error}', err=True)
+        click.echo(f'Imported {stats.imported} {kind} in {stats.elapsed:.1f}s '
+                   f'({stats.rows_per_second:,.0f} rows/s), skipped {stats.skipped}')
+    return command
+
+
+_import_command('customers', 'Import customers (first_name, last_name, email, phone, agent_id).')
+_import_command('products', 'Import products (name, description, category, price).')
+_import_command('purchases', 'Import purchases (customer_email or customer_id, '
+                             'product_name or product_id, amount, purchase_date).')
+_import_command('interactions', 'Import interactions (customer_email or customer_id, agent_id, '
+                                'interaction_type, notes, recommendations, created_at).')
+
+
+export_cli = AppGroup('export', help='Stream data out as NDJSON or CSV.')
+
+
+def _export_command(kind, help_text):
+    @export_cli.command(kind, help=help_text)
+    @click.option('--format', 'file_format', type=click.Choice(['ndjson', 'csv']),
+                  default='ndjson', show_default=True, help='Output format.')
+    @click.option('--customer-id', type=int, help='Only export this customer.')
+    @click.option('--from', 'start', help='Only records on or after this ISO date/datetime.')
+    @click.option('--to', 'end', help='Only records before this ISO date/datetime.')
+    @click.option('--output', '-o', type=click.File('w', encoding='utf-8', lazy=True), default='-',
+                  help='Output file (default: stdout).')
+    def command(file_format, customer_id, start, end, output):
+        from utils.data_export import export_lines, parse_export_date
+
+        try:
+            start, end = parse_export_date(start), parse_export_date(end)
+        except ValueError as e:
+            raise click.BadParameter(str(e))
+        for chunk in export_lines(kind, file_format, customer_id=customer_id, start=start, end=end):
+            output.write(chunk)
+    return command
+
+
+_export_command('purchases', 'Export purchases with product and customer details.')
+_export_command('interactions', 'Export customer interactions.')
+
+
+data_cli = AppGroup('data', help='Synthetic datasets for development and benchmarks.')
+
+
+@data_cli.command('generate')
+@click.option('--customers', default=10000, show_default=True)
+@click.option('--products', default=200, show_default=True)
+@click.option('--purchases', default=200000, show_default=True)
+@click.option('--interactions', default=100000, show_default=True)
+@click.option('--agents', default=20, show_default=True)
+@click.option('--promotions', default=20, show_default=True)
+@click.option('--seed', default=42, show_default=True, help='Random seed; same seed, same data.')
+@click.option('--end-date', type=click.DateTime(formats=['%Y-%m-%d']),
+              help='Latest generated timestamp (default: today).')
+@click.option('--chunk-size', default=10000, show_default=True, help='Rows per INSERT and commit.')
+def generate_data(customers, products, purchases, interactions, agents, promotions,
+                  seed, end_date, chunk_size):
+    """Add a reproducible synthetic dataset, e.g. --customers 100000 --products 1000
+    --purchases 10000000 --interactions 5000000 for a production-sized database."""
+    from utils.synthetic_data import GenerationSettings, generate_dataset
+
+    settings = GenerationSettings(customers=customers, products=products, purchases=purchases,
+                                  interactions=interactions, agents=agents, promotions=promotions)
+    started = time.perf_counter()
+    last_report = {}
+
+    def report(table, done):
+        # Report roughly every 100k rows per table
+        if done // 100000 != last_report.get(table, -1):
+            last_report[table] = done // 100000
+            click.echo(f'  {table}: {done} rows')
+
+    counts = generate_dataset(settings, seed=seed, end=end_date, chunk_size=chunk_size, progress=report)
+    summary = ', '.join(f'{count} {table}' for table, count in counts.items())
+    click.echo(f'Generated {summary} in {time.perf_counter() - started:.1f}s')
+
+
+assets_cli = AppGroup('assets', help='Static asset pipeline.')
+
+
+@assets_cli.command('build')
+@click.option('--strict', is_flag=True, help='Fail instead of warning when a minifier or brotli is missing.')
+def build_static_assets(strict):
+    """Minify, fingerprint and precompress CSS and JavaScript into static/dist."""
+    from utils.assets import build_assets, missing_build_tools
+
+    missing = missing_build_tools()
+    for package, purpose in missing:
+        click.echo(f'Warning: {package} is not installed, skipping {purpose}', err=True)
+    if missing:
+        if strict:
+            raise click.ClickException('Optional asset packages are missing; install them with pip install .[assets]')
+        click.echo('Install them with pip install .[assets]', err=True)
+
+    manifest = build_assets(app.static_folder)
+    for source, built in sorted(manifest.items()):
+        click.echo(f'  {source} -> dist/{built}')
+    click.echo(f'Built {len(manifest)} assets')
+
+
+app.cli.add_command(recommendations_cli)
+app.cli.add_command(analytics_cli)
+app.cli.add_command(db_cli)
+app.cli.add_command(import_cli)
+app.cli.add_command(export_cli)
+app.cli.add_command(data_cli)
+app.cli.add_command(assets_cli)
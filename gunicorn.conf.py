@@ -0,0 +1,16 @@
+"""
+Gunicorn settings, read from the working directory by `gunicorn main:app`.
+
+Workers are threaded (gthread): a live analytics stream holds one thread
+for up to ANALYTICS_STREAM_MAX_SECONDS instead of a whole worker process.
+Keep ANALYTICS_STREAM_MAX_SUBSCRIBERS below GUNICORN_THREADS so regular
+requests always find a free thread.
+"""
+import multiprocessing
+import os
+
+wsgi_app = "main:app"
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+worker_class = "gthread"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 32))
@@ -1,4 +1,12 @@
 from app import app  # noqa: F401
 
 if __name__ == "__main__":
+    # The development server prepares its own database; deployments run
+    # `flask db upgrade` (and `flask db seed` for demo data) before starting
+    from utils.schema import upgrade_schema
+    from utils.sample_data import seed_sample_data
+
+    with app.app_context():
+        upgrade_schema()
+        seed_sample_data()
     app.run(host="0.0.0.0", port=5000, debug=True)
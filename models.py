@@ -1,6 +1,7 @@
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
+from sqlalchemy import func
 
 
 class User(UserMixin, db.Model):
@@ -27,9 +28,11 @@ class Customer(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     agent_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     
-    interactions = db.relationship('Interaction', backref='customer', lazy='dynamic')
-    preferences = db.relationship('CustomerPreference', backref='customer', lazy='dynamic')
-    purchases = db.relationship('Purchase', backref='customer', lazy='dynamic')
+    # Plain list relationships so the profile page can eager-load them
+    interactions = db.relationship('Interaction', backref='customer',
+                                   order_by='Interaction.created_at.desc()')
+    preferences = db.relationship('CustomerPreference', backref='customer')
+    purchases = db.relationship('Purchase', backref='customer')
     
     def __repr__(self):
         return f'<Customer {self.first_name} {self.last_name}>'
@@ -39,11 +42,17 @@ class Customer(db.Model):
         return f"{self.first_name} {self.last_name}"
 
 
+# Case-insensitive prefix search on the dashboard customer list
+db.Index('ix_customer_first_name_lower', func.lower(Customer.first_name))
+db.Index('ix_customer_last_name_lower', func.lower(Customer.last_name))
+db.Index('ix_customer_email_lower', func.lower(Customer.email))
+
+
 class Product(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)
     description = db.Column(db.Text)
-    category = db.Column(db.String(64))
+    category = db.Column(db.String(64), index=True)
     price = db.Column(db.Float, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
@@ -54,6 +63,10 @@ class Product(db.Model):
 
 
 class CustomerPreference(db.Model):
+    __table_args__ = (
+        db.Index('ix_customer_preference_customer_category', 'customer_id', 'category'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     category = db.Column(db.String(64), nullable=False)
@@ -65,6 +78,10 @@ class CustomerPreference(db.Model):
 
 
 class Interaction(db.Model):
+    __table_args__ = (
+        db.Index('ix_interaction_customer_created', 'customer_id', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     agent_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -79,7 +96,23 @@ class Interaction(db.Model):
         return f'<Interaction {self.id} {self.interaction_type}>'
 
 
+class InteractionToken(db.Model):
+    # Client idempotency key of an interaction saved through the API; a
+    # retried write with the same key returns the original interaction
+    # instead of inserting a duplicate (see utils/interaction_writer.py)
+    token = db.Column(db.String(64), primary_key=True)
+    interaction_id = db.Column(db.Integer, db.ForeignKey('interaction.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<InteractionToken {self.token} {self.interaction_id}>'
+
+
 class Purchase(db.Model):
+    __table_args__ = (
+        db.Index('ix_purchase_customer_date', 'customer_id', 'purchase_date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False)
     product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
@@ -91,6 +124,10 @@ class Purchase(db.Model):
 
 
 class Promotion(db.Model):
+    __table_args__ = (
+        db.Index('ix_promotion_window', 'start_date', 'end_date'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(128), nullable=False)
     description = db.Column(db.Text)
@@ -101,3 +138,164 @@ class Promotion(db.Model):
     
     def __repr__(self):
         return f'<Promotion {self.name}>'
+
+
+class RecommendationRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    completed_at = db.Column(db.DateTime)
+    max_customer_id = db.Column(db.Integer)  # customers up to this id were scored
+    customer_count = db.Column(db.Integer, default=0)
+    
+    def __repr__(self):
+        return f'<RecommendationRun {self.id}>'
+
+
+class CustomerRecommendation(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('recommendation_run.id'), nullable=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('customer.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), nullable=False)
+    rank = db.Column(db.Integer, nullable=False)  # 1 = best
+    score = db.Column(db.Integer, nullable=False)
+    
+    def __repr__(self):
+        return f'<CustomerRecommendation {self.customer_id} {self.rank} {self.product_id}>'
+
+
+class CustomerRecommendationState(db.Model):
+    # What a customer's stored recommendations were scored against; they are
+    # only served while the customer's data version and the set of active
+    # promotions are still the same (an empty list is stored as a state
+    # without CustomerRecommendation rows)
+    customer_id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.Integer, db.ForeignKey('recommendation_run.id'), nullable=False)
+    data_version = db.Column(db.Integer, nullable=False, default=0)
+    promotion_key = db.Column(db.String(16), nullable=False)
+    
+    def __repr__(self):
+        return f'<CustomerRecommendationState {self.customer_id} {self.run_id}>'
+
+
+# Analytics rollups, maintained in the same transaction as the rows they
+# summarize (see utils/analytics_rollups.py). NULL dimension values are
+# stored as an empty string because they are part of the primary key.
+
+class AnalyticsCounter(db.Model):
+    name = db.Column(db.String(64), primary_key=True)  # customers, purchases, interactions, ...
+    value = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<AnalyticsCounter {self.name} {self.value}>'
+
+
+class CategoryPurchaseRollup(db.Model):
+    category = db.Column(db.String(64), primary_key=True)
+    purchase_count = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CategoryPurchaseRollup {self.category} {self.purchase_count}>'
+
+
+class ProductPurchaseRollup(db.Model):
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    purchase_count = db.Column(db.BigInteger, nullable=False, default=0, index=True)
+    
+    def __repr__(self):
+        return f'<ProductPurchaseRollup {self.product_id} {self.purchase_count}>'
+
+
+class InteractionTypeRollup(db.Model):
+    interaction_type = db.Column(db.String(64), primary_key=True)
+    interaction_count = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<InteractionTypeRollup {self.interaction_type} {self.interaction_count}>'
+
+
+class PreferenceRollup(db.Model):
+    category = db.Column(db.String(64), primary_key=True)
+    level_sum = db.Column(db.BigInteger, nullable=False, default=0)
+    level_count = db.Column(db.BigInteger, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<PreferenceRollup {self.category} {self.level_sum}/{self.level_count}>'
+
+
+class ProductCoPurchase(db.Model):
+    # One of a product's COPURCHASE_STORED_NEIGHBORS strongest neighbours and
+    # the number of customers who bought both, maintained incrementally and
+    # recomputed exactly by a rebuild (see utils/copurchase.py)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    other_product_id = db.Column(db.Integer, db.ForeignKey('product.id'), primary_key=True)
+    customer_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    __table_args__ = (
+        # Strongest neighbours of a product
+        db.Index('ix_product_co_purchase_neighbors', 'product_id', 'customer_count'),
+    )
+    
+    def __repr__(self):
+        return f'<ProductCoPurchase {self.product_id} {self.other_product_id} {self.customer_count}>'
+
+
+class CustomerDataVersion(db.Model):
+    # Bumped by every change to a customer or to their purchases, interactions
+    # and preferences; cached page fragments are keyed on it
+    customer_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<CustomerDataVersion {self.customer_id} {self.version}>'
+
+
+class ActivityBucket(db.Model):
+    # Purchases and interactions pre-aggregated per hour (recent data only)
+    # and per day, with a HyperLogLog of the customers involved (see
+    # utils/timeseries.py). NULL dimension values are stored as ''.
+    granularity = db.Column(db.String(8), primary_key=True)  # hour, day
+    bucket = db.Column(db.DateTime, primary_key=True)  # start of the hour or day
+    activity = db.Column(db.String(16), primary_key=True)  # purchase, interaction
+    category = db.Column(db.String(64), primary_key=True)  # product category; '' for interactions
+    interaction_type = db.Column(db.String(64), primary_key=True)  # '' for purchases
+    event_count = db.Column(db.BigInteger, nullable=False, default=0)
+    amount_sum = db.Column(db.Float, nullable=False, default=0)
+    customers = db.Column(db.LargeBinary)
+    
+    def __repr__(self):
+        return f'<ActivityBucket {self.granularity} {self.bucket} {self.activity} {self.event_count}>'
+
+
+class SegmentSketch(db.Model):
+    # Mergeable per-day sketches for segment analytics (see
+    # utils/segment_sketches.py): distinct customers per product and per
+    # agent, and purchase frequencies for the top products
+    dimension = db.Column(db.String(16), primary_key=True)  # product, agent, top_products, product_counts
+    key = db.Column(db.String(64), primary_key=True)  # product or agent id; '' for the catalog-wide sketches
+    day = db.Column(db.DateTime, primary_key=True)
+    event_count = db.Column(db.BigInteger, nullable=False, default=0)
+    sketch = db.Column(db.LargeBinary)
+    
+    __table_args__ = (
+        # Event counts per key over a window, to pick the keys worth merging
+        db.Index('ix_segment_sketch_window', 'dimension', 'day', 'key', 'event_count'),
+    )
+    
+    def __repr__(self):
+        return f'<SegmentSketch {self.dimension} {self.key} {self.day} {self.event_count}>'
+
+
+class RecommendationShard(db.Model):
+    # Checkpoint of one Customer.id range of a parallel recommendation
+    # rebuild (see utils/recommendation_rebuild.py); advanced in the same
+    # transaction as the recommendations it covers
+    run_id = db.Column(db.Integer, db.ForeignKey('recommendation_run.id'), primary_key=True)
+    shard = db.Column(db.Integer, primary_key=True)
+    first_customer_id = db.Column(db.Integer, nullable=False)
+    last_customer_id = db.Column(db.Integer, nullable=False)
+    scored_through_id = db.Column(db.Integer, nullable=False)  # customers up to this id are done
+    customer_count = db.Column(db.Integer, nullable=False, default=0)
+    completed_at = db.Column(db.DateTime)
+    
+    def __repr__(self):
+        return f'<RecommendationShard {self.run_id}:{self.shard} {self.scored_through_id}>'
@@ -1,215 +1,417 @@
-from flask import render_template, request, redirect, url_for, flash, jsonify, session
+from flask import render_template, request, redirect, url_for, flash, jsonify, session, abort, Response, stream_with_context
 from app import app, db
 from models import User, Customer, Product, Interaction, CustomerPreference, Promotion, Purchase
-from utils.recommendation_engine import get_recommendations
-from utils.data_processor import get_customer_analytics
+from utils.recommendation_engine import get_recommendations, get_recommendations_batch, get_stored_recommendations
+from utils.data_processor import get_customer_analytics, get_customer_page, get_total_customers
+from utils.catalog_index import get_catalog_index
+from utils.profile_loader import load_customer_profile
+from utils.interaction_writer import get_interaction_writer, insert_interactions, committed_interaction_id
+from utils.data_export import export_lines, parse_export_date
+from utils.interaction_search import search_interactions
+from utils.response_cache import cached_response, customer_tag, ANALYTICS_TAG, RECOMMENDATIONS_TAG
+from utils.instrumentation import timed
+from utils.fragment_cache import fragment_digest
+from utils.data_versions import customer_version, analytics_version
+from utils.analytics_stream import get_analytics_broadcaster, stream_events
+from utils.timeseries import get_timeseries
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 import datetime
 import json
+import uuid
 
-# Sample data for initial views
-# These would normally come from a database, but added here for demonstration
-sample_products = [
-    {"id": 1, "name": "Premium Account", "category": "Service", "price": 99.99, "description": "Top tier service with 24/7 support."},
-    {"id": 2, "name": "Basic Plan", "category": "Service", "price": 49.99, "description": "Entry level service with basic features."},
-    {"id": 3, "name": "Security Package", "category": "Software", "price": 149.99, "description": "Advanced security features for your account."},
-    {"id": 4, "name": "Mobile Add-on", "category": "Add-on", "price": 9.99, "description": "Mobile access to all services."},
-    {"id": 5, "name": "Business Analytics", "category": "Service", "price": 199.99, "description": "Detailed analytics for your business."},
-]
-
-sample_promotions = [
-    {"id": 1, "name": "Summer Discount", "discount_percentage": 20, "product_category": "Service", 
-     "description": "20% off all services for summer!", "start_date": "2023-06-01", "end_date": "2023-08-31"},
-    {"id": 2, "name": "New Customer", "discount_percentage": 15, "product_category": "All", 
-     "description": "15% off first purchase for new customers", "start_date": "2023-01-01", "end_date": "2023-12-31"},
-    {"id": 3, "name": "Software Bundle", "discount_percentage": 25, "product_category": "Software", 
-     "description": "25% off when buying multiple software products", "start_date": "2023-05-01", "end_date": "2023-07-31"},
-]
-
-# Initialize database with sample data
-def initialize_db():
-    # This function will be called when the app starts
-    # Check if we already have products in the database
-    if Product.query.count() == 0:
-        # Add sample products
-        for product_data in sample_products:
-            product = Product(
-                name=product_data["name"],
-                description=product_data["description"],
-                category=product_data["category"],
-                price=product_data["price"]
-            )
-            db.session.add(product)
-        
-        # Add sample promotions
-        for promo_data in sample_promotions:
-            promotion = Promotion(
-                name=promo_data["name"],
-                description=promo_data["description"],
-                discount_percentage=promo_data["discount_percentage"],
-                start_date=datetime.datetime.strptime(promo_data["start_date"], "%Y-%m-%d"),
-                end_date=datetime.datetime.strptime(promo_data["end_date"], "%Y-%m-%d"),
-                product_category=promo_data["product_category"]
-            )
-            db.session.add(promotion)
-        
-        # Create a sample agent
-        agent = User(
-            username="agent1",
-            email="agent1@example.com",
-            password_hash="$2b$12$tDCfUvdcgCwqVP7Fez2n8eI3JWtgX6F.ZRnJyQn3iKU2RGpx2wrQy"  # password is 'password'
-        )
-        db.session.add(agent)
-        
-        # Create some sample customers
-        customers = [
-            {"first_name": "John", "last_name": "Doe", "email": "john@example.com", "phone": "555-1234"},
-            {"first_name": "Jane", "last_name": "Smith", "email": "jane@example.com", "phone": "555-5678"},
-            {"first_name": "Bob", "last_name": "Johnson", "email": "bob@example.com", "phone": "555-9012"}
-        ]
-        
-        for customer_data in customers:
-            customer = Customer(
-                first_name=customer_data["first_name"],
-                last_name=customer_data["last_name"],
-                email=customer_data["email"],
-                phone=customer_data["phone"]
-            )
-            db.session.add(customer)
-        
-        db.session.commit()
-        
-        # Now add some relationships after initial commit
-        # Add agent to customers
-        agent = User.query.first()
-        for customer in Customer.query.all():
-            customer.agent_id = agent.id
-        
-        # Add some preferences
-        preferences = [
-            {"customer_id": 1, "category": "Software", "preference_level": 4},
-            {"customer_id": 1, "category": "Service", "preference_level": 3},
-            {"customer_id": 2, "category": "Add-on", "preference_level": 5},
-            {"customer_id": 3, "category": "Service", "preference_level": 4}
-        ]
-        
-        for pref_data in preferences:
-            pref = CustomerPreference(
-                customer_id=pref_data["customer_id"],
-                category=pref_data["category"],
-                preference_level=pref_data["preference_level"]
-            )
-            db.session.add(pref)
-        
-        # Add some interactions
-        interactions = [
-            {"customer_id": 1, "agent_id": 1, "interaction_type": "call", 
-             "notes": "Customer inquired about premium services", 
-             "recommendations": "Recommended Premium Account and Security Package"},
-            {"customer_id": 2, "agent_id": 1, "interaction_type": "email", 
-             "notes": "Customer had billing questions", 
-             "recommendations": "Explained billing process and recommended Mobile Add-on"},
-            {"customer_id": 3, "agent_id": 1, "interaction_type": "chat", 
-             "notes": "Customer needed technical support", 
-             "recommendations": "Resolved issue and recommended Security Package"}
-        ]
-        
-        for int_data in interactions:
-            interaction = Interaction(
-                customer_id=int_data["customer_id"],
-                agent_id=int_data["agent_id"],
-                interaction_type=int_data["interaction_type"],
-                notes=int_data["notes"],
-                recommendations=int_data["recommendations"]
-            )
-            db.session.add(interaction)
-        
-        # Add some purchases
-        purchases = [
-            {"customer_id": 1, "product_id": 1, "amount": 99.99},
-            {"customer_id": 2, "product_id": 4, "amount": 9.99},
-            {"customer_id": 3, "product_id": 2, "amount": 49.99}
-        ]
-        
-        for pur_data in purchases:
-            purchase = Purchase(
-                customer_id=pur_data["customer_id"],
-                product_id=pur_data["product_id"],
-                amount=pur_data["amount"]
-            )
-            db.session.add(purchase)
-        
-        db.session.commit()
+# Customers per page on the dashboard list
+CUSTOMER_PAGE_SIZE = 25
+MAX_CUSTOMER_PAGE_SIZE = 100
 
 @app.route('/')
 def index():
     """Home page with agent dashboard"""
-    customers = Customer.query.all()
-    products = Product.query.all()
-    promotions = Promotion.query.all()
+    search = request.args.get('q', '')
+    customers, next_cursor = get_customer_page(search=search, limit=CUSTOMER_PAGE_SIZE)
+    
+    catalog = get_catalog_index()
+    active_ids = catalog.active_promotion_ids(datetime.datetime.now())
+    promotions = [catalog.promotions[promotion_id] for promotion_id in sorted(active_ids)]
     
     return render_template('index.html', 
                           customers=customers, 
-                          products=products, 
+                          next_cursor=next_cursor,
+                          search=search,
+                          customer_count=get_total_customers(), 
+                          product_count=len(catalog.products), 
                           promotions=promotions)
 
+@app.route('/api/customers')
+def api_customers():
+    """API endpoint to page through customers, optionally filtered by a name/email prefix"""
+    after_id = request.args.get('after', type=int)
+    limit = min(request.args.get('limit', CUSTOMER_PAGE_SIZE, type=int), MAX_CUSTOMER_PAGE_SIZE)
+    customers, next_cursor = get_customer_page(
+        after_id=after_id,
+        search=request.args.get('q', ''),
+        limit=max(limit, 1)
+    )
+    
+    return jsonify({
+        "customers": [
+            {
+                "id": customer.id,
+                "full_name": customer.full_name,
+                "email": customer.email,
+                "phone": customer.phone,
+                "url": url_for('customer_profile', customer_id=customer.id)
+            }
+            for customer in customers
+        ],
+        "next_cursor": next_cursor
+    })
+
 @app.route('/customer/<int:customer_id>')
 def customer_profile(customer_id):
     """Customer profile page"""
-    customer = Customer.query.get_or_404(customer_id)
-    interactions = Interaction.query.filter_by(customer_id=customer_id).order_by(Interaction.created_at.desc()).all()
-    preferences = CustomerPreference.query.filter_by(customer_id=customer_id).all()
-    purchases = Purchase.query.filter_by(customer_id=customer_id).all()
+    # Read before the profile so cached fragments are never keyed ahead of their data
+    version = customer_version(customer_id)
+    profile = load_customer_profile(customer_id)
+    if profile is None:
+        abort(404)
     
-    # Get product recommendations for this customer
-    recommendations = get_recommendations(customer_id)
+    # Get product recommendations for this customer, precomputed when available,
+    # reusing the preferences and purchases loaded for the page
+    purchased_product_ids = profile.purchased_product_ids
+    with timed('recommendation'):
+        recommendations = get_stored_recommendations(customer_id, purchased_product_ids, version)
+        if recommendations is None:
+            recommendations = get_recommendations(
+                customer_id,
+                preferred_categories=profile.preferred_categories,
+                purchased_product_ids=purchased_product_ids
+            )
     
     return render_template('customer_profile.html', 
-                          customer=customer, 
-                          interactions=interactions,
-                          preferences=preferences,
-                          purchases=purchases,
-                          recommendations=recommendations)
+                          customer=profile.customer, 
+                          interactions=profile.interactions,
+                          preferences=profile.preferences,
+                          purchases=profile.purchases,
+                          recommendations=recommendations,
+                          customer_version=version,
+                          recommendations_version=fragment_digest(recommendations))
 
 @app.route('/analytics')
+@cached_response(key=lambda: 'page:analytics', tags=lambda: [ANALYTICS_TAG])
 def analytics():
     """Analytics dashboard page"""
-    customers = Customer.query.all()
+    # Read before the analytics so cached fragments are never keyed ahead of their data
+    version = analytics_version()
     customer_analytics = get_customer_analytics()
+    # The segment window moves every day, not only on writes
+    segments_version = fragment_digest(customer_analytics["segments"])
     
     return render_template('analytics.html', 
-                          customers=customers, 
-                          analytics=customer_analytics)
+                          analytics=customer_analytics,
+                          analytics_version=version,
+                          segments_version=segments_version)
 
 @app.route('/api/recommendations/<int:customer_id>')
+@cached_response(
+    key=lambda customer_id: f'api:recommendations:{customer_id}',
+    tags=lambda customer_id: [RECOMMENDATIONS_TAG, customer_tag(customer_id)]
+)
 def api_recommendations(customer_id):
     """API endpoint to get recommendations for a customer"""
-    recommendations = get_recommendations(customer_id)
+    with timed('recommendation'):
+        recommendations = get_recommendations(customer_id)
     return jsonify(recommendations)
 
+@app.route('/api/recommendations/batch', methods=['POST'])
+def api_recommendations_batch():
+    """API endpoint to get recommendations for many customers in one call"""
+    data = request.get_json(silent=True) or {}
+    customer_ids = data.get('customer_ids')
+    
+    if not isinstance(customer_ids, list) or \
+            not all(isinstance(cid, int) and not isinstance(cid, bool) for cid in customer_ids):
+        return jsonify({"success": False, "error": "customer_ids must be a list of integers"}), 400
+    
+    with timed('recommendation'):
+        recommendations = get_recommendations_batch(customer_ids)
+    return jsonify({str(cid): recs for cid, recs in recommendations.items()})
+
+def _interaction_row(data):
+    """
+    Interaction column values from a client payload
+    
+    Raises:
+        KeyError, TypeError, AttributeError: If the payload is not an object
+            or a required field is missing
+        ValueError: If a field has an invalid value
+    """
+    customer_id = data['customer_id']
+    if not isinstance(customer_id, int) or isinstance(customer_id, bool):
+        raise ValueError("customer_id must be an integer")
+    agent_id = data.get('agent_id', 1)  # Default to first agent for demo
+    if agent_id is not None and (not isinstance(agent_id, int) or isinstance(agent_id, bool)):
+        raise ValueError("agent_id must be an integer")
+    interaction_type = data['interaction_type']
+    if not isinstance(interaction_type, str) or not interaction_type.strip() \
+            or len(interaction_type) > INTERACTION_TYPE_MAX_LENGTH:
+        raise ValueError(f"interaction_type must be a non-empty string of at most "
+                         f"{INTERACTION_TYPE_MAX_LENGTH} characters")
+    notes = data['notes']
+    if not isinstance(notes, str):
+        raise ValueError("notes must be a string")
+    recommendations = data['recommendations']
+    if recommendations is not None and not isinstance(recommendations, str):
+        raise ValueError("recommendations must be a string")
+    return {
+        "customer_id": customer_id,
+        "agent_id": agent_id,
+        "interaction_type": interaction_type,
+        "notes": notes,
+        "recommendations": recommendations
+    }
+
+def _client_token(value):
+    """
+    Idempotency token of an interaction write, or None
+    
+    Raises:
+        ValueError: If the token is not a short string
+    """
+    if value is None:
+        return None
+    if not isinstance(value, str) or not 0 < len(value) <= CLIENT_TOKEN_MAX_LENGTH:
+        raise ValueError(f"client_token must be a string of 1 to {CLIENT_TOKEN_MAX_LENGTH} characters")
+    return value
+
+def _unknown_agent_error(rows):
+    """Error response if a row names an agent that does not exist, else None"""
+    agent_ids = {row["agent_id"] for row in rows if row["agent_id"] is not None}
+    if not agent_ids:
+        return None
+    known = {user_id for (user_id,) in db.session.query(User.id).filter(User.id.in_(agent_ids))}
+    if agent_ids - known:
+        return jsonify({"success": False, "error": "agent_id does not match a user"}), 400
+    return None
+
+INTERACTION_TYPE_MAX_LENGTH = 64
+CLIENT_TOKEN_MAX_LENGTH = 64
+INTERACTION_FIELDS_ERROR = "Every interaction needs customer_id, interaction_type, notes and recommendations"
+
+def _interaction_save_error(e):
+    """JSON response for an interaction write the database rejected"""
+    if isinstance(e, IntegrityError):
+        return jsonify({"success": False, "error": "Interaction violates a database constraint"}), 400
+    app.logger.error("Error saving interaction: %s", e)
+    return jsonify({"success": False, "error": "Interaction could not be saved"}), 500
+
 @app.route('/api/save_interaction', methods=['POST'])
 def save_interaction():
-    """API endpoint to save a new customer interaction"""
-    data = request.json
-    
-    interaction = Interaction(
-        customer_id=data['customer_id'],
-        agent_id=data.get('agent_id', 1),  # Default to first agent for demo
-        interaction_type=data['interaction_type'],
-        notes=data['notes'],
-        recommendations=data['recommendations']
-    )
+    """
+    API endpoint to save a new customer interaction
+    
+    A client token (the Idempotency-Key header or a client_token field)
+    makes retries safe: the interaction is saved at most once per token.
+    In batch mode every write gets a token; if the group commit does not
+    happen within INTERACTION_WRITE_TIMEOUT the response is 202 with the
+    token, the write may still commit, and the client retries with the
+    same token or looks it up at /api/interactions/by-token/<token>.
+    """
+    data = request.get_json(silent=True)
+    try:
+        row = _interaction_row(data)
+        token = _client_token(request.headers.get('Idempotency-Key') or data.get('client_token'))
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except (KeyError, TypeError, AttributeError):
+        return jsonify({"success": False, "error": INTERACTION_FIELDS_ERROR}), 400
+    unknown_agent = _unknown_agent_error([row])
+    if unknown_agent:
+        return unknown_agent
+    
+    if app.config["INTERACTION_WRITE_MODE"] == "batch":
+        # Queue for the next group commit and wait until it is durable
+        token = token or uuid.uuid4().hex
+        pending = get_interaction_writer().submit(row, token)
+        try:
+            interaction_id = pending.wait(app.config["INTERACTION_WRITE_TIMEOUT"])
+        except TimeoutError:
+            return jsonify({
+                "success": True,
+                "pending": True,
+                "client_token": token,
+                "status_url": url_for('interaction_by_token', token=token)
+            }), 202
+        except Exception as e:
+            return _interaction_save_error(e)
+        return jsonify({"success": True, "interaction_id": interaction_id, "client_token": token})
+    
+    try:
+        interaction_id = insert_interactions([row], [token])[0]
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        # A concurrent retry with the same token committed first
+        interaction_id = committed_interaction_id(token) if token and isinstance(e, IntegrityError) else None
+        if interaction_id is None:
+            return _interaction_save_error(e)
+    
+    response = {"success": True, "interaction_id": interaction_id}
+    if token:
+        response["client_token"] = token
+    return jsonify(response)
+
+@app.route('/api/interactions/by-token/<token>')
+def interaction_by_token(token):
+    """API endpoint to look up the interaction saved under a client token"""
+    interaction_id = committed_interaction_id(token)
+    if interaction_id is None:
+        return jsonify({"success": False, "error": "No interaction has been saved under this token"}), 404
+    return jsonify({"success": True, "interaction_id": interaction_id, "client_token": token})
+
+@app.route('/api/interactions/batch', methods=['POST'])
+def save_interactions_batch():
+    """
+    API endpoint to save many interactions with a single commit; items
+    may carry a client_token each, as for /api/save_interaction
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('interactions') if isinstance(data, dict) else None
+    
+    if not isinstance(items, list) or not items:
+        return jsonify({"success": False, "error": "interactions must be a non-empty list"}), 400
+    if len(items) > app.config["INTERACTION_BATCH_MAX_ROWS"]:
+        return jsonify({"success": False, "error": "Too many interactions in one batch"}), 400
+    try:
+        rows = [_interaction_row(item) for item in items]
+        tokens = [_client_token(item.get('client_token')) for item in items]
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    except (KeyError, TypeError, AttributeError):
+        return jsonify({"success": False, "error": INTERACTION_FIELDS_ERROR}), 400
+    unknown_agent = _unknown_agent_error(rows)
+    if unknown_agent:
+        return unknown_agent
+    
+    try:
+        interaction_ids = insert_interactions(rows, tokens)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        return _interaction_save_error(e)
+    return jsonify({"success": True, "interaction_ids": interaction_ids})
+
+# Interactions per page of search results
+SEARCH_PAGE_SIZE = 20
+MAX_SEARCH_PAGE_SIZE = 100
+
+@app.route('/api/interactions/search')
+def api_search_interactions():
+    """API endpoint to full-text search interaction notes and recommendations"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"success": False, "error": "q is required"}), 400
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', SEARCH_PAGE_SIZE, type=int), 1), MAX_SEARCH_PAGE_SIZE)
     
-    db.session.add(interaction)
-    db.session.commit()
+    results, has_more = search_interactions(
+        query,
+        customer_id=request.args.get('customer_id', type=int),
+        agent_id=request.args.get('agent_id', type=int),
+        page=page,
+        per_page=per_page
+    )
     
-    return jsonify({"success": True, "interaction_id": interaction.id})
+    return jsonify({
+        "results": [
+            {
+                "id": interaction.id,
+                "customer_id": interaction.customer_id,
+                "agent_id": interaction.agent_id,
+                "interaction_type": interaction.interaction_type,
+                "notes": interaction.notes,
+                "recommendations": interaction.recommendations,
+                "created_at": interaction.created_at.isoformat() if interaction.created_at else None,
+                "score": score
+            }
+            for interaction, score in results
+        ],
+        "page": page,
+        "has_more": has_more
+    })
 
 @app.route('/api/analytics')
+@cached_response(key=lambda: 'api:analytics', tags=lambda: [ANALYTICS_TAG])
 def api_analytics():
     """API endpoint to get analytics data"""
     analytics = get_customer_analytics()
     return jsonify(analytics)
 
+@app.route('/api/analytics/timeseries')
+def api_analytics_timeseries():
+    """Purchase and interaction series per hour, day, week or month from pre-aggregated buckets"""
+    granularity = request.args.get('granularity', 'day')
+    try:
+        end = parse_export_date(request.args.get('to')) or datetime.datetime.utcnow()
+        default_span = datetime.timedelta(days=2 if granularity == 'hour' else 30)
+        start = parse_export_date(request.args.get('from')) or end - default_span
+        series = get_timeseries(start, end, granularity)
+    except ValueError as e:
+        return jsonify({"success": False, "error": str(e)}), 400
+    return jsonify({
+        "granularity": granularity,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "series": series
+    })
+
+@app.route('/api/analytics/stream')
+def api_analytics_stream():
+    """Server-Sent Events: the analytics on connect, then the sections that change"""
+    broadcaster = get_analytics_broadcaster()
+    subscription = broadcaster.subscribe()
+    if subscription is None:
+        # Keep threads free for regular requests; the dashboard retries later
+        response = jsonify({"success": False, "error": "too many live analytics streams"})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(app.config["ANALYTICS_STREAM_RETRY_SECONDS"])
+        return response
+    events = stream_events(
+        broadcaster,
+        subscription,
+        heartbeat_seconds=app.config["ANALYTICS_STREAM_HEARTBEAT_SECONDS"],
+        max_seconds=app.config["ANALYTICS_STREAM_MAX_SECONDS"]
+    )
+    response = Response(events, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Tell nginx not to buffer the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+@app.route('/api/export/<any(purchases, interactions):name>')
+def api_export(name):
+    """Stream purchases or interactions as NDJSON or CSV, optionally filtered by customer and date"""
+    file_format = request.args.get('format', 'ndjson')
+    if file_format not in EXPORT_MIMETYPES:
+        return jsonify({"success": False, "error": "format must be ndjson or csv"}), 400
+    try:
+        start = parse_export_date(request.args.get('from'))
+        end = parse_export_date(request.args.get('to'))
+    except ValueError:
+        return jsonify({"success": False, "error": "from and to must be ISO dates"}), 400
+    
+    lines = export_lines(
+        name,
+        file_format,
+        customer_id=request.args.get('customer_id', type=int),
+        start=start,
+        end=end
+    )
+    # The request context (and with it the database session) stays open
+    # while the generator is consumed by the server
+    response = Response(stream_with_context(lines), mimetype=EXPORT_MIMETYPES[file_format])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{file_format}'
+    return response
+
 @app.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
@@ -541,8 +541,103 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
     
+    // Chart canvas -> [analytics section, label field, value field, chart initializer]
+    const chartSections = {
+        categoriesChart: ['popular_categories', 'category', 'count', initCategoriesChart],
+        preferencesChart: ['preference_data', 'category', 'average', initPreferencesChart],
+        interactionTypesChart: ['interaction_types', 'type', 'count', initInteractionTypesChart],
+        bestSellersChart: ['best_sellers', 'name', 'count', initBestSellersChart]
+    };
+    
+    // Segment list -> [segments section, label field, value field]
+    const segmentLists = {
+        topProductsList: ['top_products', 'name', 'count'],
+        categoryReachList: ['category_customers', 'category', 'customers'],
+        productReachList: ['product_customers', 'name', 'customers'],
+        agentReachList: ['agent_customers', 'name', 'customers']
+    };
+    
+    /**
+     * Render the sketch-based segment lists
+     * @param {Object} segments - The segments section of the analytics
+     */
+    function applySegments(segments) {
+        const windowDays = document.getElementById('segmentWindowDays');
+        if (windowDays) {
+            windowDays.textContent = segments.window_days;
+        }
+        
+        Object.entries(segmentLists).forEach(([elementId, [section, labelField, valueField]]) => {
+            const list = document.getElementById(elementId);
+            if (!list) return;
+            
+            list.replaceChildren(...(segments[section] || []).map(item => {
+                const entry = document.createElement('li');
+                entry.className = 'list-group-item d-flex justify-content-between';
+                const label = document.createElement('span');
+                label.textContent = item[labelField] || 'Unknown';
+                const value = document.createElement('span');
+                value.className = 'badge bg-primary';
+                value.textContent = item[valueField];
+                entry.append(label, value);
+                return entry;
+            }));
+        });
+    }
+    
+    // Latest analytics known to this page, kept up to date by the live stream
+    let currentAnalytics = {};
+    
+    /**
+     * Apply analytics data to the summary cards and charts
+     * @param {Object} data - Full analytics payload, or only the sections that changed
+     */
+    function applyAnalytics(data) {
+        currentAnalytics = { ...currentAnalytics, ...data };
+        
+        const totals = {
+            totalCustomers: 'total_customers',
+            totalProductsSold: 'total_products_sold',
+            totalInteractions: 'total_interactions'
+        };
+        Object.entries(totals).forEach(([elementId, key]) => {
+            const element = document.getElementById(elementId);
+            if (element && key in data) {
+                element.textContent = data[key];
+            }
+        });
+        
+        const conversionRate = document.getElementById('conversionRate');
+        if (conversionRate && ('total_products_sold' in data || 'total_interactions' in data)) {
+            const interactions = currentAnalytics.total_interactions || 0;
+            conversionRate.textContent = interactions > 0
+                ? `${(currentAnalytics.total_products_sold / interactions * 100).toFixed(1)}%`
+                : '0%';
+        }
+        
+        if ('segments' in data) {
+            applySegments(data.segments);
+        }
+        
+        Object.entries(chartSections).forEach(([elementId, [section, labelField, valueField, init]]) => {
+            const canvas = document.getElementById(elementId);
+            if (!canvas || !(section in data)) return;
+            
+            const labels = data[section].map(item => item[labelField]);
+            const values = data[section].map(item => item[valueField]);
+            const chart = Chart.getChart(canvas);
+            if (chart) {
+                chart.data.labels = labels;
+                chart.data.datasets[0].data = values;
+                chart.update();
+            } else {
+                init(elementId, labels, values);
+            }
+        });
+    }
+    
     /**
-     * Initialize all analytics charts
+     * Initialize all analytics charts, or refresh them if they already exist
      */
     async function initializeCharts() {
         // Try to get data from the API
@@ -564,39 +659,44 @@ document.addEventListener('DOMContentLoaded', function() {
         
         if (!analyticsData) return;
         
-        // Extract data for charts from the API response
-        
-        // Categories Chart
-        if (document.getElementById('categoriesChart')) {
-            const categories = analyticsData.popular_categories.map(item => item.category);
-            const categoryCounts = analyticsData.popular_categories.map(item => item.count);
-            initCategoriesChart('categoriesChart', categories, categoryCounts);
-        }
-        
-        // Preferences Chart
-        if (document.getElementById('preferencesChart')) {
-            const prefCategories = analyticsData.preference_data.map(item => item.category);
-            const prefAverages = analyticsData.preference_data.map(item => item.average);
-            initPreferencesChart('preferencesChart', prefCategories, prefAverages);
-        }
-        
-        // Interaction Types Chart
-        if (document.getElementById('interactionTypesChart')) {
-            const interactionTypes = analyticsData.interaction_types.map(item => item.type);
-            const interactionCounts = analyticsData.interaction_types.map(item => item.count);
-            initInteractionTypesChart('interactionTypesChart', interactionTypes, interactionCounts);
-        }
-        
-        // Best Sellers Chart
-        if (document.getElementById('bestSellersChart')) {
-            const productNames = analyticsData.best_sellers.map(item => item.name);
-            const productCounts = analyticsData.best_sellers.map(item => item.count);
-            initBestSellersChart('bestSellersChart', productNames, productCounts);
-        }
+        applyAnalytics(analyticsData);
+    }
+    
+    // Milliseconds to wait before trying the stream again after the server
+    // turned it away (it serves a limited number of streams per process)
+    const STREAM_RETRY_MS = 60000;
+    
+    /**
+     * Keep the dashboard current from the server's live analytics stream.
+     * The server sends the full analytics on connect and then only the
+     * sections that changed; the browser reconnects on its own. When the
+     * server refuses the stream, the analytics are loaded once and the
+     * stream is tried again after STREAM_RETRY_MS.
+     * @returns {EventSource|null} The open stream, or null if unsupported
+     */
+    function subscribeToAnalytics() {
+        if (!window.EventSource) return null;
+        
+        const stream = new EventSource('/api/analytics/stream');
+        stream.addEventListener('snapshot', event => applyAnalytics(JSON.parse(event.data)));
+        stream.addEventListener('delta', event => applyAnalytics(JSON.parse(event.data)));
+        stream.onerror = () => {
+            if (stream.readyState !== EventSource.CLOSED) {
+                console.warn('Analytics stream interrupted, reconnecting');
+                return;
+            }
+            console.warn('Analytics stream unavailable, retrying later');
+            initializeCharts();
+            setTimeout(subscribeToAnalytics, STREAM_RETRY_MS);
+        };
+        return stream;
     }
     
-    // Initialize charts when the page loads
-    initializeCharts();
+    // Charts rendered with the page are updated live; without EventSource
+    // support, load them from the API once
+    if (!subscribeToAnalytics()) {
+        initializeCharts();
+    }
     
     // Set up refresh button
     const refreshDataBtn = document.getElementById('refreshDataBtn');
@@ -679,6 +779,8 @@ document.addEventListener('DOMContentLoaded', function() {
         createEngagementHeatmap,
         createCustomerJourney,
         fetchAnalyticsData,
+        applyAnalytics,
+        subscribeToAnalytics,
         formatPercentage,
         showNotification
     };
@@ -0,0 +1,29 @@
+import os
+import tempfile
+
+import pytest
+
+# The app reads its configuration on import, so point it at a scratch
+# database before anything imports app
+_database_dir = tempfile.mkdtemp(prefix="customer-service-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_database_dir, "test.db")
+os.environ.pop("READ_DATABASE_URL", None)
+
+# models and utils import from app, so it has to be loaded first
+import app as _app_module  # noqa: E402,F401
+
+
+@pytest.fixture(scope="session")
+def app():
+    from app import app
+    import routes  # noqa: F401  registers the routes and data hooks
+    from utils.schema import upgrade_schema
+
+    with app.app_context():
+        upgrade_schema()
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
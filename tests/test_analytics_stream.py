@@ -0,0 +1,43 @@
+from utils import analytics_stream
+from utils.analytics_stream import AnalyticsBroadcaster
+
+
+def test_stream_is_refused_beyond_max_subscribers(app, client, monkeypatch):
+    broadcaster = AnalyticsBroadcaster(app, poll_seconds=3600, max_subscribers=1)
+    monkeypatch.setattr(analytics_stream, "_broadcaster", broadcaster)
+
+    assert broadcaster.subscribe() is not None
+
+    response = client.get("/api/analytics/stream")
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == str(app.config["ANALYTICS_STREAM_RETRY_SECONDS"])
+
+
+def test_segments_are_only_reread_after_new_activity(app, monkeypatch):
+    from app import db
+    from models import Customer, CustomerPreference, Interaction
+
+    reads = []
+    read_segments = analytics_stream.get_analytics_segments
+    monkeypatch.setattr(analytics_stream, "get_analytics_segments", lambda: reads.append(1) or read_segments())
+    broadcaster = AnalyticsBroadcaster(app, poll_seconds=3600)
+    broadcaster.subscribe()
+    assert len(reads) == 1
+
+    with app.app_context():
+        customer = Customer(first_name="Alan", last_name="Turing", email="alan@example.com")
+        db.session.add(customer)
+        db.session.flush()
+        db.session.add(CustomerPreference(customer_id=customer.id, category="Hardware", preference_level=2))
+        db.session.commit()
+        with broadcaster._lock:
+            delta = broadcaster._refresh()
+        assert "total_customers" in delta and "segments" not in delta
+        assert len(reads) == 1
+
+        db.session.add(Interaction(customer_id=customer.id, interaction_type="call", notes="hello"))
+        db.session.commit()
+        with broadcaster._lock:
+            delta = broadcaster._refresh()
+        assert "total_interactions" in delta
+        assert len(reads) == 2
@@ -0,0 +1,35 @@
+import shutil
+
+from utils.assets import build_assets
+
+
+def test_manifest_is_not_served_as_an_immutable_asset(app, client, tmp_path, monkeypatch):
+    static_folder = tmp_path / "static"
+    shutil.copytree(app.static_folder, static_folder, ignore=shutil.ignore_patterns("dist"))
+    monkeypatch.setattr(app, "static_folder", str(static_folder))
+    manifest = build_assets(str(static_folder))
+
+    response = client.get(f"/assets/{manifest['css/style.css']}")
+    assert response.status_code == 200
+    assert response.cache_control.immutable
+    response.close()
+
+    assert (static_folder / "dist" / "manifest.json").is_file()
+    assert client.get("/assets/manifest.json").status_code == 404
+    assert client.get("/assets/./manifest.json").status_code == 404
+    assert client.get("/assets/css/../manifest.json").status_code == 404
+
+
+def test_empty_manifest_is_not_cached(app, tmp_path, monkeypatch):
+    from utils import assets
+
+    static_folder = tmp_path / "static"
+    shutil.copytree(app.static_folder, static_folder, ignore=shutil.ignore_patterns("dist"))
+    monkeypatch.setattr(app, "static_folder", str(static_folder))
+    monkeypatch.setattr(assets, "_manifest", None)
+
+    with app.test_request_context():
+        assert assets.asset_url("css/style.css") == "/static/css/style.css"
+        # A build after the worker started is picked up without a restart
+        manifest = build_assets(str(static_folder))
+        assert assets.asset_url("css/style.css") == f"/assets/{manifest['css/style.css']}"
@@ -0,0 +1,73 @@
+from utils.bulk_import import import_records, iter_records
+
+
+def test_jsonl_import_skips_malformed_and_non_object_lines(app, tmp_path):
+    path = tmp_path / "products.jsonl"
+    path.write_text(
+        '{"name": "Import A", "category": "Service", "price": 1}\n'
+        '{bad json\n'
+        '["x"]\n'
+        '\n'
+        '{"name": "Import B", "category": "Service", "price": 2}\n'
+    )
+
+    with app.app_context():
+        stats = import_records("products", iter_records(str(path), "jsonl"), chunk_size=2)
+
+    assert stats.imported == 2
+    assert stats.skipped == 2
+    assert [error.split(":")[0] for error in stats.errors] == ["record 2", "record 3"]
+    assert "line 2: invalid JSON" in stats.errors[0]
+    assert "line 3: expected a JSON object" in stats.errors[1]
+
+
+def test_unknown_ids_are_skipped_before_the_insert(app):
+    from app import db
+    from models import Customer, Product, Purchase
+
+    with app.app_context():
+        customer = Customer(first_name="Import", last_name="Buyer", email="import.buyer@example.com")
+        product = Product(name="Import C", category="Service", price=3)
+        db.session.add_all([customer, product])
+        db.session.commit()
+        records = [
+            {"customer_id": customer.id, "product_id": product.id, "amount": 3},
+            {"customer_id": 10 ** 9, "product_id": product.id, "amount": 3},
+            {"customer_id": customer.id, "product_id": 10 ** 9, "amount": 3},
+            {"customer_email": "import.buyer@example.com", "product_name": "Import C", "amount": 3},
+        ]
+        stats = import_records("purchases", records, chunk_size=10)
+        assert stats.imported == 2
+        assert stats.errors == [f"record 2: unknown customer ID {10 ** 9}", f"record 3: unknown product ID {10 ** 9}"]
+        assert Purchase.query.filter_by(customer_id=customer.id).count() == 2
+
+        stats = import_records("customers", [
+            {"first_name": "Import", "last_name": "Agentless", "email": "import.agent@example.com", "agent_id": 10 ** 9}
+        ])
+        assert stats.imported == 0 and stats.errors == [f"record 1: unknown agent ID {10 ** 9}"]
+
+
+def test_rows_rejected_by_the_database_are_skipped_one_by_one(app, monkeypatch):
+    from utils import bulk_import
+    from models import Product
+
+    model, build_row, lookup_name, lookup_key = bulk_import.IMPORTERS["products"]
+
+    def null_name_for_bad_records(record, maps):
+        row = build_row(record, maps)
+        if record.get("bad"):
+            row["name"] = None  # violates NOT NULL only at INSERT time
+        return row
+
+    monkeypatch.setitem(bulk_import.IMPORTERS, "products", (model, null_name_for_bad_records, lookup_name, lookup_key))
+    records = [
+        {"name": "Import D", "category": "Service", "price": 4},
+        {"name": "Import E", "category": "Service", "price": 5, "bad": True},
+        {"name": "Import F", "category": "Service", "price": 6},
+    ]
+    with app.app_context():
+        stats = import_records("products", records, chunk_size=10)
+        assert stats.imported == 2
+        assert stats.skipped == 1 and stats.errors[0].startswith("record 2: rejected by the database")
+        assert {p.name for p in Product.query.filter(Product.name.in_(["Import D", "Import E", "Import F"]))} == \
+            {"Import D", "Import F"}
@@ -0,0 +1,20 @@
+from utils.copurchase import _update_neighbors
+
+
+def test_update_neighbors_keeps_capacity_and_replaces_the_weakest():
+    stored = {1: 5, 2: 3, 3: 1}
+
+    changed = _update_neighbors(stored, {2: 1, 4: 2, 5: -1}, capacity=3)
+
+    # 4 takes the weakest slot (3, count 1) and inherits its count
+    assert stored == {1: 5, 2: 4, 4: 3}
+    assert changed == {2, 3, 4}
+
+
+def test_update_neighbors_drops_neighbours_without_shared_customers():
+    stored = {1: 1, 2: 2}
+
+    changed = _update_neighbors(stored, {1: -1, 3: 1}, capacity=3)
+
+    assert stored == {2: 2, 3: 1}
+    assert changed == {1, 3}
@@ -0,0 +1,10 @@
+import datetime
+
+import pytest
+
+from utils.data_export import parse_export_date
+
+
+@pytest.mark.parametrize("value", ["2026-10-01T12:00:00Z", "2026-10-01T12:00:00+00:00", "2026-10-01T14:00:00+02:00"])
+def test_parse_export_date_converts_aware_values_to_naive_utc(value):
+    assert parse_export_date(value) == datetime.datetime(2026, 10, 1, 12, 0)
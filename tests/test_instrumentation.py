@@ -0,0 +1,38 @@
+import threading
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+
+def test_failed_statement_does_not_leave_its_start_time(app):
+    from app import db
+
+    with app.app_context():
+        connection = db.session.connection()
+        with pytest.raises(OperationalError):
+            connection.execute(text("SELECT * FROM no_such_table"))
+        assert connection.info.get("query_started") == []
+        db.session.rollback()
+
+        connection = db.session.connection()
+        connection.execute(text("SELECT 1"))
+        assert connection.info.get("query_started") == []
+
+
+def test_response_cache_counts_every_lookup_across_threads(app):
+    from utils.response_cache import ResponseCache, LRUCache
+
+    cache = ResponseCache()
+    cache._backend = LRUCache()
+
+    def look_up():
+        for _ in range(2000):
+            cache.get("missing", [])
+
+    threads = [threading.Thread(target=look_up) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert cache.stats() == (0, 16000)
@@ -0,0 +1,15 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+
+
+def test_only_a_missing_fts5_module_falls_back_to_like(app, monkeypatch):
+    from utils import interaction_search
+
+    monkeypatch.setattr(interaction_search, "_SQLITE_SETUP",
+                        ["CREATE VIRTUAL TABLE IF NOT EXISTS broken_fts USING nosuchmod(a)"])
+    with app.app_context(), pytest.raises(OperationalError, match="no such module: nosuchmod"):
+        interaction_search.ensure_search_index()
+
+    monkeypatch.setattr(interaction_search, "_missing_fts5", lambda error: True)
+    with app.app_context():
+        interaction_search.ensure_search_index()
@@ -0,0 +1,96 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def customer_and_agent(app):
+    from app import db
+    from models import Customer, User
+
+    with app.app_context():
+        customer = Customer(first_name="Ada", last_name="Lovelace", email="ada.interactions@example.com")
+        agent = User(username="interactions-agent", email="agent.interactions@example.com")
+        db.session.add_all([customer, agent])
+        db.session.commit()
+        return customer.id, agent.id
+
+
+def _payload(customer_id, agent_id, **fields):
+    payload = {"customer_id": customer_id, "agent_id": agent_id, "interaction_type": "call",
+               "notes": "Asked about renewal", "recommendations": None}
+    payload.update(fields)
+    return payload
+
+
+def test_client_token_saves_an_interaction_once(app, client, customer_and_agent):
+    from models import Interaction
+
+    customer_id, agent_id = customer_and_agent
+    payload = _payload(customer_id, agent_id, client_token="retry-me")
+    first = client.post("/api/save_interaction", json=payload).get_json()
+    second = client.post("/api/save_interaction", json=payload).get_json()
+    assert first["success"] and second["success"]
+    assert first["interaction_id"] == second["interaction_id"]
+
+    batch = client.post("/api/interactions/batch", json={"interactions": [
+        payload, _payload(customer_id, agent_id, client_token="new"), _payload(customer_id, agent_id),
+        _payload(customer_id, agent_id, client_token="new")
+    ]}).get_json()
+    ids = batch["interaction_ids"]
+    assert ids[0] == first["interaction_id"]
+    assert ids[1] == ids[3]
+    assert len({ids[0], ids[1], ids[2]}) == 3
+
+    lookup = client.get("/api/interactions/by-token/new").get_json()
+    assert lookup["interaction_id"] == ids[1]
+    assert client.get("/api/interactions/by-token/unknown").status_code == 404
+    with app.app_context():
+        assert Interaction.query.filter_by(customer_id=customer_id).count() == 3
+
+
+@pytest.mark.parametrize("fields", [
+    {"agent_id": "1"},
+    {"agent_id": 10 ** 9},
+    {"interaction_type": ""},
+    {"interaction_type": "x" * 65},
+    {"notes": ["not", "text"]},
+    {"recommendations": 5},
+    {"client_token": ""},
+])
+def test_invalid_interaction_fields_are_rejected(client, customer_and_agent, fields):
+    customer_id, agent_id = customer_and_agent
+    payload = _payload(customer_id, agent_id)
+    payload.update(fields)
+    response = client.post("/api/save_interaction", json=payload)
+    assert response.status_code == 400
+    assert response.get_json()["success"] is False
+
+
+class _StuckWriter:
+    def __init__(self, error):
+        self.error = error
+
+    def submit(self, row, token=None):
+        return self
+
+    def wait(self, timeout=None):
+        raise self.error
+
+
+def test_batch_mode_acknowledges_a_slow_commit_with_its_token(app, client, customer_and_agent, monkeypatch):
+    import routes
+
+    customer_id, agent_id = customer_and_agent
+    monkeypatch.setitem(app.config, "INTERACTION_WRITE_MODE", "batch")
+
+    monkeypatch.setattr(routes, "get_interaction_writer", lambda: _StuckWriter(TimeoutError()))
+    response = client.post("/api/save_interaction", json=_payload(customer_id, agent_id),
+                           headers={"Idempotency-Key": "slow-commit"})
+    assert response.status_code == 202
+    body = response.get_json()
+    assert body["pending"] and body["client_token"] == "slow-commit"
+    assert body["status_url"] == "/api/interactions/by-token/slow-commit"
+
+    monkeypatch.setattr(routes, "get_interaction_writer", lambda: _StuckWriter(RuntimeError("writer died")))
+    response = client.post("/api/save_interaction", json=_payload(customer_id, agent_id))
+    assert response.status_code == 500
+    assert response.get_json()["success"] is False
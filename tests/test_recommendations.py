@@ -0,0 +1,40 @@
+import datetime
+
+
+def test_stored_recommendations_follow_data_version_and_promotions(app):
+    from app import db
+    from models import Customer, CustomerPreference, Product, Promotion
+    from utils.batch_scorer import run_batch_scoring
+    from utils.data_versions import customer_version
+    from utils.recommendation_engine import get_recommendations, get_stored_recommendations
+
+    with app.app_context():
+        customer = Customer(first_name="Grace", last_name="Hopper", email="grace@example.com")
+        db.session.add_all([customer, Product(name="Support Plan", category="Support", price=20)])
+        db.session.flush()
+        db.session.add(CustomerPreference(customer_id=customer.id, category="Support", preference_level=3))
+        db.session.commit()
+        customer_id = customer.id
+
+        run_batch_scoring()
+        stored = get_stored_recommendations(customer_id, set(), customer_version(customer_id))
+        assert stored is not None
+        assert [(r["product_id"], r["score"]) for r in stored] == \
+            [(r["product_id"], r["score"]) for r in get_recommendations(customer_id)]
+
+        # An edited preference bumps the data version: score live until the next run
+        preference = CustomerPreference.query.filter_by(customer_id=customer_id).one()
+        preference.preference_level = 5
+        db.session.commit()
+        assert get_stored_recommendations(customer_id, set(), customer_version(customer_id)) is None
+
+        run_batch_scoring()
+        assert get_stored_recommendations(customer_id, set(), customer_version(customer_id)) is not None
+
+        # A promotion starting changes the scores the stored list was ranked by
+        now = datetime.datetime.now()
+        db.session.add(Promotion(name="Support week", description="", discount_percentage=10,
+                                 product_category="Support", start_date=now - datetime.timedelta(hours=1),
+                                 end_date=now + datetime.timedelta(days=7)))
+        db.session.commit()
+        assert get_stored_recommendations(customer_id, set(), customer_version(customer_id)) is None
@@ -0,0 +1,6 @@
+from utils.schema import check_query_plans
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        assert check_query_plans() == []
@@ -0,0 +1,63 @@
+import random
+from collections import Counter
+
+import pytest
+
+from utils.sketches import CountMinSketch, HyperLogLog, SpaceSaving, merge_hll
+
+
+def _zipf_stream(size, values, seed):
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(values)]
+    return rng.choices(range(values), weights=weights, k=size)
+
+
+@pytest.mark.parametrize("cardinality", [100, 5000, 100000])
+def test_hyperloglog_estimate_is_within_its_error_bound(cardinality):
+    sketch = HyperLogLog().update(range(cardinality))
+    # Four standard errors (1.04 / sqrt(4096) each)
+    assert abs(sketch.estimate() - cardinality) <= 4 * 1.04 / 64 * cardinality
+
+
+def test_merged_hyperloglogs_estimate_the_union():
+    days = [HyperLogLog().update(range(start, start + 3000)) for start in range(0, 30000, 2000)]
+    union = HyperLogLog().update(range(0, 31000))
+
+    merged = merge_hll(day.to_bytes() for day in days)
+
+    assert merged.registers == union.registers
+
+
+def test_count_min_only_overestimates():
+    stream = _zipf_stream(50000, 2000, seed=1)
+    counts = Counter(stream)
+    sketch = CountMinSketch(width=256, depth=4)
+    # Built from per-day batches and merged, as the segment sketches are
+    for start in range(0, len(stream), 5000):
+        sketch.merge(CountMinSketch(256, 4).update(Counter(stream[start:start + 5000])))
+
+    errors = [sketch.estimate(value) - counts[value] for value in range(2000)]
+    assert min(errors) >= 0
+    within = sum(error <= sketch.error_bound() for error in errors)
+    assert within >= 0.95 * len(errors)
+
+
+@pytest.mark.parametrize("batched", [False, True])
+def test_space_saving_tracks_every_heavy_hitter(batched):
+    stream = _zipf_stream(50000, 5000, seed=2)
+    counts = Counter(stream)
+    capacity = 64
+    summary = SpaceSaving(capacity)
+    if batched:
+        for start in range(0, len(stream), 5000):
+            summary.merge(SpaceSaving(capacity).update(Counter(stream[start:start + 5000])))
+    else:
+        for value in stream:
+            summary.add(value)
+
+    tracked = {value: (count, error) for value, count, error in summary.top(capacity)}
+    for value, true_count in counts.items():
+        if true_count > len(stream) / capacity:
+            assert value in tracked
+    for value, (count, error) in tracked.items():
+        assert count - error <= counts[value] <= count
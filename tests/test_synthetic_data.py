@@ -0,0 +1,20 @@
+import datetime
+
+from utils.synthetic_data import GenerationSettings, generate_dataset
+
+
+def test_generate_dataset_bumps_customer_data_versions(app):
+    from app import db
+    from models import Customer
+    from utils.data_versions import customer_version
+
+    settings = GenerationSettings(customers=5, products=3, purchases=20, interactions=10, promotions=1,
+                                  days=30)
+    with app.app_context():
+        before = db.session.query(db.func.max(Customer.id)).scalar() or 0
+        # Far from the dates other tests query
+        generate_dataset(settings, seed=1, end=datetime.datetime(2020, 1, 1))
+        new_ids = [customer_id for (customer_id,) in db.session.query(Customer.id).filter(Customer.id > before)]
+
+        assert len(new_ids) == 5
+        assert all(customer_version(customer_id) == 1 for customer_id in new_ids)
@@ -0,0 +1,57 @@
+import datetime
+
+
+def test_timeseries_accepts_timezone_aware_range(app, client):
+    from app import db
+    from models import Customer, Product, Purchase
+
+    with app.app_context():
+        customer = Customer(first_name="Ada", last_name="Lovelace", email="ada@example.com")
+        product = Product(name="Basic Plan", category="Service", price=10)
+        db.session.add_all([customer, product])
+        db.session.flush()
+        db.session.add(Purchase(customer_id=customer.id, product_id=product.id, amount=10,
+                                purchase_date=datetime.datetime(2026, 10, 2, 9, 30)))
+        db.session.commit()
+
+    for start, end in [("2026-10-01T00:00:00Z", "2026-10-04T00:00:00Z"),
+                       ("2026-10-01T00:00:00+00:00", "2026-10-04T00:00:00+00:00")]:
+        response = client.get("/api/analytics/timeseries",
+                              query_string={"from": start, "to": end, "granularity": "day"})
+        assert response.status_code == 200
+        series = response.get_json()["series"]
+        assert [point["bucket"] for point in series] == [
+            "2026-10-01T00:00:00", "2026-10-02T00:00:00", "2026-10-03T00:00:00"
+        ]
+        assert [point["purchases"] for point in series] == [0, 1, 0]
+
+
+def test_rebuild_matches_incremental_buckets(app):
+    from app import db
+    from models import ActivityBucket, Customer, Interaction, Product, Purchase
+    from utils.timeseries import rebuild_timeseries
+
+    def buckets():
+        return {
+            (row.granularity, row.bucket, row.activity, row.category, row.interaction_type):
+                (row.event_count, round(row.amount_sum, 6), row.customers)
+            for row in ActivityBucket.query
+        }
+
+    with app.app_context():
+        customers = [Customer(first_name="Rebuild", last_name=str(i), email=f"rebuild{i}@example.com")
+                     for i in range(3)]
+        product = Product(name="Rebuild Plan", category="Rebuild", price=5)
+        db.session.add_all(customers + [product])
+        db.session.flush()
+        start = datetime.datetime(2025, 3, 1, 22, 0)
+        for i in range(12):
+            at = start + datetime.timedelta(hours=5 * i)
+            customer_id = customers[i % 3].id
+            db.session.add(Purchase(customer_id=customer_id, product_id=product.id, amount=5, purchase_date=at))
+            db.session.add(Interaction(customer_id=customer_id, interaction_type="email", created_at=at))
+        db.session.commit()
+
+        incremental = buckets()
+        rebuild_timeseries(batch_size=4)
+        assert buckets() == incremental
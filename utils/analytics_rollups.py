@@ -0,0 +1,243 @@
+from app import db
+from models import (
+    Customer, Product, Purchase, Interaction, CustomerPreference,
+    AnalyticsCounter, CategoryPurchaseRollup, ProductPurchaseRollup,
+    InteractionTypeRollup, PreferenceRollup
+)
+from utils import data_events
+from utils.db_utils import upsert_increment
+from sqlalchemy import delete, insert, select, func
+from collections import Counter
+
+# Names of the AnalyticsCounter rows
+CUSTOMERS = "customers"
+PURCHASES = "purchases"
+INTERACTIONS = "interactions"
+# Bumped on every change to any rollup, so readers can key caches on it
+VERSION = "version"
+# Present once the rollups have been computed from the base tables
+ROLLUPS_BUILT = "rollups_built"
+
+ROLLUP_MODELS = (
+    AnalyticsCounter, CategoryPurchaseRollup, ProductPurchaseRollup,
+    InteractionTypeRollup, PreferenceRollup
+)
+
+
+def to_key(value):
+    """Rollup key for a dimension value (NULL is stored as an empty string)"""
+    return "" if value is None else value
+
+
+def from_key(key):
+    """Dimension value for a rollup key"""
+    return None if key == "" else key
+
+
+class RollupDelta:
+    """Pending increments for every rollup table"""
+
+    def __init__(self):
+        self.counters = Counter()
+        self.categories = Counter()
+        self.products = Counter()
+        self.interaction_types = Counter()
+        self.preference_sums = Counter()
+        self.preference_counts = Counter()
+
+    def __bool__(self):
+        return any(
+            any(counter.values())
+            for counter in (self.counters, self.categories, self.products, self.interaction_types,
+                            self.preference_sums, self.preference_counts)
+        )
+
+    def add_purchase(self, product_id, category, sign=1):
+        self.counters[PURCHASES] += sign
+        self.products[product_id] += sign
+        self.categories[to_key(category)] += sign
+
+    def add_interaction(self, interaction_type, sign=1):
+        self.counters[INTERACTIONS] += sign
+        self.interaction_types[to_key(interaction_type)] += sign
+
+    def add_preference(self, category, level, sign=1):
+        # AVG() ignores NULL levels, so they do not count towards the average either
+        if level is None:
+            return
+        self.preference_sums[to_key(category)] += sign * level
+        self.preference_counts[to_key(category)] += sign
+
+
+def compute_delta(connection, changes):
+    """
+    Translate a ChangeSet into rollup increments.
+
+    Product categories are read on the given connection so they reflect the
+    state of the transaction that is being flushed.
+    """
+    delta = RollupDelta()
+    customer_table = Customer.__table__.name
+    product_table = Product.__table__.name
+    purchase_table = Purchase.__table__.name
+    interaction_table = Interaction.__table__.name
+    preference_table = CustomerPreference.__table__.name
+
+    delta.counters[CUSTOMERS] += len(changes.inserted.get(customer_table, []))
+    delta.counters[CUSTOMERS] -= len(changes.deleted.get(customer_table, []))
+
+    purchase_updates = [
+        (old, new) for old, new in changes.updated.get(purchase_table, [])
+        if old.get("product_id") != new.get("product_id")
+    ]
+    product_ids = {row.get("product_id") for row in changes.inserted.get(purchase_table, [])}
+    product_ids.update(row.get("product_id") for row in changes.deleted.get(purchase_table, []))
+    for old, new in purchase_updates:
+        product_ids.update((old.get("product_id"), new.get("product_id")))
+    product_ids.discard(None)
+
+    categories = {}
+    if product_ids:
+        categories = dict(connection.execute(
+            select(Product.id, Product.category).where(Product.id.in_(product_ids))
+        ).all())
+    for row in changes.deleted.get(product_table, []):
+        categories.setdefault(row.get("id"), row.get("category"))
+
+    for row in changes.inserted.get(purchase_table, []):
+        delta.add_purchase(row["product_id"], categories.get(row["product_id"]))
+    for row in changes.deleted.get(purchase_table, []):
+        delta.add_purchase(row["product_id"], categories.get(row["product_id"]), sign=-1)
+    for old, new in purchase_updates:
+        delta.add_purchase(old["product_id"], categories.get(old["product_id"]), sign=-1)
+        delta.add_purchase(new["product_id"], categories.get(new["product_id"]))
+
+    # Recategorized products carry their existing purchase count to the new category
+    moved = {
+        old["id"]: (old["category"], new["category"])
+        for old, new in changes.updated.get(product_table, [])
+        if "category" in old and "category" in new and old["category"] != new["category"]
+    }
+    if moved:
+        counts = dict(connection.execute(
+            select(ProductPurchaseRollup.product_id, ProductPurchaseRollup.purchase_count)
+            .where(ProductPurchaseRollup.product_id.in_(moved))
+        ).all())
+        for product_id, (old_category, new_category) in moved.items():
+            count = counts.get(product_id, 0)
+            delta.categories[to_key(old_category)] -= count
+            delta.categories[to_key(new_category)] += count
+    # Best sellers are listed by name, so a rename changes the analytics too
+    if any(old.get("name") != new.get("name") for old, new in changes.updated.get(product_table, [])):
+        delta.counters[VERSION] += 1
+
+    for row in changes.inserted.get(interaction_table, []):
+        delta.add_interaction(row.get("interaction_type"))
+    for row in changes.deleted.get(interaction_table, []):
+        delta.add_interaction(row.get("interaction_type"), sign=-1)
+    for old, new in changes.updated.get(interaction_table, []):
+        if old.get("interaction_type") != new.get("interaction_type"):
+            delta.interaction_types[to_key(old.get("interaction_type"))] -= 1
+            delta.interaction_types[to_key(new.get("interaction_type"))] += 1
+
+    for row in changes.inserted.get(preference_table, []):
+        delta.add_preference(row.get("category"), row.get("preference_level"))
+    for row in changes.deleted.get(preference_table, []):
+        delta.add_preference(row.get("category"), row.get("preference_level"), sign=-1)
+    for old, new in changes.updated.get(preference_table, []):
+        delta.add_preference(old.get("category"), old.get("preference_level"), sign=-1)
+        delta.add_preference(new.get("category"), new.get("preference_level"))
+
+    return delta
+
+
+def apply_delta(connection, delta):
+    """Write a RollupDelta with one upsert per rollup table"""
+    if not delta:
+        return
+    delta.counters[VERSION] += 1
+
+    upsert_increment(connection, AnalyticsCounter.__table__, ["name"], [
+        {"name": name, "value": value} for name, value in delta.counters.items() if value
+    ])
+    upsert_increment(connection, CategoryPurchaseRollup.__table__, ["category"], [
+        {"category": category, "purchase_count": count}
+        for category, count in delta.categories.items() if count
+    ])
+    upsert_increment(connection, ProductPurchaseRollup.__table__, ["product_id"], [
+        {"product_id": product_id, "purchase_count": count}
+        for product_id, count in delta.products.items() if count
+    ])
+    upsert_increment(connection, InteractionTypeRollup.__table__, ["interaction_type"], [
+        {"interaction_type": interaction_type, "interaction_count": count}
+        for interaction_type, count in delta.interaction_types.items() if count
+    ])
+    upsert_increment(connection, PreferenceRollup.__table__, ["category"], [
+        {
+            "category": category,
+            "level_sum": delta.preference_sums[category],
+            "level_count": delta.preference_counts[category]
+        }
+        for category in set(delta.preference_sums) | set(delta.preference_counts)
+        if delta.preference_sums[category] or delta.preference_counts[category]
+    ])
+
+
+@data_events.on_flush
+def _maintain_rollups(connection, changes):
+    apply_delta(connection, compute_delta(connection, changes))
+
+
+def rebuild_rollups():
+    """
+    Recompute every rollup from the base tables in one transaction,
+    discarding any drift accumulated by the incremental path.
+    """
+    version = db.session.query(AnalyticsCounter.value).filter_by(name=VERSION).scalar() or 0
+
+    for model in ROLLUP_MODELS:
+        db.session.execute(delete(model.__table__))
+
+    product_category = func.coalesce(Product.category, "")
+    db.session.execute(insert(CategoryPurchaseRollup.__table__).from_select(
+        ["category", "purchase_count"],
+        select(product_category, func.count(Purchase.id))
+        .join(Product, Purchase.product_id == Product.id)
+        .group_by(product_category)
+    ))
+    db.session.execute(insert(ProductPurchaseRollup.__table__).from_select(
+        ["product_id", "purchase_count"],
+        select(Purchase.product_id, func.count(Purchase.id))
+        .group_by(Purchase.product_id)
+    ))
+    interaction_type = func.coalesce(Interaction.interaction_type, "")
+    db.session.execute(insert(InteractionTypeRollup.__table__).from_select(
+        ["interaction_type", "interaction_count"],
+        select(interaction_type, func.count(Interaction.id))
+        .group_by(interaction_type)
+    ))
+    preference_category = func.coalesce(CustomerPreference.category, "")
+    db.session.execute(insert(PreferenceRollup.__table__).from_select(
+        ["category", "level_sum", "level_count"],
+        select(
+            preference_category,
+            func.coalesce(func.sum(CustomerPreference.preference_level), 0),
+            func.count(CustomerPreference.preference_level)
+        ).group_by(preference_category)
+    ))
+
+    db.session.execute(insert(AnalyticsCounter.__table__), [
+        {"name": CUSTOMERS, "value": db.session.query(func.count(Customer.id)).scalar()},
+        {"name": PURCHASES, "value": db.session.query(func.count(Purchase.id)).scalar()},
+        {"name": INTERACTIONS, "value": db.session.query(func.count(Interaction.id)).scalar()},
+        {"name": VERSION, "value": version + 1},
+        {"name": ROLLUPS_BUILT, "value": 1}
+    ])
+    db.session.commit()
+
+
+def ensure_rollups():
+    """Build the rollups once for databases created before they existed"""
+    built = db.session.query(AnalyticsCounter.value).filter_by(name=ROLLUPS_BUILT).scalar()
+    if not built:
+        rebuild_rollups()
@@ -0,0 +1,236 @@
+"""
+Live analytics over Server-Sent Events.
+
+Each process runs at most one broadcaster thread. It refreshes the
+analytics when a commit in this process touches the tables behind them,
+or when a cheap poll of the rollup version shows that another process
+wrote, and pushes only the sections that changed to every connected
+dashboard. A refresh reads the small rollup tables; the segment sketches
+are only merged again when purchases or interactions were added, a
+product changed or the day rolled over. The database load is one refresh
+per change per process, however many dashboards are open.
+
+Every open stream holds a thread for up to ANALYTICS_STREAM_MAX_SECONDS.
+gunicorn.conf.py runs threaded (gthread) workers so streams never tie up
+whole worker processes, and at most ANALYTICS_STREAM_MAX_SUBSCRIBERS
+streams are served per process so the remaining threads stay free for
+regular requests; dashboards turned away load the analytics once and
+try the stream again later.
+"""
+from models import Customer, Product, Purchase, Interaction, CustomerPreference
+from utils import data_events
+from utils.data_processor import get_rollup_analytics, get_analytics_segments
+from utils.data_versions import analytics_version
+from flask import current_app
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_ANALYTICS_TABLES = {
+    model.__table__.name for model in (Customer, Product, Purchase, Interaction, CustomerPreference)
+}
+# Tables whose changes the segment figures show beyond the purchase and
+# interaction totals (product names)
+_SEGMENT_TABLES = {Product.__table__.name}
+# Totals whose change means new activity for the segment sketches
+_SEGMENT_TOTALS = ("total_products_sold", "total_interactions")
+# Events buffered per subscriber; a client that falls this far behind is
+# disconnected and gets a fresh snapshot when its EventSource reconnects
+SUBSCRIBER_QUEUE_SIZE = 32
+# Milliseconds a disconnected EventSource waits before reconnecting
+RECONNECT_MS = 3000
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def analytics_delta(previous, current):
+    """Sections of the analytics payload whose value changed"""
+    return {key: value for key, value in current.items() if previous.get(key) != value}
+
+
+def format_event(event, data, event_id=None):
+    """Encode one Server-Sent Event"""
+    lines = []
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"event: {event}")
+    lines.append(f"data: {json.dumps(data, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscription:
+    """One connected dashboard"""
+
+    def __init__(self):
+        self.events = queue.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = False
+
+    def push(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.dropped = True
+
+
+class AnalyticsBroadcaster:
+    """
+    Computes analytics deltas once and fans them out to subscribers.
+
+    The thread sleeps until a local commit wakes it or poll_seconds pass,
+    and stops computing while nobody is subscribed.
+    """
+
+    def __init__(self, app, poll_seconds=5, max_subscribers=16):
+        self.app = app
+        self.poll_seconds = poll_seconds
+        self.max_subscribers = max_subscribers
+        self.pid = os.getpid()
+        self.version = None
+        self.day = None
+        self.snapshot = None
+        self._subscribers = set()
+        # Tables written by commits in this process since the last refresh
+        self._changed_tables = set()
+        self._tables_lock = threading.Lock()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="analytics-stream", daemon=True)
+        self._thread.start()
+
+    def subscribe(self):
+        """
+        Register a subscriber, queueing the current analytics as its first event.
+
+        Returns:
+            Subscription: Read events from subscription.events, or None when
+                max_subscribers streams are already open in this process
+        """
+        subscription = Subscription()
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if self.snapshot is None:
+                self._refresh()
+            subscription.push(format_event("snapshot", self.snapshot, self.version))
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def notify(self, tables=()):
+        """Wake the thread to look for new analytics after a write to tables"""
+        with self._tables_lock:
+            self._changed_tables.update(tables)
+        self._wake.set()
+
+    def _segments_stale(self, previous, analytics, tables, day):
+        return (
+            "segments" not in previous
+            or day != self.day
+            or bool(tables & _SEGMENT_TABLES)
+            or any(previous.get(key) != analytics.get(key) for key in _SEGMENT_TOTALS)
+        )
+
+    def _refresh(self):
+        """
+        Refresh the analytics if their version moved, reading only the
+        sections that can have changed; returns the changed sections
+        """
+        with self._tables_lock:
+            tables, self._changed_tables = self._changed_tables, set()
+        day = datetime.datetime.utcnow().date()
+        with self.app.app_context():
+            version = analytics_version()
+            # Unversioned analytics (rollups not built) are recomputed on every wake-up
+            if self.snapshot is not None and version is not None and version == self.version \
+                    and day == self.day and not tables:
+                return {}
+            previous = self.snapshot or {}
+            analytics = get_rollup_analytics()
+            if self._segments_stale(previous, analytics, tables, day):
+                analytics["segments"] = get_analytics_segments()
+            else:
+                analytics["segments"] = previous["segments"]
+        delta = analytics_delta(previous, analytics)
+        self.version, self.day, self.snapshot = version, day, analytics
+        return delta
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+            with self._lock:
+                if not self._subscribers:
+                    # Nobody is watching: forget the snapshot rather than keep it fresh
+                    self.snapshot = None
+                    with self._tables_lock:
+                        self._changed_tables.clear()
+                    continue
+                try:
+                    delta = self._refresh()
+                except Exception:
+                    logger.exception("Error computing analytics for the live stream")
+                    continue
+                if not delta:
+                    continue
+                event = format_event("delta", delta, self.version)
+                for subscription in list(self._subscribers):
+                    subscription.push(event)
+                    if subscription.dropped:
+                        self._subscribers.discard(subscription)
+
+
+def get_analytics_broadcaster():
+    """Return this process's broadcaster, starting it on first use (and after a fork)"""
+    global _broadcaster
+    if _broadcaster is None or _broadcaster.pid != os.getpid():
+        with _broadcaster_lock:
+            if _broadcaster is None or _broadcaster.pid != os.getpid():
+                _broadcaster = AnalyticsBroadcaster(
+                    current_app._get_current_object(),
+                    poll_seconds=current_app.config.get("ANALYTICS_STREAM_POLL_SECONDS", 5),
+                    max_subscribers=current_app.config.get("ANALYTICS_STREAM_MAX_SUBSCRIBERS", 16)
+                )
+    return _broadcaster
+
+
+def stream_events(broadcaster, subscription, heartbeat_seconds=15, max_seconds=300):
+    """
+    Yield a subscription's events as SSE text.
+
+    A comment line is sent when nothing happened for heartbeat_seconds, so
+    proxies keep the connection open and dead clients are noticed. The
+    stream ends after max_seconds, or when the client fell too far behind;
+    the browser reconnects on its own and starts from a new snapshot.
+    """
+    deadline = time.monotonic() + max_seconds
+    try:
+        yield f"retry: {RECONNECT_MS}\n\n"
+        while not subscription.dropped:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                yield subscription.events.get(timeout=min(heartbeat_seconds, remaining))
+            except queue.Empty:
+                yield ": keepalive\n\n"
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+@data_events.on_commit
+def _wake_on_commit(changes):
+    broadcaster = _broadcaster
+    if broadcaster is not None and broadcaster.pid == os.getpid():
+        tables = changes.tables & _ANALYTICS_TABLES
+        if tables:
+            broadcaster.notify(tables)
@@ -0,0 +1,191 @@
+"""
+Fingerprinted, precompressed static assets.
+
+``flask assets build`` minifies the site's CSS and JavaScript, writes each
+file to static/dist under a name containing a hash of its content, next to
+``.gz`` and (with the brotli package) ``.br`` variants, and records the
+names in static/dist/manifest.json. Templates link assets through
+``asset_url()``, which resolves the manifest, and /assets serves the
+smallest variant the client accepts with a one-year immutable
+Cache-Control: a changed file gets a new name, so browsers never need to
+revalidate. Workers read the manifest once it exists (until then they
+look for it on every lookup and link the plain static files), so
+restart them after a rebuild. A front-end proxy can serve static/dist directly
+(gzip_static / brotli_static) to keep these requests off the workers.
+
+Minification uses rjsmin and rcssmin and the .br variants need brotli;
+install them with the ``assets`` extra (``pip install .[assets]``).
+Without them files are only fingerprinted and gzipped, and the build
+warns (or, with ``--strict``, fails). The manifest itself is not served:
+it changes with every build, so it must never be cached as immutable.
+"""
+from flask import current_app, request, send_from_directory, url_for, abort
+from werkzeug.security import safe_join
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+
+logger = logging.getLogger(__name__)
+
+# Files under static/ that are built, as referenced from templates
+ASSET_SOURCES = ["css/style.css", "js/main.js", "js/analytics.js", "js/recommendations.js"]
+DIST_DIR = "dist"
+MANIFEST_NAME = "manifest.json"
+# Precompressed variants, preferred first: Content-Encoding -> file suffix
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+# Hex digits of the content hash kept in file names
+HASH_LENGTH = 12
+CACHE_MAX_AGE = 365 * 24 * 3600
+# Optional build dependencies (the "assets" extra): import name -> purpose
+BUILD_TOOLS = {"rjsmin": "JavaScript minification", "rcssmin": "CSS minification",
+               "brotli": ".br variants"}
+
+_manifest = None
+
+
+def _minifier(filename):
+    try:
+        if filename.endswith(".js"):
+            from rjsmin import jsmin
+            return jsmin
+        if filename.endswith(".css"):
+            from rcssmin import cssmin
+            return cssmin
+    except ImportError:
+        return None
+    return None
+
+
+def _brotli_compress():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return lambda data: brotli.compress(data, quality=11)
+
+
+def missing_build_tools():
+    """
+    Optional build dependencies that are not installed.
+
+    Returns:
+        list: (package, purpose) pairs, empty when the build is complete
+    """
+    missing = []
+    for package, purpose in BUILD_TOOLS.items():
+        try:
+            __import__(package)
+        except ImportError:
+            missing.append((package, purpose))
+    return missing
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def build_assets(static_folder, sources=ASSET_SOURCES):
+    """
+    Minify, fingerprint and precompress assets into static/dist.
+
+    Args:
+        static_folder (str): The app's static folder
+        sources (list): Paths relative to static_folder
+
+    Returns:
+        dict: Source path -> fingerprinted path relative to static/dist
+    """
+    dist_folder = os.path.join(static_folder, DIST_DIR)
+    brotli_compress = _brotli_compress()
+    if brotli_compress is None:
+        logger.warning("brotli is not installed; only .gz variants are written")
+
+    manifest = {}
+    for source in sources:
+        with open(os.path.join(static_folder, source), encoding="utf-8") as f:
+            content = f.read()
+        minify = _minifier(source)
+        if minify is not None:
+            content = minify(content)
+        else:
+            logger.warning("No minifier installed for %s; copying it as is", source)
+        data = content.encode("utf-8")
+
+        digest = hashlib.sha256(data).hexdigest()[:HASH_LENGTH]
+        stem, extension = os.path.splitext(source)
+        built = f"{stem}.{digest}{extension}"
+        path = os.path.join(dist_folder, built)
+        _write(path, data)
+        # mtime=0 keeps the .gz bytes identical across builds of the same content
+        _write(path + ".gz", gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli_compress is not None:
+            _write(path + ".br", brotli_compress(data))
+        manifest[source] = built
+
+    _write(os.path.join(dist_folder, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True).encode())
+    return manifest
+
+
+def load_manifest(static_folder):
+    """Read static/dist/manifest.json; an empty dict if assets were never built"""
+    try:
+        with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def asset_url(filename):
+    """
+    URL of a static asset: its fingerprinted build when one exists, the
+    plain static file otherwise (and always in debug mode, so edits show up
+    without a rebuild).
+    """
+    global _manifest
+    if not current_app.debug:
+        if not _manifest:
+            # An empty manifest means no build yet; look again next time
+            _manifest = load_manifest(current_app.static_folder)
+        built = _manifest.get(filename)
+        if built is not None:
+            return url_for("assets", filename=built)
+    return url_for("static", filename=filename)
+
+
+def serve_asset(filename):
+    """Serve a built asset, precompressed when the client accepts it"""
+    dist_folder = os.path.join(current_app.static_folder, DIST_DIR)
+    path = safe_join(dist_folder, filename)
+    # The manifest is rewritten by every build; immutable caching would pin a
+    # stale copy. Compare normalized paths so "./manifest.json" is caught too
+    if path is None or os.path.normpath(path) == os.path.join(dist_folder, MANIFEST_NAME):
+        abort(404)
+    mimetype = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+
+    encoding = None
+    for name, suffix in ENCODINGS:
+        if request.accept_encodings[name] and os.path.isfile(path + suffix):
+            encoding = name
+            filename += suffix
+            break
+    if encoding is None and filename.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+        abort(404)
+
+    response = send_from_directory(dist_folder, filename, mimetype=mimetype, max_age=CACHE_MAX_AGE)
+    if encoding is not None:
+        response.headers["Content-Encoding"] = encoding
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def init_assets(app):
+    """Register /assets and the asset_url() template global on app"""
+    app.add_url_rule("/assets/<path:filename>", "assets", serve_asset)
+    app.jinja_env.globals["asset_url"] = asset_url
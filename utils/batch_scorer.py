@@ -0,0 +1,256 @@
+from app import db
+from models import (
+    Customer, CustomerPreference, Purchase, RecommendationRun, CustomerRecommendation,
+    CustomerRecommendationState, CustomerDataVersion
+)
+from utils.catalog_index import get_catalog_index
+from utils.copurchase import get_copurchase_index
+from utils.recommendation_engine import RECOMMENDATION_LIMIT, MINIMUM_SCORE, promotion_key
+from flask import current_app
+from sqlalchemy import delete, insert
+import numpy as np
+import datetime
+
+# Customers scored per batched pass; bounds the customer x product matrices
+DEFAULT_CHUNK_SIZE = 2000
+
+
+class ScoringModel:
+    """
+    Catalog-side arrays for vectorized scoring.
+
+    Products are laid out in id order, so ties broken by column index match
+    the live recommender's product id ordering.
+    """
+
+    def __init__(self, index, at, copurchases=None, max_boost=0):
+        self.index = index
+        self.max_boost = max_boost
+        self.product_ids = np.array(sorted(index.products), dtype=np.int64)
+        self.categories = list(index.products_by_category)
+        self.category_codes = {category: code for code, category in enumerate(self.categories)}
+
+        # category x product mapping, stored as one category code per product column
+        self.product_categories = np.array(
+            [self.category_codes[index.products[pid]["category"]] for pid in self.product_ids.tolist()],
+            dtype=np.int64
+        )
+
+        # Stored with the results: they are only valid while the same promotions are active
+        self.promotion_key = promotion_key(index.active_promotion_ids(at))
+        promotions_by_category, global_promotions = index.active_promotion_counts(at)
+        category_promotions = np.array(
+            [promotions_by_category.get(category, 0) + global_promotions for category in self.categories],
+            dtype=np.int64
+        )
+        # Base score of every product before customer preferences are applied
+        self.product_base_scores = 1 + category_promotions[self.product_categories]
+
+        # Co-purchase neighbours in CSR form: the neighbour columns of product
+        # column c are neighbor_columns[neighbor_indptr[c]:neighbor_indptr[c + 1]]
+        columns = {pid: column for column, pid in enumerate(self.product_ids.tolist())}
+        neighbors = copurchases.neighbors if copurchases is not None and max_boost > 0 else {}
+        indptr = [0]
+        neighbor_columns = []
+        for pid in self.product_ids.tolist():
+            neighbor_columns.extend(columns[other] for other in neighbors.get(pid, ()) if other in columns)
+            indptr.append(len(neighbor_columns))
+        self.neighbor_indptr = np.array(indptr, dtype=np.int64)
+        self.neighbor_columns = np.array(neighbor_columns, dtype=np.int64)
+
+    def copurchase_boosts(self, purchased_mask):
+        """Customers x products co-purchase boost, capped at max_boost"""
+        boosts = np.zeros(purchased_mask.shape, dtype=np.int64)
+        if not len(self.neighbor_columns):
+            return boosts
+        rows, columns = np.nonzero(purchased_mask)
+        starts = self.neighbor_indptr[columns]
+        counts = self.neighbor_indptr[columns + 1] - starts
+        total = int(counts.sum())
+        if total == 0:
+            return boosts
+        # Position of every (purchase, neighbour) pair in neighbor_columns
+        offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+        np.add.at(boosts, (np.repeat(rows, counts), self.neighbor_columns[np.repeat(starts, counts) + offsets]), 1)
+        return np.minimum(boosts, self.max_boost)
+
+    def score(self, preference_matrix, purchased_mask, limit=RECOMMENDATION_LIMIT):
+        """
+        Score a chunk of customers against every product.
+
+        Args:
+            preference_matrix (ndarray): customers x categories preference levels
+            purchased_mask (ndarray): customers x products, True where already purchased
+            limit (int): Number of recommendations per customer
+
+        Returns:
+            tuple: (customers x k product column indices, customers x k scores,
+                customers x k validity mask), best first
+        """
+        product_count = len(self.product_ids)
+        k = min(limit, product_count)
+        if k == 0:
+            empty = np.zeros((preference_matrix.shape[0], 0), dtype=np.int64)
+            return empty, empty, empty.astype(bool)
+
+        scores = self.product_base_scores[np.newaxis, :] + preference_matrix[:, self.product_categories] \
+            + self.copurchase_boosts(purchased_mask)
+
+        # Fold the id tie-break into one integer key: higher score first, then lower column
+        keys = scores * product_count + (product_count - 1 - np.arange(product_count, dtype=np.int64))
+        keys[purchased_mask | (scores < MINIMUM_SCORE)] = -1
+
+        top = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+        top_keys = np.take_along_axis(keys, top, axis=1)
+        order = np.argsort(-top_keys, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_keys = np.take_along_axis(top_keys, order, axis=1)
+
+        return top, np.take_along_axis(scores, top, axis=1), top_keys >= 0
+
+    def preference_matrix(self, customer_ids, preference_rows):
+        """Build the customers x categories matrix from (customer_id, category, level) rows"""
+        rows = {customer_id: row for row, customer_id in enumerate(customer_ids)}
+        matrix = np.zeros((len(customer_ids), len(self.categories)), dtype=np.int64)
+        for customer_id, category, level in preference_rows:
+            code = self.category_codes.get(category)
+            if code is not None and level:
+                matrix[rows[customer_id], code] = level
+        return matrix
+
+    def purchased_mask(self, customer_ids, purchase_rows):
+        """Build the customers x products mask from (customer_id, product_id) rows"""
+        rows = {customer_id: row for row, customer_id in enumerate(customer_ids)}
+        mask = np.zeros((len(customer_ids), len(self.product_ids)), dtype=bool)
+        if not purchase_rows or not len(self.product_ids):
+            return mask
+        customer_rows = np.array([rows[customer_id] for customer_id, _ in purchase_rows], dtype=np.int64)
+        product_ids = np.array([product_id for _, product_id in purchase_rows], dtype=np.int64)
+        columns = np.searchsorted(self.product_ids, product_ids)
+        columns = np.minimum(columns, len(self.product_ids) - 1)
+        known = self.product_ids[columns] == product_ids
+        mask[customer_rows[known], columns[known]] = True
+        return mask
+
+
+def score_chunk(model, customer_ids, limit=RECOMMENDATION_LIMIT):
+    """
+    Load preferences and purchases for a chunk of customers and score them.
+
+    Returns:
+        tuple: (row dicts for the CustomerRecommendation table, row dicts for
+            the CustomerRecommendationState table), both without run_id
+    """
+    # Versions first: a write landing while the chunk is scored leaves the
+    # stored state behind the customer's version instead of ahead of it
+    versions = dict(db.session.query(CustomerDataVersion.customer_id, CustomerDataVersion.version).filter(
+        CustomerDataVersion.customer_id.in_(customer_ids)
+    ).all())
+    preference_rows = db.session.query(
+        CustomerPreference.customer_id,
+        CustomerPreference.category,
+        CustomerPreference.preference_level
+    ).filter(CustomerPreference.customer_id.in_(customer_ids)).all()
+    purchase_rows = db.session.query(
+        Purchase.customer_id,
+        Purchase.product_id
+    ).filter(Purchase.customer_id.in_(customer_ids)).all()
+
+    top, scores, valid = model.score(
+        model.preference_matrix(customer_ids, preference_rows),
+        model.purchased_mask(customer_ids, purchase_rows),
+        limit
+    )
+
+    product_ids = model.product_ids[top]
+    rows = []
+    for row, customer_id in enumerate(customer_ids):
+        for rank in range(top.shape[1]):
+            if not valid[row, rank]:
+                break
+            rows.append({
+                "customer_id": customer_id,
+                "product_id": int(product_ids[row, rank]),
+                "rank": rank + 1,
+                "score": int(scores[row, rank])
+            })
+    states = [
+        {"customer_id": customer_id, "data_version": versions.get(customer_id, 0),
+         "promotion_key": model.promotion_key}
+        for customer_id in customer_ids
+    ]
+    return rows, states
+
+
+def store_chunk(run_id, customer_ids, rows, states):
+    """
+    Replace the stored recommendations and their states of a chunk of
+    customers with the rows from score_chunk, in the current transaction
+    (the caller commits).
+    """
+    for row in rows + states:
+        row["run_id"] = run_id
+    for model in (CustomerRecommendation, CustomerRecommendationState):
+        db.session.execute(delete(model).where(model.customer_id.in_(customer_ids)))
+    if rows:
+        db.session.execute(insert(CustomerRecommendation), rows)
+    if states:
+        db.session.execute(insert(CustomerRecommendationState), states)
+
+
+def build_scoring_model():
+    """ScoringModel of the current catalog, promotions and co-purchase counts"""
+    return ScoringModel(
+        get_catalog_index(),
+        datetime.datetime.now(),
+        get_copurchase_index(),
+        current_app.config["COPURCHASE_MAX_BOOST"]
+    )
+
+
+def run_batch_scoring(chunk_size=DEFAULT_CHUNK_SIZE, progress=None):
+    """
+    Score every customer in batched NumPy passes and store the top
+    recommendations in the CustomerRecommendation table.
+
+    Args:
+        chunk_size (int): Customers scored per pass
+        progress (callable): Optional callback receiving the number of customers done
+
+    Returns:
+        RecommendationRun: The completed run
+    """
+    model = build_scoring_model()
+    max_customer_id = db.session.query(db.func.max(Customer.id)).scalar() or 0
+
+    run = RecommendationRun(max_customer_id=max_customer_id, customer_count=0)
+    db.session.add(run)
+    db.session.commit()
+    run_id = run.id
+
+    last_id = 0
+    scored = 0
+    while True:
+        customer_ids = [
+            customer_id for (customer_id,) in
+            db.session.query(Customer.id)
+            .filter(Customer.id > last_id, Customer.id <= max_customer_id)
+            .order_by(Customer.id)
+            .limit(chunk_size)
+        ]
+        if not customer_ids:
+            break
+
+        store_chunk(run_id, customer_ids, *score_chunk(model, customer_ids))
+        db.session.commit()
+
+        last_id = customer_ids[-1]
+        scored += len(customer_ids)
+        if progress:
+            progress(scored)
+
+    run = db.session.get(RecommendationRun, run_id)
+    run.customer_count = scored
+    run.completed_at = datetime.datetime.utcnow()
+    db.session.commit()
+    return run
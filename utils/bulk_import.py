@@ -0,0 +1,336 @@
+from app import db
+from models import User, Customer, Product, Purchase, Interaction
+from utils import data_events
+from utils.copurchase import deferred_maintenance
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+import csv
+import datetime
+import itertools
+import json
+import os
+import time
+
+# Number of parse errors kept for the final report
+MAX_REPORTED_ERRORS = 10
+
+
+class ImportStats:
+    """Counters reported while an import runs"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.imported = 0
+        self.skipped = 0
+        self.errors = []
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.imported / self.elapsed if self.elapsed else 0.0
+
+    def skip(self, line_number, message):
+        self.skipped += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"record {line_number}: {message}")
+
+
+class LookupMaps:
+    """
+    In-memory email -> customer ID and name -> product ID maps, plus the
+    sets of existing customer, product and agent IDs.
+
+    They are loaded with streaming queries on first use and kept up to date
+    as customers and products are imported, so resolving or checking a
+    reference never costs a query. Their size follows the size of the
+    customer and product tables, not of the file being imported.
+    """
+
+    def __init__(self):
+        self._customers = None
+        self._products = None
+        self._ids = {}
+        self._agent_ids = None
+
+    @property
+    def customers(self):
+        if self._customers is None:
+            self._customers = dict(db.session.execute(
+                select(Customer.email, Customer.id).execution_options(yield_per=10000)
+            ).all())
+        return self._customers
+
+    @property
+    def products(self):
+        if self._products is None:
+            self._products = dict(db.session.execute(
+                select(Product.name, Product.id).order_by(Product.id).execution_options(yield_per=10000)
+            ).all())
+        return self._products
+
+    def ids(self, lookup_name):
+        """Set of the IDs in the "customers" or "products" map"""
+        if lookup_name not in self._ids:
+            self._ids[lookup_name] = set(getattr(self, lookup_name).values())
+        return self._ids[lookup_name]
+
+    def add(self, lookup_name, key, row_id):
+        """Record a newly imported customer or product"""
+        getattr(self, lookup_name)[key] = row_id
+        if lookup_name in self._ids:
+            self._ids[lookup_name].add(row_id)
+
+    @property
+    def agent_ids(self):
+        if self._agent_ids is None:
+            self._agent_ids = set(db.session.execute(
+                select(User.id).execution_options(yield_per=10000)
+            ).scalars())
+        return self._agent_ids
+
+
+class InvalidRecord:
+    """Placeholder yielded for an input line that is not a record"""
+
+    def __init__(self, error):
+        self.error = error
+
+
+def iter_records(path, file_format=None):
+    """
+    Stream records from a CSV or JSON Lines file one at a time.
+
+    Args:
+        path (str): Input file
+        file_format (str): "csv" or "jsonl"; guessed from the extension if omitted
+
+    Yields:
+        dict: One record per CSV row or non-empty JSON line; an
+            InvalidRecord for a JSON line that is not a JSON object
+    """
+    if file_format is None:
+        extension = os.path.splitext(path)[1].lower()
+        file_format = "csv" if extension == ".csv" else "jsonl"
+
+    with open(path, newline="", encoding="utf-8") as handle:
+        if file_format == "csv":
+            yield from csv.DictReader(handle)
+        else:
+            for file_line, line in enumerate(handle, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError as e:
+                    yield InvalidRecord(f"line {file_line}: invalid JSON ({e.msg})")
+                    continue
+                if not isinstance(record, dict):
+                    yield InvalidRecord(f"line {file_line}: expected a JSON object")
+                    continue
+                yield record
+
+
+def _text(record, field, required=False):
+    value = record.get(field)
+    if value is None or value == "":
+        if required:
+            raise ValueError(f"missing {field}")
+        return None
+    return str(value)
+
+
+def _datetime(record, field):
+    value = _text(record, field)
+    return datetime.datetime.fromisoformat(value) if value else datetime.datetime.utcnow()
+
+
+def _reference(record, id_field, key_field, maps, lookup_name, label):
+    """Resolve a foreign key given either as an ID or through a lookup map"""
+    value = record.get(id_field)
+    if value not in (None, ""):
+        row_id = int(value)
+        if row_id not in maps.ids(lookup_name):
+            raise ValueError(f"unknown {label} ID {row_id}")
+        return row_id
+    key = _text(record, key_field, required=True)
+    lookup = getattr(maps, lookup_name)
+    if key not in lookup:
+        raise ValueError(f"unknown {label} {key!r}")
+    return lookup[key]
+
+
+def _agent(record, maps):
+    """The optional agent_id of a record, which must name an existing user"""
+    value = record.get("agent_id")
+    if value in (None, ""):
+        return None
+    agent_id = int(value)
+    if agent_id not in maps.agent_ids:
+        raise ValueError(f"unknown agent ID {agent_id}")
+    return agent_id
+
+
+def _customer_row(record, maps):
+    email = _text(record, "email", required=True)
+    if email in maps.customers:
+        raise ValueError(f"customer {email!r} already exists")
+    return {
+        "first_name": _text(record, "first_name", required=True),
+        "last_name": _text(record, "last_name", required=True),
+        "email": email,
+        "phone": _text(record, "phone"),
+        "agent_id": _agent(record, maps),
+        "created_at": _datetime(record, "created_at")
+    }
+
+
+def _product_row(record, maps):
+    return {
+        "name": _text(record, "name", required=True),
+        "description": _text(record, "description"),
+        "category": _text(record, "category"),
+        "price": float(_text(record, "price", required=True)),
+        "created_at": _datetime(record, "created_at")
+    }
+
+
+def _purchase_row(record, maps):
+    return {
+        "customer_id": _reference(record, "customer_id", "customer_email", maps, "customers", "customer"),
+        "product_id": _reference(record, "product_id", "product_name", maps, "products", "product"),
+        "amount": float(_text(record, "amount", required=True)),
+        "purchase_date": _datetime(record, "purchase_date")
+    }
+
+
+def _interaction_row(record, maps):
+    return {
+        "customer_id": _reference(record, "customer_id", "customer_email", maps, "customers", "customer"),
+        "agent_id": _agent(record, maps),
+        "interaction_type": _text(record, "interaction_type"),
+        "notes": _text(record, "notes"),
+        "recommendations": _text(record, "recommendations"),
+        "created_at": _datetime(record, "created_at")
+    }
+
+
+# kind -> (model, row builder, map to update with new IDs and the column keying it)
+IMPORTERS = {
+    "customers": (Customer, _customer_row, "customers", "email"),
+    "products": (Product, _product_row, "products", "name"),
+    "purchases": (Purchase, _purchase_row, None, None),
+    "interactions": (Interaction, _interaction_row, None, None),
+}
+
+
+def _write_chunk(model, rows, maps, lookup_name, lookup_key):
+    """Insert one chunk with a single executemany and commit it"""
+    table = model.__table__
+    if lookup_name:
+        # IDs are needed to resolve references from later chunks and files
+        ids = db.session.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True),
+            rows
+        ).scalars().all()
+        for row, row_id in zip(rows, ids):
+            row["id"] = row_id
+    else:
+        db.session.execute(insert(table), rows)
+
+    changes = data_events.ChangeSet()
+    changes.inserted[table.name] = rows
+    data_events.run_flush_hooks(db.session.connection(), changes)
+    db.session.commit()
+    data_events.publish(changes)
+
+    if lookup_name:
+        # Only committed rows may be referenced
+        for row in rows:
+            maps.add(lookup_name, row[lookup_key], row["id"])
+
+
+def _write_rows(model, rows, line_numbers, maps, lookup_name, lookup_key, stats):
+    """
+    Write one chunk; if the database rejects it, retry its rows one at a
+    time so that only the offending records are skipped and reported
+    """
+    try:
+        _write_chunk(model, rows, maps, lookup_name, lookup_key)
+        stats.imported += len(rows)
+        return
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    for line_number, row in zip(line_numbers, rows):
+        row.pop("id", None)
+        try:
+            _write_chunk(model, [row], maps, lookup_name, lookup_key)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            stats.skip(line_number, f"rejected by the database ({getattr(e, 'orig', None) or e})")
+            continue
+        stats.imported += 1
+
+
+def import_records(kind, records, chunk_size=5000, progress=None):
+    """
+    Bulk import records in chunks, one transaction per chunk.
+
+    Records that cannot be parsed (including malformed JSON lines), whose
+    customer/product/agent reference does not exist or that the database
+    rejects are skipped and reported, the rest of the chunk is imported.
+
+    Args:
+        kind (str): One of IMPORTERS
+        records (iterable): Record dicts, typically from iter_records()
+        chunk_size (int): Records per INSERT/commit
+        progress (callable): Optional callback receiving the ImportStats after each chunk
+
+    Returns:
+        ImportStats: Final counters
+    """
+    model, build_row, lookup_name, lookup_key = IMPORTERS[kind]
+    maps = LookupMaps()
+    stats = ImportStats()
+    numbered = enumerate(records, start=1)
+
+    # Co-purchase neighbours are rebuilt once instead of per chunk
+    with deferred_maintenance():
+        while True:
+            chunk = list(itertools.islice(numbered, chunk_size))
+            if not chunk:
+                break
+
+            rows = []
+            line_numbers = []
+            seen_keys = set()
+            for line_number, record in chunk:
+                if isinstance(record, InvalidRecord):
+                    stats.skip(line_number, record.error)
+                    continue
+                if not isinstance(record, dict):
+                    stats.skip(line_number, "not an object")
+                    continue
+                try:
+                    row = build_row(record, maps)
+                except (ValueError, TypeError, KeyError, AttributeError) as e:
+                    stats.skip(line_number, str(e))
+                    continue
+                if kind == "customers":
+                    # Emails are unique; catch duplicates within the chunk before the INSERT does
+                    if row["email"] in seen_keys:
+                        stats.skip(line_number, f"duplicate customer {row['email']!r}")
+                        continue
+                    seen_keys.add(row["email"])
+                rows.append(row)
+                line_numbers.append(line_number)
+
+            if rows:
+                _write_rows(model, rows, line_numbers, maps, lookup_name, lookup_key, stats)
+            if progress:
+                progress(stats)
+
+    return stats
@@ -0,0 +1,148 @@
+from app import db
+from models import Product, Promotion
+from utils import data_events
+from utils.promotion_windows import PromotionWindows
+from flask import current_app
+import threading
+import time
+
+# Promotions with this category apply to every product
+ALL_CATEGORIES = "All"
+
+_index = None
+_index_lock = threading.Lock()
+# Bumped on every invalidation so a build that raced with a write is discarded
+_generation = 0
+
+
+class CatalogIndex:
+    """
+    Immutable, process-local snapshot of the product catalog and promotions.
+
+    Products are bucketed by category in id order, promotions are keyed by the
+    category they target (with "All" promotions kept separately) and the
+    discounted price of every product/promotion pair is computed up front, so
+    recommendation requests never have to scan the Product or Promotion tables.
+    Which promotions are active when is answered by a PromotionWindows index.
+    """
+
+    def __init__(self, products, promotions):
+        self.built_at = time.monotonic()
+        self.products = {}
+        self.products_by_category = {}
+        self.promotions = {}
+        self.promotions_by_category = {}
+        self.global_promotions = []
+        # product id -> [(promotion id, promotion payload)] in promotion id order
+        self.product_promotions = {}
+
+        for product in sorted(products, key=lambda p: p.id):
+            self.products[product.id] = {
+                "product_id": product.id,
+                "name": product.name,
+                "category": product.category,
+                "description": product.description,
+                "price": product.price
+            }
+            self.products_by_category.setdefault(product.category, []).append(product.id)
+
+        for promotion in sorted(promotions, key=lambda p: p.id):
+            self.promotions[promotion.id] = {
+                "id": promotion.id,
+                "name": promotion.name,
+                "description": promotion.description,
+                "discount_percentage": promotion.discount_percentage,
+                "product_category": promotion.product_category,
+                "start_date": promotion.start_date,
+                "end_date": promotion.end_date
+            }
+            if promotion.product_category == ALL_CATEGORIES:
+                self.global_promotions.append(promotion.id)
+            else:
+                self.promotions_by_category.setdefault(promotion.product_category, []).append(promotion.id)
+
+        for product_id, product in self.products.items():
+            applicable = sorted(
+                self.promotions_by_category.get(product["category"], []) + self.global_promotions
+            )
+            self.product_promotions[product_id] = [
+                (promotion_id, self._promotion_payload(product, self.promotions[promotion_id]))
+                for promotion_id in applicable
+            ]
+
+        self.promotion_windows = PromotionWindows(self.promotions, ALL_CATEGORIES)
+
+    @staticmethod
+    def _promotion_payload(product, promotion):
+        discount = promotion["discount_percentage"] or 0
+        return {
+            "id": promotion["id"],
+            "name": promotion["name"],
+            "description": promotion["description"],
+            "discount_percentage": promotion["discount_percentage"],
+            "discounted_price": round(product["price"] * (1 - discount / 100), 2)
+        }
+
+    def active_promotion_ids(self, at):
+        """Ids of promotions whose window contains the given datetime"""
+        return self.promotion_windows.active_at(at)
+
+    def active_promotion_counts(self, at):
+        """
+        Count the promotions active at the given datetime per category.
+
+        Returns:
+            tuple: (dict of category -> count, number of active "All" promotions)
+        """
+        return self.promotion_windows.counts_at(at)
+
+    def promotions_for_product(self, product_id, active_ids):
+        """Promotion payloads (with discounted price) active for a product"""
+        return [
+            dict(payload)
+            for promotion_id, payload in self.product_promotions.get(product_id, [])
+            if promotion_id in active_ids
+        ]
+
+
+def build_catalog_index():
+    """Load every product and promotion and build a fresh CatalogIndex"""
+    products = db.session.query(Product).all()
+    promotions = db.session.query(Promotion).all()
+    return CatalogIndex(products, promotions)
+
+
+def get_catalog_index():
+    """
+    Return the current catalog index, rebuilding it if it has been invalidated
+    or is older than CATALOG_INDEX_MAX_AGE seconds. The age limit bounds how
+    stale the index can get in other worker processes, which do not see this
+    process's invalidations.
+    """
+    global _index
+    max_age = current_app.config.get("CATALOG_INDEX_MAX_AGE", 300)
+    index = _index
+    if index is not None and time.monotonic() - index.built_at < max_age:
+        return index
+
+    with _index_lock:
+        index = _index
+        if index is None or time.monotonic() - index.built_at >= max_age:
+            generation = _generation
+            index = build_catalog_index()
+            if generation == _generation:
+                _index = index
+        return index
+
+
+def invalidate_catalog_index():
+    """Drop the cached index so the next lookup rebuilds it"""
+    global _index, _generation
+    _generation += 1
+    _index = None
+
+
+@data_events.on_commit
+def _invalidate_on_catalog_change(changes):
+    if changes.touches(Product.__table__.name, Promotion.__table__.name):
+        invalidate_catalog_index()
@@ -0,0 +1,367 @@
+"""
+"Customers who bought X also bought Y".
+
+ProductCoPurchase holds, for every product, its COPURCHASE_STORED_NEIGHBORS
+strongest neighbours: the products bought by the most customers who also
+bought it, with that number of customers. The table is bounded by products
+times that limit; full pair counts only exist transiently inside
+``flask recommendations rebuild-copurchases``, which recomputes the lists
+exactly.
+
+A flush hook keeps the lists current as purchases are inserted, moved or
+deleted. It derives the change in pair counts from the purchase history of
+the customers in the flush only, so its cost does not depend on the number
+of customers, and folds it into the stored lists like a Space-Saving
+summary: a neighbour that is not stored replaces the weakest one when the
+list is full and inherits its count. Stored counts may therefore
+overestimate between rebuilds, and the spare slots beyond
+COPURCHASE_NEIGHBORS keep the lists the index reads close to exact. Bulk
+writes wrap themselves in deferred_maintenance(), which skips the hook,
+marks the lists stale in the same transaction and rebuilds them once.
+
+Recommendations read a CoPurchaseIndex, an in-memory snapshot of the
+COPURCHASE_NEIGHBORS strongest neighbours of every product, and add an
+integer boost to products that neighbour several of the customer's
+purchases.
+"""
+from app import db
+from models import Purchase, ProductCoPurchase, AnalyticsCounter
+from utils import data_events
+from utils.db_utils import upsert_increment
+from flask import current_app, has_app_context
+from sqlalchemy import and_, bindparam, delete, func, insert, select
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import threading
+import time
+
+# Customer and product ids bound per IN (...) query
+CUSTOMER_CHUNK_SIZE = 5000
+# AnalyticsCounter row set while deferred bulk writes await a rebuild
+COPURCHASES_STALE = "copurchases_stale"
+
+_index = None
+_index_lock = threading.Lock()
+_deferred = threading.local()
+
+
+def _stored_neighbors():
+    if has_app_context():
+        return max(current_app.config.get("COPURCHASE_STORED_NEIGHBORS", 20), 1)
+    return 20
+
+
+def _owned_pairs_delta(before, after):
+    """Change in the ordered co-purchase pairs of one customer"""
+    pairs = {}
+    touched = before | after
+    for product_id in before ^ after:
+        for other_id in touched:
+            if other_id == product_id:
+                continue
+            delta = (other_id in after and product_id in after) - (other_id in before and product_id in before)
+            if delta:
+                pairs[(product_id, other_id)] = delta
+                pairs[(other_id, product_id)] = delta
+    return pairs
+
+
+def compute_pair_deltas(connection, changes):
+    """
+    Translate purchase changes into co-purchase count changes.
+
+    Purchase counts per (customer, product) are read on the given connection
+    after the flush; subtracting this flush's inserts and adding back its
+    deletes gives the state before it.
+
+    Returns:
+        Counter: (product_id, other_product_id) -> change in customer count
+    """
+    table = Purchase.__table__.name
+    added = Counter()
+    removed = Counter()
+    for row in changes.inserted.get(table, []):
+        added[(row.get("customer_id"), row.get("product_id"))] += 1
+    for row in changes.deleted.get(table, []):
+        removed[(row.get("customer_id"), row.get("product_id"))] += 1
+    for old, new in changes.updated.get(table, []):
+        old_key = (old.get("customer_id"), old.get("product_id"))
+        new_key = (new.get("customer_id"), new.get("product_id"))
+        if old_key != new_key:
+            removed[old_key] += 1
+            added[new_key] += 1
+
+    customer_ids = sorted({
+        customer_id for customer_id, product_id in list(added) + list(removed)
+        if customer_id is not None and product_id is not None
+    })
+    deltas = Counter()
+    if not customer_ids:
+        return deltas
+
+    current = Counter()
+    for start in range(0, len(customer_ids), CUSTOMER_CHUNK_SIZE):
+        chunk = customer_ids[start:start + CUSTOMER_CHUNK_SIZE]
+        for customer_id, product_id, count in connection.execute(
+            select(Purchase.customer_id, Purchase.product_id, func.count())
+            .where(Purchase.customer_id.in_(chunk))
+            .group_by(Purchase.customer_id, Purchase.product_id)
+        ):
+            current[(customer_id, product_id)] = count
+
+    owned_before = defaultdict(set)
+    owned_after = defaultdict(set)
+    for key in set(current) | set(added) | set(removed):
+        customer_id, product_id = key
+        if customer_id is None or product_id is None:
+            continue
+        if current[key] > 0:
+            owned_after[customer_id].add(product_id)
+        if current[key] - added[key] + removed[key] > 0:
+            owned_before[customer_id].add(product_id)
+
+    for customer_id in customer_ids:
+        deltas.update(_owned_pairs_delta(owned_before[customer_id], owned_after[customer_id]))
+    return deltas
+
+
+def _update_neighbors(stored, deltas, capacity):
+    """
+    Fold pair count changes into one product's stored neighbours.
+
+    Args:
+        stored (dict): Neighbour id -> count, updated in place
+        deltas (dict): Neighbour id -> change in customer count
+        capacity (int): Neighbours kept
+
+    Returns:
+        set: Neighbour ids whose row was removed or changed
+    """
+    changed = set()
+    for other_id, delta in sorted(deltas.items()):
+        if other_id in stored:
+            stored[other_id] += delta
+            if stored[other_id] <= 0:
+                del stored[other_id]
+        elif delta <= 0:
+            continue
+        elif len(stored) < capacity:
+            stored[other_id] = delta
+        else:
+            # Space-Saving: the newcomer takes the weakest slot and its count,
+            # an upper bound on what the newcomer's count could have been
+            weakest = min(stored.items(), key=lambda item: (item[1], -item[0]))
+            del stored[weakest[0]]
+            changed.add(weakest[0])
+            stored[other_id] = weakest[1] + delta
+        changed.add(other_id)
+    return changed
+
+
+def apply_pair_deltas(connection, deltas, capacity):
+    """
+    Fold pair count changes into the stored neighbour lists, rewriting only
+    the rows that changed.
+    """
+    by_product = defaultdict(dict)
+    for (product_id, other_id), delta in deltas.items():
+        if delta:
+            by_product[product_id][other_id] = delta
+    if not by_product:
+        return
+
+    table = ProductCoPurchase.__table__
+    product_ids = sorted(by_product)
+    stored = defaultdict(dict)
+    for start in range(0, len(product_ids), CUSTOMER_CHUNK_SIZE):
+        for product_id, other_id, count in connection.execute(
+            select(table.c.product_id, table.c.other_product_id, table.c.customer_count)
+            .where(table.c.product_id.in_(product_ids[start:start + CUSTOMER_CHUNK_SIZE]))
+            .with_for_update()
+        ):
+            stored[product_id][other_id] = count
+
+    removed, written = [], []
+    for product_id in product_ids:
+        neighbors = stored[product_id]
+        for other_id in _update_neighbors(neighbors, by_product[product_id], capacity):
+            removed.append({"b_product_id": product_id, "b_other_product_id": other_id})
+            if other_id in neighbors:
+                written.append({"product_id": product_id, "other_product_id": other_id,
+                                "customer_count": neighbors[other_id]})
+    if removed:
+        connection.execute(delete(table).where(
+            table.c.product_id == bindparam("b_product_id"),
+            table.c.other_product_id == bindparam("b_other_product_id")
+        ), removed)
+    if written:
+        connection.execute(insert(table), written)
+
+
+def _mark_stale(connection):
+    upsert_increment(connection, AnalyticsCounter.__table__, ["name"], [
+        {"name": COPURCHASES_STALE, "value": 1}
+    ])
+
+
+@data_events.on_flush
+def _maintain_copurchases(connection, changes):
+    if not changes.touches(Purchase.__table__.name):
+        return
+    if getattr(_deferred, "active", False):
+        _mark_stale(connection)
+        return
+    apply_pair_deltas(connection, compute_pair_deltas(connection, changes), _stored_neighbors())
+
+
+@contextmanager
+def deferred_maintenance():
+    """
+    Skip the per-flush neighbour maintenance for the bulk writes made in
+    this thread. Their transactions mark the lists stale instead, and the
+    lists are rebuilt once when the block exits; if it raises, they stay
+    marked and the next rebuild (or ``flask db upgrade``) catches up.
+    """
+    outer = getattr(_deferred, "active", False)
+    _deferred.active = True
+    try:
+        yield
+    finally:
+        _deferred.active = outer
+    if not outer and _is_stale():
+        rebuild_copurchases()
+
+
+def _is_stale():
+    return bool(db.session.query(AnalyticsCounter.value).filter_by(name=COPURCHASES_STALE).scalar())
+
+
+def rebuild_copurchases():
+    """
+    Recompute every product's strongest neighbours from the Purchase table
+    in one transaction. The full pair counts exist only inside the query.
+    """
+    owned = select(Purchase.customer_id, Purchase.product_id).distinct().subquery()
+    first, second = owned.alias("first"), owned.alias("second")
+    counts = (
+        select(first.c.product_id, second.c.product_id.label("other_product_id"),
+               func.count().label("customer_count"))
+        .select_from(first.join(second, and_(
+            first.c.customer_id == second.c.customer_id,
+            first.c.product_id != second.c.product_id
+        )))
+        .group_by(first.c.product_id, second.c.product_id)
+        .subquery()
+    )
+    rank = func.row_number().over(
+        partition_by=counts.c.product_id,
+        order_by=(counts.c.customer_count.desc(), counts.c.other_product_id)
+    ).label("rank")
+    ranked = select(counts.c.product_id, counts.c.other_product_id, counts.c.customer_count, rank).subquery()
+
+    db.session.execute(delete(ProductCoPurchase.__table__))
+    db.session.execute(insert(ProductCoPurchase.__table__).from_select(
+        ["product_id", "other_product_id", "customer_count"],
+        select(ranked.c.product_id, ranked.c.other_product_id, ranked.c.customer_count)
+        .where(ranked.c.rank <= _stored_neighbors())
+    ))
+    db.session.execute(delete(AnalyticsCounter.__table__).where(AnalyticsCounter.name == COPURCHASES_STALE))
+    db.session.commit()
+
+
+def ensure_copurchases():
+    """
+    Build the neighbour lists for databases created before they existed,
+    left stale by an interrupted bulk write, or holding more neighbours per
+    product than COPURCHASE_STORED_NEIGHBORS (full pair tables written by
+    earlier versions)
+    """
+    if db.session.query(ProductCoPurchase.product_id).first() is None:
+        needed = db.session.query(Purchase.id).first() is not None
+    else:
+        needed = _is_stale() or db.session.query(ProductCoPurchase.product_id).group_by(
+            ProductCoPurchase.product_id
+        ).having(func.count() > _stored_neighbors()).first() is not None
+    if needed:
+        rebuild_copurchases()
+
+
+class CoPurchaseIndex:
+    """
+    Process-local snapshot of every product's strongest co-purchase neighbours.
+    """
+
+    def __init__(self, rows):
+        """
+        Args:
+            rows: (product_id, other_product_id) pairs, strongest first per product
+        """
+        self.built_at = time.monotonic()
+        neighbors = defaultdict(list)
+        for product_id, other_id in rows:
+            neighbors[product_id].append(other_id)
+        # product id -> neighbour product ids, strongest first
+        self.neighbors = {product_id: tuple(others) for product_id, others in neighbors.items()}
+
+    def boosts(self, purchased_product_ids, max_boost):
+        """
+        Co-purchase boost of the products a customer has not bought yet: one
+        point per purchased product they are a neighbour of, capped at max_boost.
+
+        Returns:
+            dict: product id -> boost (only products with a positive boost)
+        """
+        if max_boost <= 0:
+            return {}
+        counts = Counter()
+        for product_id in purchased_product_ids:
+            counts.update(self.neighbors.get(product_id, ()))
+        return {
+            product_id: min(count, max_boost)
+            for product_id, count in counts.items()
+            if product_id not in purchased_product_ids
+        }
+
+
+def build_copurchase_index():
+    """Load the top COPURCHASE_NEIGHBORS neighbours of every product"""
+    config = current_app.config
+    limit = config.get("COPURCHASE_NEIGHBORS", 10)
+    rows = db.session.execute(
+        select(ProductCoPurchase.product_id, ProductCoPurchase.other_product_id)
+        .where(ProductCoPurchase.customer_count >= max(config.get("COPURCHASE_MIN_CUSTOMERS", 2), 1))
+        .order_by(ProductCoPurchase.product_id, ProductCoPurchase.customer_count.desc(),
+                  ProductCoPurchase.other_product_id)
+    )
+    kept = Counter()
+    strongest = []
+    for product_id, other_id in rows:
+        if kept[product_id] < limit:
+            kept[product_id] += 1
+            strongest.append((product_id, other_id))
+    return CoPurchaseIndex(strongest)
+
+
+def get_copurchase_index():
+    """
+    Return the neighbour index, rebuilding it when it is older than
+    COPURCHASE_INDEX_MAX_AGE seconds. Co-purchase statistics drift slowly,
+    so purchases do not invalidate it.
+    """
+    global _index
+    max_age = current_app.config.get("COPURCHASE_INDEX_MAX_AGE", 300)
+    index = _index
+    if index is not None and time.monotonic() - index.built_at < max_age:
+        return index
+
+    with _index_lock:
+        index = _index
+        if index is None or time.monotonic() - index.built_at >= max_age:
+            index = _index = build_copurchase_index()
+        return index
+
+
+def invalidate_copurchase_index():
+    """Drop the cached neighbour index so the next lookup rebuilds it"""
+    global _index
+    _index = None
@@ -0,0 +1,157 @@
+from collections import defaultdict
+import logging
+import threading
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_SESSION_KEY = "data_events.changes"
+
+_flush_hooks = []
+_commit_subscribers = []
+_subscribers_lock = threading.Lock()
+
+
+class ChangeSet:
+    """
+    Row-level summary of the writes made by a flush or a committed transaction.
+
+    Rows are plain dicts of column values captured at flush time, so they stay
+    readable after the session has expired its instances on commit.
+    """
+
+    def __init__(self):
+        self.inserted = defaultdict(list)  # table name -> [row]
+        self.updated = defaultdict(list)   # table name -> [(old row, new row)]
+        self.deleted = defaultdict(list)   # table name -> [row]
+
+    @property
+    def tables(self):
+        """Names of every table touched by this change set"""
+        return set(self.inserted) | set(self.updated) | set(self.deleted)
+
+    def touches(self, *table_names):
+        return not self.tables.isdisjoint(table_names)
+
+    def merge(self, other):
+        for table, rows in other.inserted.items():
+            self.inserted[table].extend(rows)
+        for table, rows in other.updated.items():
+            self.updated[table].extend(rows)
+        for table, rows in other.deleted.items():
+            self.deleted[table].extend(rows)
+
+    def __bool__(self):
+        return bool(self.inserted or self.updated or self.deleted)
+
+
+def on_flush(callback):
+    """
+    Register a hook invoked with (connection, ChangeSet) after every flush,
+    inside the flushing transaction. Hooks may issue Core statements on the
+    connection; their writes commit or roll back together with the flush.
+    Usable as a decorator.
+    """
+    with _subscribers_lock:
+        _flush_hooks.append(callback)
+    return callback
+
+
+def run_flush_hooks(connection, changes):
+    """
+    Apply in-transaction hooks for writes made outside the ORM unit of work.
+
+    Bulk write paths build a ChangeSet describing the rows they wrote and call
+    this before committing, then call publish() after the commit.
+    """
+    if not changes:
+        return
+    for callback in list(_flush_hooks):
+        callback(connection, changes)
+
+
+def on_commit(callback):
+    """
+    Register a callback invoked with the ChangeSet of every committed
+    transaction. Usable as a decorator.
+    """
+    with _subscribers_lock:
+        _commit_subscribers.append(callback)
+    return callback
+
+
+def publish(changes):
+    """
+    Notify commit subscribers about a ChangeSet.
+
+    Called automatically for ORM sessions; bulk write paths that bypass the
+    unit of work (Core inserts, executemany) call it after their own commit.
+    """
+    if not changes:
+        return
+    for callback in list(_commit_subscribers):
+        try:
+            callback(changes)
+        except Exception:
+            logger.exception("Error in commit subscriber %r", callback)
+
+
+def _snapshot(state):
+    """Loaded column values of an instance, without triggering lazy loads"""
+    mapper = state.mapper
+    return {
+        attr.key: state.dict[attr.key]
+        for attr in mapper.column_attrs
+        if attr.key in state.dict
+    }
+
+
+def _previous_snapshot(state):
+    row = _snapshot(state)
+    for attr in state.mapper.column_attrs:
+        history = state.attrs[attr.key].history
+        if history.deleted:
+            row[attr.key] = history.deleted[0]
+    return row
+
+
+def _pending_changes(session):
+    changes = session.info.get(_SESSION_KEY)
+    if changes is None:
+        changes = session.info[_SESSION_KEY] = ChangeSet()
+    return changes
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flush(session, flush_context):
+    changes = ChangeSet()
+    for obj in session.new:
+        state = inspect(obj)
+        changes.inserted[state.mapper.local_table.name].append(_snapshot(state))
+    for obj in session.dirty:
+        if not session.is_modified(obj, include_collections=False):
+            continue
+        state = inspect(obj)
+        changes.updated[state.mapper.local_table.name].append(
+            (_previous_snapshot(state), _snapshot(state))
+        )
+    for obj in session.deleted:
+        state = inspect(obj)
+        changes.deleted[state.mapper.local_table.name].append(_previous_snapshot(state))
+
+    if changes:
+        run_flush_hooks(session.connection(), changes)
+        _pending_changes(session).merge(changes)
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_commit(session):
+    changes = session.info.pop(_SESSION_KEY, None)
+    publish(changes)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
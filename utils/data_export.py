@@ -0,0 +1,156 @@
+from models import Customer, Product, Purchase, Interaction
+from utils.db_utils import report_session
+from sqlalchemy import select
+import csv
+import datetime
+import io
+import json
+
+# Rows fetched per round trip; with yield_per the driver streams results
+# (server-side cursor on PostgreSQL) instead of buffering the whole result
+EXPORT_BATCH_SIZE = 2000
+
+PURCHASE_FIELDS = [
+    "purchase_id", "customer_id", "customer_email", "product_id",
+    "product_name", "product_category", "amount", "purchase_date"
+]
+INTERACTION_FIELDS = [
+    "interaction_id", "customer_id", "customer_email", "agent_id",
+    "interaction_type", "notes", "recommendations", "created_at"
+]
+
+
+def parse_export_date(value):
+    """
+    Parse a from/to filter given as an ISO date or datetime.
+
+    Stored timestamps are naive UTC, so values with an offset (or ``Z``)
+    are converted to UTC and made naive.
+
+    Returns:
+        datetime: The parsed value, or None if value is empty
+
+    Raises:
+        ValueError: If value is not an ISO date or datetime
+    """
+    if not value:
+        return None
+    value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def iter_purchases(customer_id=None, start=None, end=None):
+    """
+    Stream purchases with their product and customer details in ID order.
+
+    Args:
+        customer_id (int): Only export this customer's purchases
+        start (datetime): Only purchases on or after this time
+        end (datetime): Only purchases before this time
+
+    Yields:
+        dict: One purchase record keyed by PURCHASE_FIELDS
+    """
+    query = select(
+        Purchase.id, Purchase.customer_id, Customer.email, Purchase.product_id,
+        Product.name, Product.category, Purchase.amount, Purchase.purchase_date
+    ).join(Product, Purchase.product_id == Product.id) \
+     .join(Customer, Purchase.customer_id == Customer.id)
+
+    if customer_id is not None:
+        query = query.where(Purchase.customer_id == customer_id)
+    if start is not None:
+        query = query.where(Purchase.purchase_date >= start)
+    if end is not None:
+        query = query.where(Purchase.purchase_date < end)
+
+    with report_session() as session:
+        result = session.execute(
+            query.order_by(Purchase.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        for row in result:
+            yield dict(zip(PURCHASE_FIELDS, row))
+
+
+def iter_interactions(customer_id=None, start=None, end=None):
+    """
+    Stream interactions with the customer's email in ID order.
+
+    Args:
+        customer_id (int): Only export this customer's interactions
+        start (datetime): Only interactions created on or after this time
+        end (datetime): Only interactions created before this time
+
+    Yields:
+        dict: One interaction record keyed by INTERACTION_FIELDS
+    """
+    query = select(
+        Interaction.id, Interaction.customer_id, Customer.email, Interaction.agent_id,
+        Interaction.interaction_type, Interaction.notes, Interaction.recommendations,
+        Interaction.created_at
+    ).join(Customer, Interaction.customer_id == Customer.id)
+
+    if customer_id is not None:
+        query = query.where(Interaction.customer_id == customer_id)
+    if start is not None:
+        query = query.where(Interaction.created_at >= start)
+    if end is not None:
+        query = query.where(Interaction.created_at < end)
+
+    with report_session() as session:
+        result = session.execute(
+            query.order_by(Interaction.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        )
+        for row in result:
+            yield dict(zip(INTERACTION_FIELDS, row))
+
+
+def _serializable(value):
+    return value.isoformat() if isinstance(value, datetime.datetime) else value
+
+
+def to_ndjson(records):
+    """Encode records as newline-delimited JSON, one line at a time"""
+    for record in records:
+        yield json.dumps({key: _serializable(value) for key, value in record.items()}) + "\n"
+
+
+def to_csv(records, fields):
+    """Encode records as CSV with a header row, one line at a time"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=fields)
+    writer.writeheader()
+    for record in records:
+        writer.writerow({key: _serializable(value) for key, value in record.items()})
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+# name -> (record iterator, CSV columns)
+EXPORTS = {
+    "purchases": (iter_purchases, PURCHASE_FIELDS),
+    "interactions": (iter_interactions, INTERACTION_FIELDS),
+}
+
+
+def export_lines(name, file_format="ndjson", customer_id=None, start=None, end=None):
+    """
+    Stream an export as encoded lines.
+
+    Args:
+        name (str): One of EXPORTS
+        file_format (str): "ndjson" or "csv"
+
+    Returns:
+        generator: Encoded chunks of the export
+    """
+    iter_records, fields = EXPORTS[name]
+    records = iter_records(customer_id=customer_id, start=start, end=end)
+    if file_format == "csv":
+        return to_csv(records, fields)
+    return to_ndjson(records)
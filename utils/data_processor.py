@@ -1,26 +1,153 @@
 from app import db
-from models import Customer, Product, Purchase, Interaction, CustomerPreference
-from sqlalchemy import func, desc
+from models import (
+    Customer, Product, Purchase, Interaction, CustomerPreference,
+    AnalyticsCounter, CategoryPurchaseRollup, ProductPurchaseRollup,
+    InteractionTypeRollup, PreferenceRollup
+)
+from utils import analytics_rollups
+from utils.db_utils import report_session
+from utils.segment_sketches import get_segment_analytics
+from sqlalchemy import func, desc, and_, or_
+import logging
+
+logger = logging.getLogger(__name__)
 
 def get_customer_analytics():
     """
     Generate analytics about customer data, interactions and purchases
     
+    Reads the incrementally maintained rollup tables; falls back to
+    aggregating the base tables if the rollups have not been built yet.
+    Segment figures (distinct customers, top products over a recent
+    window) are estimates read from the sketch tables.
+    
+    Returns:
+        dict: Analytics data about customers, products and interactions
+    """
+    with report_session() as session:
+        analytics = _rollup_customer_analytics(session)
+        analytics["segments"] = _segment_analytics(session)
+        return analytics
+
+def get_rollup_analytics():
+    """
+    The customer analytics without the segment figures: totals, categories,
+    preferences, interaction types and best sellers
+    
+    Returns:
+        dict: The same keys as get_customer_analytics() except "segments"
+    """
+    with report_session() as session:
+        return _rollup_customer_analytics(session)
+
+def get_analytics_segments():
+    """
+    The segment figures of the customer analytics, read from the sketch tables
+    
+    Returns:
+        dict: The "segments" section of get_customer_analytics()
+    """
+    with report_session() as session:
+        return _segment_analytics(session)
+
+def _rollup_customer_analytics(session):
+    try:
+        counters = dict(session.query(AnalyticsCounter.name, AnalyticsCounter.value).all())
+        if not counters.get(analytics_rollups.ROLLUPS_BUILT):
+            return _aggregate_customer_analytics(session)
+        
+        popular_categories = session.query(
+            CategoryPurchaseRollup.category,
+            CategoryPurchaseRollup.purchase_count
+        ).filter(CategoryPurchaseRollup.purchase_count > 0) \
+         .order_by(desc(CategoryPurchaseRollup.purchase_count)) \
+         .all()
+        
+        preference_data = sorted(
+            (
+                (category, level_sum / level_count)
+                for category, level_sum, level_count in session.query(
+                    PreferenceRollup.category,
+                    PreferenceRollup.level_sum,
+                    PreferenceRollup.level_count
+                ).filter(PreferenceRollup.level_count > 0)
+            ),
+            key=lambda item: item[1],
+            reverse=True
+        )
+        
+        interaction_types = session.query(
+            InteractionTypeRollup.interaction_type,
+            InteractionTypeRollup.interaction_count
+        ).filter(InteractionTypeRollup.interaction_count > 0) \
+         .order_by(desc(InteractionTypeRollup.interaction_count)) \
+         .all()
+        
+        best_sellers = session.query(
+            Product.id,
+            Product.name,
+            ProductPurchaseRollup.purchase_count
+        ).join(Product, ProductPurchaseRollup.product_id == Product.id) \
+         .filter(ProductPurchaseRollup.purchase_count > 0) \
+         .order_by(desc(ProductPurchaseRollup.purchase_count)) \
+         .limit(5) \
+         .all()
+        
+        return {
+            "total_customers": counters.get(analytics_rollups.CUSTOMERS, 0),
+            "total_products_sold": counters.get(analytics_rollups.PURCHASES, 0),
+            "total_interactions": counters.get(analytics_rollups.INTERACTIONS, 0),
+            "popular_categories": [
+                {"category": analytics_rollups.from_key(cat), "count": count}
+                for cat, count in popular_categories
+            ],
+            "preference_data": [
+                {"category": analytics_rollups.from_key(cat), "average": float(avg)}
+                for cat, avg in preference_data
+            ],
+            "interaction_types": [
+                {"type": analytics_rollups.from_key(itype), "count": count}
+                for itype, count in interaction_types
+            ],
+            "best_sellers": [
+                {"id": pid, "name": name, "count": count}
+                for pid, name, count in best_sellers
+            ]
+        }
+        
+    except Exception as e:
+        logger.exception("Error generating analytics")
+        return _empty_analytics()
+
+def _segment_analytics(session):
+    try:
+        return get_segment_analytics(session)
+    except Exception as e:
+        logger.exception("Error generating segment analytics")
+        return _empty_segments()
+
+def _aggregate_customer_analytics(session):
+    """
+    Compute analytics by aggregating the base tables directly
+    
+    Args:
+        session: Session to run the aggregations on
+    
     Returns:
         dict: Analytics data about customers, products and interactions
     """
     try:
         # Total customers
-        total_customers = Customer.query.count()
+        total_customers = session.query(Customer).count()
         
         # Total products sold
-        total_products_sold = Purchase.query.count()
+        total_products_sold = session.query(Purchase).count()
         
         # Total interactions
-        total_interactions = Interaction.query.count()
+        total_interactions = session.query(Interaction).count()
         
         # Most popular product categories (based on purchases)
-        popular_categories = db.session.query(
+        popular_categories = session.query(
             Product.category, 
             func.count(Purchase.id).label('purchase_count')
         ).join(Purchase, Purchase.product_id == Product.id) \
@@ -29,7 +156,7 @@ def get_customer_analytics():
          .all()
          
         # Customer preferences by category
-        preference_data = db.session.query(
+        preference_data = session.query(
             CustomerPreference.category,
             func.avg(CustomerPreference.preference_level).label('avg_preference')
         ).group_by(CustomerPreference.category) \
@@ -37,7 +164,7 @@ def get_customer_analytics():
          .all()
         
         # Most common interaction types
-        interaction_types = db.session.query(
+        interaction_types = session.query(
             Interaction.interaction_type,
             func.count(Interaction.id).label('count')
         ).group_by(Interaction.interaction_type) \
@@ -45,7 +172,7 @@ def get_customer_analytics():
          .all()
         
         # Best selling products
-        best_sellers = db.session.query(
+        best_sellers = session.query(
             Product.id,
             Product.name,
             func.count(Purchase.id).label('purchase_count')
@@ -81,16 +208,28 @@ def get_customer_analytics():
         return analytics
         
     except Exception as e:
-        print(f"Error generating analytics: {str(e)}")
-        return {
-            "total_customers": 0,
-            "total_products_sold": 0,
-            "total_interactions": 0,
-            "popular_categories": [],
-            "preference_data": [],
-            "interaction_types": [],
-            "best_sellers": []
-        }
+        logger.exception("Error generating analytics")
+        return _empty_analytics()
+
+def _empty_analytics():
+    return {
+        "total_customers": 0,
+        "total_products_sold": 0,
+        "total_interactions": 0,
+        "popular_categories": [],
+        "preference_data": [],
+        "interaction_types": [],
+        "best_sellers": []
+    }
+
+def _empty_segments():
+    return {
+        "window_days": 0,
+        "category_customers": [],
+        "product_customers": [],
+        "agent_customers": [],
+        "top_products": []
+    }
 
 def get_customer_purchases(customer_id):
     """
@@ -121,5 +260,50 @@ def get_customer_purchases(customer_id):
             for p, prod in purchases
         ]
     except Exception as e:
-        print(f"Error getting customer purchases: {str(e)}")
+        logger.exception("Error getting customer purchases")
         return []
+
+def get_customer_page(after_id=None, search=None, limit=25):
+    """
+    Get one page of customers using keyset pagination on Customer.id
+    
+    Args:
+        after_id (int): Return customers with an ID greater than this cursor
+        search (str): Optional case-insensitive prefix matched against first
+            name, last name and email
+        limit (int): Maximum number of customers to return
+        
+    Returns:
+        tuple: (list of Customer objects, cursor for the next page or None)
+    """
+    query = Customer.query
+    
+    if after_id is not None:
+        query = query.filter(Customer.id > after_id)
+    
+    prefix = (search or "").strip().lower()
+    if prefix:
+        # A range on lower(column) can use the expression indexes, unlike LIKE 'x%'
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        query = query.filter(or_(*(
+            and_(func.lower(column) >= prefix, func.lower(column) < upper)
+            for column in (Customer.first_name, Customer.last_name, Customer.email)
+        )))
+    
+    customers = query.order_by(Customer.id).limit(limit + 1).all()
+    next_cursor = customers[limit - 1].id if len(customers) > limit else None
+    return customers[:limit], next_cursor
+
+def get_total_customers():
+    """
+    Get the number of customers, from the analytics rollups when available
+    
+    Returns:
+        int: Number of customers
+    """
+    counters = dict(db.session.query(AnalyticsCounter.name, AnalyticsCounter.value).filter(
+        AnalyticsCounter.name.in_([analytics_rollups.CUSTOMERS, analytics_rollups.ROLLUPS_BUILT])
+    ).all())
+    if counters.get(analytics_rollups.ROLLUPS_BUILT):
+        return counters.get(analytics_rollups.CUSTOMERS, 0)
+    return Customer.query.count()
@@ -0,0 +1,76 @@
+"""
+Version numbers of the data behind cached page fragments.
+
+Read a version before loading the data it covers: a write landing in
+between then leaves the fragment cached under a version nobody asks for
+again, instead of caching new data under an old version.
+"""
+from app import db
+from models import Customer, Purchase, Interaction, CustomerPreference, AnalyticsCounter, CustomerDataVersion
+from utils import data_events
+from utils.analytics_rollups import VERSION, ROLLUPS_BUILT
+from utils.db_utils import upsert_increment, report_session
+
+_CUSTOMER_TABLES = {model.__table__.name for model in (Purchase, Interaction, CustomerPreference)}
+
+
+def changed_customer_ids(changes):
+    """Ids of the customers whose own row or purchases, interactions or preferences changed"""
+    customer_ids = set()
+    customer_table = Customer.__table__.name
+    for table in changes.tables & (_CUSTOMER_TABLES | {customer_table}):
+        column = "id" if table == customer_table else "customer_id"
+        rows = changes.inserted.get(table, []) + changes.deleted.get(table, [])
+        rows += [row for pair in changes.updated.get(table, []) for row in pair]
+        customer_ids.update(row.get(column) for row in rows)
+    customer_ids.discard(None)
+    return customer_ids
+
+
+@data_events.on_flush
+def _bump_customer_versions(connection, changes):
+    upsert_increment(connection, CustomerDataVersion.__table__, ["customer_id"], [
+        {"customer_id": customer_id, "version": 1}
+        for customer_id in sorted(changed_customer_ids(changes))
+    ])
+
+
+def bump_customer_versions(customer_ids, chunk_size=10000):
+    """
+    Invalidate the cached fragments of customers whose data was written
+    around the ORM (Core INSERTs do not run the flush hooks).
+
+    Args:
+        customer_ids (iterable): Ids of the customers whose data changed
+        chunk_size (int): Customers per upsert
+    """
+    customer_ids = sorted(set(customer_ids))
+    connection = db.session.connection()
+    for start in range(0, len(customer_ids), chunk_size):
+        upsert_increment(connection, CustomerDataVersion.__table__, ["customer_id"], [
+            {"customer_id": customer_id, "version": 1}
+            for customer_id in customer_ids[start:start + chunk_size]
+        ])
+    db.session.commit()
+
+
+def customer_version(customer_id):
+    """Current data version of one customer (0 if never changed through the app)"""
+    return db.session.query(CustomerDataVersion.version).filter_by(customer_id=customer_id).scalar() or 0
+
+
+def analytics_version():
+    """
+    Current analytics rollup version, read where the analytics are read.
+
+    Returns:
+        int: The version, or None while the rollups have not been built (the
+            analytics are then aggregated from the base tables, unversioned)
+    """
+    with report_session() as session:
+        counters = dict(session.query(AnalyticsCounter.name, AnalyticsCounter.value).filter(
+            AnalyticsCounter.name.in_([VERSION, ROLLUPS_BUILT])
+        ).all())
+    if not counters.get(ROLLUPS_BUILT):
+        return None
+    return counters.get(VERSION, 0)
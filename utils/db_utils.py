@@ -0,0 +1,66 @@
+from app import db
+from utils.engine_profiles import REPORTS_BIND
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+from contextlib import contextmanager
+
+
+def upsert_increment(connection, table, key_columns, rows):
+    """
+    Add deltas to counter rows, creating rows that do not exist yet.
+
+    Uses INSERT ... ON CONFLICT DO UPDATE on SQLite and PostgreSQL so the
+    whole batch is one executemany; other backends fall back to UPDATE then
+    INSERT per row.
+
+    Args:
+        connection: Connection to run the statements on
+        table (Table): Table holding the counters
+        key_columns (list): Names of the primary key columns
+        rows (list): Dicts holding the key columns and the delta of each counter
+            column; every row must carry the same columns and a distinct key
+    """
+    if not rows:
+        return
+    value_columns = [column for column in rows[0] if column not in key_columns]
+
+    dialect = connection.dialect.name
+    if dialect in ("sqlite", "postgresql"):
+        # Dialect modules are imported on first use, PostgreSQL's is slow to import
+        if dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        stmt = dialect_insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=key_columns,
+            set_={column: table.c[column] + stmt.excluded[column] for column in value_columns}
+        )
+        connection.execute(stmt, rows)
+        return
+
+    for row in rows:
+        result = connection.execute(
+            update(table)
+            .where(*(table.c[column] == row[column] for column in key_columns))
+            .values({column: table.c[column] + row[column] for column in value_columns})
+        )
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(row))
+
+
+@contextmanager
+def report_session():
+    """
+    Session for analytics and report queries.
+
+    Uses the read-only engine when READ_DATABASE_URL is configured, so long
+    aggregations and exports stay off the primary; otherwise yields the
+    regular db.session. A replica may lag slightly behind the primary.
+    """
+    engine = db.engines.get(REPORTS_BIND)
+    if engine is None:
+        yield db.session
+        return
+    with Session(engine) as session:
+        yield session
@@ -0,0 +1,95 @@
+"""
+Backend-aware engine options.
+
+Each backend gets the pool and connection settings that suit it instead of
+one set of options for all of them; every value can be overridden through
+the environment.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+import os
+
+# Bind name of the optional read-only engine used for analytics and reports
+REPORTS_BIND = "reports"
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+def sqlite_pragmas(read_only=False):
+    """PRAGMA statements run on every new SQLite connection, in order"""
+    if read_only:
+        # Switching the journal mode is a write; the writing engine takes care of it
+        pragmas = ["PRAGMA query_only=1"]
+    else:
+        # Readers no longer block the writer (and vice versa); persistent in the file
+        pragmas = ["PRAGMA journal_mode=WAL"]
+    return pragmas + [
+        # Safe with WAL: a power loss can only drop the last commits, not corrupt the file
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={_env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)}",
+        f"PRAGMA mmap_size={_env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)}",
+        # Negative values are in KiB rather than pages
+        f"PRAGMA cache_size=-{_env_int('SQLITE_CACHE_SIZE_KB', 64 * 1024)}",
+    ]
+
+
+def engine_options(url, read_only=False):
+    """
+    Engine options for a database URL.
+
+    SQLite connections are local, so there is nothing to recycle or ping;
+    their pragmas are applied by configure_engine(). PostgreSQL gets an
+    explicitly sized pool and a server-side statement timeout (and read-only
+    transactions for the reports engine) instead of a pre-ping round trip on
+    every checkout. Other backends keep conservative generic settings.
+
+    Args:
+        url (str): Database URL
+        read_only (bool): Options for the read-only reports engine
+
+    Returns:
+        dict: Keyword arguments for create_engine()
+    """
+    backend = make_url(url).get_backend_name()
+
+    if backend == "sqlite":
+        return {}
+
+    if backend == "postgresql":
+        timeout_setting = "READ_STATEMENT_TIMEOUT_MS" if read_only else "DB_STATEMENT_TIMEOUT_MS"
+        server_options = f"-c statement_timeout={_env_int(timeout_setting, 30000)}"
+        if read_only:
+            server_options += " -c default_transaction_read_only=on"
+        return {
+            "pool_size": _env_int("DB_POOL_SIZE", 10),
+            "max_overflow": _env_int("DB_MAX_OVERFLOW", 20),
+            "pool_timeout": _env_int("DB_POOL_TIMEOUT", 10),
+            # Only closes connections idle servers or proxies would drop anyway
+            "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+            "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "0") == "1",
+            "connect_args": {"options": server_options},
+        }
+
+    return {
+        "pool_recycle": 300,
+        "pool_pre_ping": True,
+    }
+
+
+def configure_engine(engine, read_only=False):
+    """Install per-connection setup (SQLite pragmas) on an engine"""
+    if engine.dialect.name != "sqlite":
+        return
+
+    pragmas = sqlite_pragmas(read_only)
+
+    @event.listens_for(engine, "connect")
+    def _apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
@@ -0,0 +1,81 @@
+"""
+Template fragment caching.
+
+``{% cache "name", key_part, ... %} ... {% endcache %}`` stores the rendered
+markup of its body in the response cache backend under the template name,
+the fragment name and the key parts. Key parts are data versions (the
+analytics rollup version, a customer's data version, a digest of the
+values rendered), so a fragment is only rendered again after a write that
+changes what it shows; there is nothing to invalidate. A key part of None
+renders the body without caching.
+"""
+from flask import current_app
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+import hashlib
+import json
+import threading
+
+
+class FragmentCacheStats:
+    """Hit and miss counts of this process, exposed on /metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+fragment_stats = FragmentCacheStats()
+
+
+def fragment_digest(value):
+    """Short stable digest of JSON-serializable data, for use as a key part"""
+    encoded = json.dumps(value, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(encoded.encode()).hexdigest()[:16]
+
+
+class FragmentCacheExtension(Extension):
+    tags = {"cache"}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const(parser.name or ""), parser.parse_expression()]
+        parts = []
+        while parser.stream.skip_if("comma"):
+            parts.append(parser.parse_expression())
+        args.append(nodes.List(parts))
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        return nodes.CallBlock(
+            self.call_method("_render_fragment", args), [], [], body
+        ).set_lineno(lineno)
+
+    def _render_fragment(self, template_name, name, parts, caller):
+        ttl = current_app.config.get("FRAGMENT_CACHE_TTL", 3600)
+        if ttl <= 0 or any(part is None for part in parts):
+            return caller()
+
+        # Imported here: this module is loaded by create_app, before the models
+        from utils.response_cache import response_cache
+
+        key = "fragment:" + ":".join(str(part) for part in (template_name, name, *parts))
+        backend = response_cache.backend
+        markup = backend.get(key)
+        fragment_stats.record(markup is not None)
+        if markup is None:
+            markup = str(caller())
+            backend.set(key, markup, ttl)
+        return Markup(markup)
+
+
+def init_fragment_cache(app):
+    """Enable the {% cache %} tag in app's templates"""
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,248 @@
+"""
+Per-request SQL and latency instrumentation.
+
+Every request gets a RequestTiming on ``flask.g`` that engine events fill
+with query counts and durations, template signals with render time and
+timed() blocks with named sections such as "recommendation". The breakdown
+is returned in a Server-Timing header and aggregated into per-route
+Prometheus metrics served from /metrics. Metrics are per process; scrape
+every worker (or run one worker per scrape target).
+"""
+from flask import g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from collections import defaultdict
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds of the queries-per-request histogram buckets
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class RequestTiming:
+    """Time spent per section of one request, in seconds"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.sections = defaultdict(float)
+
+    def add(self, section, seconds):
+        self.sections[section] += seconds
+
+    def server_timing(self, total):
+        """Value of the Server-Timing header"""
+        parts = [f'db;dur={self.sections["db"] * 1000:.1f};desc="{self.query_count} queries"']
+        parts += [
+            f"{section};dur={seconds * 1000:.1f}"
+            for section, seconds in self.sections.items() if section != "db"
+        ]
+        parts.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(parts)
+
+
+def current_timing():
+    """The RequestTiming of the current request, or None outside requests"""
+    if not has_request_context():
+        return None
+    return g.get("request_timing")
+
+
+@contextmanager
+def timed(section):
+    """Add the time spent in the block to a named Server-Timing section"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing = current_timing()
+        if timing is not None:
+            timing.add(section, time.perf_counter() - started)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram with one series per label set"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total = self.series.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        counts[-1] += 1
+        self.series[labels] = (counts, total + value)
+
+    def render(self, name, help_text, label_names):
+        lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for labels, (counts, total) in sorted(self.series.items()):
+            label_text = ",".join(f'{key}="{_escape(value)}"' for key, value in zip(label_names, labels))
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {counts[-1]}')
+            lines.append(f"{name}_sum{{{label_text}}} {total}")
+            lines.append(f"{name}_count{{{label_text}}} {counts[-1]}")
+        return lines
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metrics:
+    """Process-wide request and query metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.query_counts = Histogram(QUERY_COUNT_BUCKETS)
+        self.requests = defaultdict(int)
+        self.slow_queries = 0
+
+    def observe_request(self, route, method, status, timing, total):
+        with self._lock:
+            self.requests[(route, method, str(status))] += 1
+            self.latency.observe((route, method), total)
+            self.db_time.observe((route, method), timing.sections["db"])
+            self.query_counts.observe((route, method), timing.query_count)
+
+    def observe_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def render(self):
+        from utils.response_cache import response_cache
+        from utils.fragment_cache import fragment_stats
+
+        with self._lock:
+            lines = ["# HELP http_requests_total Requests handled", "# TYPE http_requests_total counter"]
+            for (route, method, status), count in sorted(self.requests.items()):
+                lines.append(
+                    f'http_requests_total{{route="{_escape(route)}",method="{method}",status="{status}"}} {count}'
+                )
+            labels = ("route", "method")
+            lines += self.latency.render(
+                "http_request_duration_seconds", "Request latency", labels)
+            lines += self.db_time.render(
+                "http_request_db_seconds", "Time spent in SQL per request", labels)
+            lines += self.query_counts.render(
+                "http_request_db_queries", "SQL statements per request", labels)
+            lines += [
+                "# HELP db_slow_queries_total Statements slower than SLOW_QUERY_MS",
+                "# TYPE db_slow_queries_total counter",
+                f"db_slow_queries_total {self.slow_queries}",
+            ]
+
+        hits, misses = response_cache.stats()
+        lookups = hits + misses
+        lines += [
+            "# HELP response_cache_hits_total Response cache hits",
+            "# TYPE response_cache_hits_total counter",
+            f"response_cache_hits_total {hits}",
+            "# HELP response_cache_misses_total Response cache misses",
+            "# TYPE response_cache_misses_total counter",
+            f"response_cache_misses_total {misses}",
+            "# HELP response_cache_hit_ratio Share of response cache lookups that hit",
+            "# TYPE response_cache_hit_ratio gauge",
+            f"response_cache_hit_ratio {hits / lookups if lookups else 0.0}",
+            "# HELP fragment_cache_hits_total Template fragments served from cache",
+            "# TYPE fragment_cache_hits_total counter",
+            f"fragment_cache_hits_total {fragment_stats.hits}",
+            "# HELP fragment_cache_misses_total Template fragments rendered",
+            "# TYPE fragment_cache_misses_total counter",
+            f"fragment_cache_misses_total {fragment_stats.misses}",
+        ]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def instrument_engine(engine, slow_query_seconds):
+    """Count and time every statement run on engine, logging slow ones"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append((cursor, time.perf_counter()))
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        # A failed statement never reaches after_cursor_execute; drop its start
+        # time so the stack does not grow on the pooled connection
+        started = context.connection.info.get("query_started") if context.connection is not None else None
+        cursor = getattr(context.execution_context, "cursor", None)
+        if started and cursor is not None and started[-1][0] is cursor:
+            started.pop()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()[1]
+        timing = current_timing()
+        if timing is not None:
+            timing.query_count += 1
+            timing.add("db", elapsed)
+        if elapsed >= slow_query_seconds:
+            metrics.observe_slow_query()
+            logger.warning(
+                "Slow query (%.1f ms%s): %s", elapsed * 1000,
+                f", {request.method} {request.path}" if has_request_context() else "",
+                " ".join(statement.split())
+            )
+
+
+def init_instrumentation(app):
+    """Install the engine hooks, request hooks and the /metrics endpoint on app"""
+    slow_query_seconds = app.config["SLOW_QUERY_MS"] / 1000
+    slow_request_seconds = app.config["SLOW_REQUEST_MS"] / 1000
+
+    with app.app_context():
+        for engine in app.extensions["sqlalchemy"].engines.values():
+            instrument_engine(engine, slow_query_seconds)
+
+    @app.before_request
+    def _start_timing():
+        g.request_timing = RequestTiming()
+
+    @before_render_template.connect_via(app)
+    def _start_render(sender, template, context, **extra):
+        timing = current_timing()
+        if timing is not None:
+            g.render_started = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def _end_render(sender, template, context, **extra):
+        timing = current_timing()
+        started = g.pop("render_started", None)
+        if timing is not None and started is not None:
+            timing.add("render", time.perf_counter() - started)
+
+    @app.after_request
+    def _finish_timing(response):
+        timing = current_timing()
+        if timing is None:
+            return response
+        total = time.perf_counter() - timing.started
+        response.headers["Server-Timing"] = timing.server_timing(total)
+
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        if route != "/metrics":
+            metrics.observe_request(route, request.method, response.status_code, timing, total)
+        if total >= slow_request_seconds:
+            logger.warning(
+                "Slow request (%.1f ms, %d queries): %s %s",
+                total * 1000, timing.query_count, request.method, request.full_path
+            )
+        return response
+
+    @app.route("/metrics")
+    def prometheus_metrics():
+        """Prometheus text exposition of this process's metrics"""
+        return app.response_class(metrics.render(), mimetype="text/plain; version=0.0.4")
@@ -0,0 +1,188 @@
+"""
+Full-text search over interaction notes and recommendations.
+
+SQLite uses an external-content FTS5 table, ``interaction_fts``, that
+triggers keep in sync with every insert, update and delete on
+``interaction`` (ORM and bulk writes alike) and that ranks with bm25().
+PostgreSQL uses a GIN index on the ``to_tsvector`` of both columns and
+ranks with ts_rank_cd(). Other backends, and SQLite builds without FTS5,
+fall back to an unranked LIKE scan.
+"""
+from app import db
+from models import Interaction
+from sqlalchemy import text, or_
+from sqlalchemy.exc import OperationalError
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "interaction_fts"
+# Text search configuration used for the PostgreSQL index and queries
+PG_TEXT_CONFIG = "english"
+# Must match the indexed expression exactly for PostgreSQL to use the index
+PG_DOCUMENT = (
+    f"to_tsvector('{PG_TEXT_CONFIG}', coalesce(interaction.notes, '') || ' ' "
+    f"|| coalesce(interaction.recommendations, ''))"
+)
+
+_SQLITE_SETUP = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        notes, recommendations,
+        content='interaction', content_rowid='id',
+        tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON interaction BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, notes, recommendations)
+        VALUES (new.id, new.notes, new.recommendations);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON interaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, notes, recommendations)
+        VALUES ('delete', old.id, old.notes, old.recommendations);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF notes, recommendations ON interaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, notes, recommendations)
+        VALUES ('delete', old.id, old.notes, old.recommendations);
+        INSERT INTO {FTS_TABLE}(rowid, notes, recommendations)
+        VALUES (new.id, new.notes, new.recommendations);
+    END""",
+]
+
+# Whether this process found the FTS5 table, checked on first search
+_sqlite_fts_available = None
+
+
+def _sqlite_has_fts_table(connection):
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE}
+    ).first() is not None
+
+
+def _missing_fts5(error):
+    """Whether an OperationalError says SQLite was built without FTS5"""
+    return "no such module: fts5" in str(error.orig)
+
+
+def ensure_search_index():
+    """
+    Create the full-text index for the current backend if it is missing.
+
+    On SQLite the FTS5 table is filled from the existing interactions when
+    it is first created; afterwards the triggers maintain it.
+    """
+    global _sqlite_fts_available
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as connection:
+        if dialect == "sqlite":
+            created = not _sqlite_has_fts_table(connection)
+            try:
+                for statement in _SQLITE_SETUP:
+                    connection.execute(text(statement))
+            except OperationalError as e:
+                if not _missing_fts5(e):
+                    raise
+                logger.warning("SQLite was built without FTS5; interaction search falls back to LIKE")
+                return
+            if created:
+                connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            _sqlite_fts_available = True
+        elif dialect == "postgresql":
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_interaction_fts ON interaction USING GIN ({PG_DOCUMENT})"
+            ))
+
+
+def search_terms(query):
+    """Words of a free-text query, lowercased; punctuation is ignored"""
+    return re.findall(r"\w+", query.lower())
+
+
+def _fts5_query(terms):
+    # Quote every term so user input can never be read as FTS5 syntax;
+    # the last term also matches as a prefix for search-as-you-type
+    quoted = [f'"{term}"' for term in terms]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def _filters(customer_id, agent_id, params):
+    clauses = []
+    if customer_id is not None:
+        clauses.append("interaction.customer_id = :customer_id")
+        params["customer_id"] = customer_id
+    if agent_id is not None:
+        clauses.append("interaction.agent_id = :agent_id")
+        params["agent_id"] = agent_id
+    return "".join(f" AND {clause}" for clause in clauses)
+
+
+def search_interactions(query, customer_id=None, agent_id=None, page=1, per_page=20):
+    """
+    Find interactions whose notes or recommendations contain every word of query.
+
+    Args:
+        query (str): Free text; all words must match
+        customer_id (int): Only this customer's interactions
+        agent_id (int): Only this agent's interactions
+        page (int): 1-based page number
+        per_page (int): Results per page
+
+    Returns:
+        tuple: (list of (Interaction, score) best match first, whether more pages exist)
+    """
+    global _sqlite_fts_available
+    terms = search_terms(query)
+    if not terms:
+        return [], False
+
+    offset = (page - 1) * per_page
+    params = {"limit": per_page + 1, "offset": offset}
+    dialect = db.engine.dialect.name
+
+    if dialect == "sqlite" and _sqlite_fts_available is None:
+        _sqlite_fts_available = _sqlite_has_fts_table(db.session.connection())
+
+    if dialect == "sqlite" and _sqlite_fts_available:
+        params["match"] = _fts5_query(terms)
+        # bm25() is lower for better matches
+        sql = (
+            f"SELECT interaction.id, -bm25({FTS_TABLE}) AS score FROM {FTS_TABLE} "
+            f"JOIN interaction ON interaction.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :match{_filters(customer_id, agent_id, params)} "
+            f"ORDER BY bm25({FTS_TABLE}), interaction.id DESC LIMIT :limit OFFSET :offset"
+        )
+    elif dialect == "postgresql":
+        params["terms"] = " ".join(terms)
+        tsquery = f"plainto_tsquery('{PG_TEXT_CONFIG}', :terms)"
+        sql = (
+            f"SELECT interaction.id, ts_rank_cd({PG_DOCUMENT}, {tsquery}) AS score FROM interaction "
+            f"WHERE {PG_DOCUMENT} @@ {tsquery}{_filters(customer_id, agent_id, params)} "
+            f"ORDER BY score DESC, interaction.id DESC LIMIT :limit OFFSET :offset"
+        )
+    else:
+        return _like_search(terms, customer_id, agent_id, offset, per_page)
+
+    rows = db.session.execute(text(sql), params).all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    interactions = {
+        interaction.id: interaction
+        for interaction in Interaction.query.filter(Interaction.id.in_([row.id for row in rows]))
+    }
+    return [(interactions[row.id], float(row.score)) for row in rows if row.id in interactions], has_more
+
+
+def _like_search(terms, customer_id, agent_id, offset, per_page):
+    """Unranked fallback: newest interactions containing every term"""
+    query = Interaction.query
+    for term in terms:
+        pattern = f"%{term}%"
+        query = query.filter(or_(Interaction.notes.ilike(pattern), Interaction.recommendations.ilike(pattern)))
+    if customer_id is not None:
+        query = query.filter(Interaction.customer_id == customer_id)
+    if agent_id is not None:
+        query = query.filter(Interaction.agent_id == agent_id)
+    interactions = query.order_by(Interaction.created_at.desc(), Interaction.id.desc()) \
+        .offset(offset).limit(per_page + 1).all()
+    return [(interaction, None) for interaction in interactions[:per_page]], len(interactions) > per_page
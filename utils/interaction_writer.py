@@ -0,0 +1,240 @@
+from app import db
+from models import Interaction, InteractionToken
+from utils import data_events
+from flask import current_app
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+import atexit
+import datetime
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def insert_interactions(rows, tokens=None):
+    """
+    Insert interactions with one bulk INSERT and one commit.
+
+    Rollups and other in-transaction hooks are applied before the commit and
+    commit subscribers (cache invalidation, ...) are notified after it, exactly
+    as for interactions saved through the ORM.
+
+    Rows carrying an idempotency token that was already committed, or that
+    repeat a token of an earlier row, are not inserted again; they get the
+    ID of the interaction first saved under that token.
+
+    Args:
+        rows (list): Dicts of Interaction column values
+        tokens (list): Optional idempotency token (or None) per row
+
+    Returns:
+        list: The assigned interaction IDs, in the order of rows
+    """
+    if not rows:
+        return []
+    tokens = tokens or [None] * len(rows)
+    given = {token for token in tokens if token}
+    known = dict(db.session.query(InteractionToken.token, InteractionToken.interaction_id).filter(
+        InteractionToken.token.in_(given)
+    ).all()) if given else {}
+
+    new_rows, new_tokens, claimed = [], [], set(known)
+    for row, token in zip(rows, tokens):
+        if token and token in claimed:
+            continue
+        if token:
+            claimed.add(token)
+        row.setdefault("created_at", datetime.datetime.utcnow())
+        new_rows.append(row)
+        new_tokens.append(token)
+
+    if new_rows:
+        result = db.session.execute(
+            insert(Interaction).returning(Interaction.id, sort_by_parameter_order=True),
+            new_rows
+        )
+        new_ids = result.scalars().all()
+        token_rows = [
+            {"token": token, "interaction_id": interaction_id}
+            for token, interaction_id in zip(new_tokens, new_ids) if token
+        ]
+        if token_rows:
+            db.session.execute(insert(InteractionToken), token_rows)
+            known.update((row["token"], row["interaction_id"]) for row in token_rows)
+    else:
+        new_ids = []
+
+    changes = data_events.ChangeSet()
+    changes.inserted[Interaction.__table__.name] = [
+        dict(row, id=interaction_id) for row, interaction_id in zip(new_rows, new_ids)
+    ]
+    data_events.run_flush_hooks(db.session.connection(), changes)
+    db.session.commit()
+    data_events.publish(changes)
+
+    untokened_ids = iter([interaction_id for token, interaction_id in zip(new_tokens, new_ids) if not token])
+    return [known[token] if token else next(untokened_ids) for token in tokens]
+
+
+def committed_interaction_id(token):
+    """ID of the interaction saved under an idempotency token, or None"""
+    return db.session.query(InteractionToken.interaction_id).filter_by(token=token).scalar()
+
+
+class PendingInteraction:
+    """An interaction queued for the next group commit"""
+
+    def __init__(self, row, token=None):
+        self.row = row
+        self.token = token
+        self.interaction_id = None
+        self.error = None
+        self._done = threading.Event()
+
+    def resolve(self, interaction_id):
+        self.interaction_id = interaction_id
+        self._done.set()
+
+    def fail(self, error):
+        self.error = error
+        self._done.set()
+
+    def wait(self, timeout=None):
+        """
+        Block until the interaction has been committed.
+
+        Returns:
+            int: The assigned interaction ID
+
+        Raises:
+            TimeoutError: If the group commit did not happen within timeout
+            Exception: The error that made the commit fail
+        """
+        if not self._done.wait(timeout):
+            raise TimeoutError("Interaction was not committed in time")
+        if self.error is not None:
+            raise self.error
+        return self.interaction_id
+
+
+class InteractionWriter:
+    """
+    Background writer that group-commits queued interactions.
+
+    Rows are flushed with one bulk INSERT and one commit whenever batch_size
+    rows are waiting or interval_ms has passed since the first of them was
+    queued, so concurrent requests share one fsync and one acquisition of the
+    database write lock. Batching only happens across concurrent requests,
+    i.e. with threaded workers; clients that already batch should use
+    /api/interactions/batch instead.
+    """
+
+    def __init__(self, app, batch_size=100, interval_ms=20):
+        self.app = app
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.pid = os.getpid()
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="interaction-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, row, token=None):
+        """
+        Queue an interaction for the next group commit.
+
+        Args:
+            row (dict): Interaction column values
+            token (str): Optional idempotency token; the interaction is
+                saved at most once per token
+        """
+        pending = PendingInteraction(row, token)
+        self._queue.put(pending)
+        return pending
+
+    def stop(self):
+        """Flush everything queued so far and stop the writer thread"""
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            first = self._queue.get()
+            if first is _STOP:
+                break
+            batch = [first]
+            deadline = time.monotonic() + self.interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch):
+        with self.app.app_context():
+            try:
+                ids = insert_interactions([pending.row for pending in batch], [pending.token for pending in batch])
+            except Exception as e:
+                db.session.rollback()
+                if len(batch) == 1:
+                    # Another process committed the same token since it was looked up
+                    existing = None
+                    if isinstance(e, IntegrityError) and batch[0].token:
+                        try:
+                            existing = committed_interaction_id(batch[0].token)
+                        except Exception:
+                            db.session.rollback()
+                    if existing is not None:
+                        batch[0].resolve(existing)
+                        return
+                    logger.exception("Error writing a queued interaction")
+                    batch[0].fail(e)
+                    return
+                logger.warning("Group commit of %d interactions failed (%s); retrying them one by one",
+                               len(batch), e)
+                ids = None
+        if ids is None:
+            # One bad row must not fail the requests that share its commit
+            for pending in batch:
+                self._flush([pending])
+            return
+        for pending, interaction_id in zip(batch, ids):
+            pending.resolve(interaction_id)
+
+
+def get_interaction_writer():
+    """Return this process's writer, starting it on first use (and after a fork)"""
+    global _writer
+    if _writer is None or _writer.pid != os.getpid():
+        with _writer_lock:
+            if _writer is None or _writer.pid != os.getpid():
+                config = current_app.config
+                _writer = InteractionWriter(
+                    current_app._get_current_object(),
+                    batch_size=config.get("INTERACTION_BATCH_SIZE", 100),
+                    interval_ms=config.get("INTERACTION_BATCH_INTERVAL_MS", 20)
+                )
+    return _writer
+
+
+@atexit.register
+def _drain_writer():
+    if _writer is not None and _writer.pid == os.getpid():
+        _writer.stop()
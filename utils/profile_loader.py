@@ -0,0 +1,48 @@
+from models import Customer, Interaction, Purchase
+from sqlalchemy.orm import selectinload, joinedload
+
+
+class CustomerProfile:
+    """
+    Everything the customer profile page renders, loaded up front.
+
+    The preference and purchase summaries are handed to the recommender so
+    it does not query the same rows again.
+    """
+
+    def __init__(self, customer):
+        self.customer = customer
+        self.interactions = customer.interactions
+        self.preferences = customer.preferences
+        self.purchases = customer.purchases
+
+    @property
+    def preferred_categories(self):
+        return {p.category: p.preference_level for p in self.preferences}
+
+    @property
+    def purchased_product_ids(self):
+        return {p.product_id for p in self.purchases}
+
+
+def load_customer_profile(customer_id):
+    """
+    Load a customer with interactions (and their agents), preferences and
+    purchases (and their products) in a fixed number of queries: one for the
+    customer and one per eager-loaded collection, whatever the row counts.
+
+    Args:
+        customer_id (int): The ID of the customer
+
+    Returns:
+        CustomerProfile: The loaded profile, or None if the customer does not exist
+    """
+    customer = Customer.query.options(
+        selectinload(Customer.interactions).joinedload(Interaction.agent),
+        selectinload(Customer.preferences),
+        selectinload(Customer.purchases).joinedload(Purchase.product)
+    ).filter(Customer.id == customer_id).one_or_none()
+
+    if customer is None:
+        return None
+    return CustomerProfile(customer)
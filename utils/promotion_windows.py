@@ -0,0 +1,78 @@
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+# Answers for this many distinct time slots are memoized per instance
+SLOT_CACHE_SIZE = 32
+
+
+class PromotionWindows:
+    """
+    Interval index over promotion windows.
+
+    The distinct start and end instants of all windows, sorted, split the
+    time line into slots: the open stretches between boundaries and the
+    boundary instants themselves. A promotion is active on all of a slot or
+    none of it, because windows include both their start and end. Looking up
+    a point in time is therefore a bisect to find its slot, and the active
+    set and per-category counts are only computed again once the clock
+    crosses into another slot. Answers are kept for a few slots so "now"
+    and occasional time-travel previews do not evict each other.
+    """
+
+    def __init__(self, promotions, all_categories):
+        """
+        Args:
+            promotions (dict): promotion id -> dict with start_date, end_date
+                and product_category
+            all_categories (str): Category of promotions that apply to every product
+        """
+        self.all_categories = all_categories
+        self.boundaries = sorted(
+            {promotion["start_date"] for promotion in promotions.values()}
+            | {promotion["end_date"] for promotion in promotions.values()}
+        )
+        by_start = sorted(promotions.values(), key=lambda promotion: (promotion["start_date"], promotion["id"]))
+        self._starts = [promotion["start_date"] for promotion in by_start]
+        self._windows = [
+            (promotion["id"], promotion["end_date"], promotion["product_category"])
+            for promotion in by_start
+        ]
+        self._slot_cache = {}
+
+    def slot(self, at):
+        """
+        Slot containing a point in time: 2i for the stretch just before
+        boundary i, 2i + 1 for boundary i itself
+        """
+        i = bisect_left(self.boundaries, at)
+        if i < len(self.boundaries) and self.boundaries[i] == at:
+            return 2 * i + 1
+        return 2 * i
+
+    def _lookup(self, at):
+        slot = self.slot(at)
+        entry = self._slot_cache.get(slot)
+        if entry is None:
+            started = bisect_right(self._starts, at)
+            active = [window for window in self._windows[:started] if window[1] >= at]
+            categories = Counter(category for _, _, category in active)
+            global_count = categories.pop(self.all_categories, 0)
+            entry = (frozenset(promotion_id for promotion_id, _, _ in active), dict(categories), global_count)
+            if len(self._slot_cache) >= SLOT_CACHE_SIZE:
+                self._slot_cache.clear()
+            self._slot_cache[slot] = entry
+        return entry
+
+    def active_at(self, at):
+        """Ids of the promotions whose window contains the given datetime"""
+        return self._lookup(at)[0]
+
+    def counts_at(self, at):
+        """
+        Count the promotions active at the given datetime per category.
+
+        Returns:
+            tuple: (dict of category -> count, number of active all-category promotions)
+        """
+        _, by_category, global_count = self._lookup(at)
+        return by_category, global_count
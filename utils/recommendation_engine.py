@@ -1,92 +1,272 @@
 from app import db
-from models import Customer, Product, CustomerPreference, Purchase, Promotion
+from models import Customer, CustomerPreference, Purchase, CustomerRecommendation, CustomerRecommendationState
+from utils.catalog_index import get_catalog_index
+from utils.copurchase import get_copurchase_index
+from utils.fragment_cache import fragment_digest
+from flask import current_app
 import datetime
+import heapq
+import logging
 
-def get_recommendations(customer_id):
+logger = logging.getLogger(__name__)
+
+# Number of recommendations returned per customer
+RECOMMENDATION_LIMIT = 5
+# Products scoring below this threshold are never recommended
+MINIMUM_SCORE = 2
+# Customer ids bound per IN (...) query, kept well below SQLite's variable limit
+BATCH_QUERY_CHUNK_SIZE = 5000
+
+def get_recommendations(customer_id, preferred_categories=None, purchased_product_ids=None):
     """
     Generate product recommendations for a specific customer based on
     their preferences, purchase history, and available promotions.
     
     Args:
         customer_id (int): The ID of the customer to generate recommendations for
+        preferred_categories (dict): Category -> preference level, if already loaded
+        purchased_product_ids (set): IDs of purchased products, if already loaded
         
     Returns:
         list: A list of recommendation dictionaries containing product and promotion info
     """
     try:
-        # Get customer data
-        customer = Customer.query.get(customer_id)
-        if not customer:
-            return []
+        preloaded = preferred_categories is not None and purchased_product_ids is not None
         
         # Get customer preferences
-        preferences = CustomerPreference.query.filter_by(customer_id=customer_id).all()
-        preferred_categories = {p.category: p.preference_level for p in preferences}
+        if preferred_categories is None:
+            preferences = db.session.query(
+                CustomerPreference.category,
+                CustomerPreference.preference_level
+            ).filter_by(customer_id=customer_id).all()
+            preferred_categories = {category: level for category, level in preferences}
         
         # Get previous purchases
-        purchases = Purchase.query.filter_by(customer_id=customer_id).all()
-        purchased_product_ids = [p.product_id for p in purchases]
+        if purchased_product_ids is None:
+            purchased_product_ids = {
+                product_id for (product_id,) in
+                db.session.query(Purchase.product_id).filter_by(customer_id=customer_id)
+            }
         
-        # Get current promotions
-        current_date = datetime.datetime.now()
-        active_promotions = Promotion.query.filter(
-            Promotion.start_date <= current_date,
-            Promotion.end_date >= current_date
-        ).all()
+        # Only a customer with no preferences and no purchases can be missing entirely;
+        # callers passing preloaded data have already loaded the customer
+        if not preloaded and not preferred_categories and not purchased_product_ids \
+                and Customer.query.get(customer_id) is None:
+            return []
+        
+        return _rank_products(
+            get_catalog_index(),
+            preferred_categories,
+            purchased_product_ids,
+            datetime.datetime.now(),
+            boosts=get_copurchase_index().boosts(
+                purchased_product_ids, current_app.config["COPURCHASE_MAX_BOOST"]
+            )
+        )
+        
+    except Exception as e:
+        logger.exception("Error generating recommendations")
+        return []
+
+def promotion_key(active_promotion_ids):
+    """Short key of a set of active promotions, stored with precomputed recommendations"""
+    return fragment_digest(sorted(active_promotion_ids))
+
+def get_stored_recommendations(customer_id, purchased_product_ids, data_version):
+    """
+    Read recommendations precomputed by the offline batch scorer.
+    
+    Product details and currently active promotions come from the catalog
+    index. A stored list is only served while the customer's data version
+    and the set of active promotions are the ones it was scored against, so
+    its scores match what the live recommender would return; otherwise the
+    caller falls back to live scoring.
+    
+    Args:
+        customer_id (int): The ID of the customer
+        purchased_product_ids (set): Products the customer currently owns
+        data_version (int): The customer's current CustomerDataVersion
+        
+    Returns:
+        list: Recommendation dictionaries (possibly empty), or None if no
+            batch run scored this customer's current data and promotions and
+            the live recommender should be used
+    """
+    try:
+        state = db.session.query(
+            CustomerRecommendationState.data_version,
+            CustomerRecommendationState.promotion_key
+        ).filter_by(customer_id=customer_id).first()
+        if state is None or state.data_version != data_version:
+            return None
         
-        # Get all products
-        all_products = Product.query.all()
+        index = get_catalog_index()
+        active_ids = index.active_promotion_ids(datetime.datetime.now())
+        if state.promotion_key != promotion_key(active_ids):
+            return None
+        
+        stored = db.session.query(
+            CustomerRecommendation.product_id,
+            CustomerRecommendation.score
+        ).filter_by(customer_id=customer_id).order_by(CustomerRecommendation.rank).all()
+        if any(product_id in purchased_product_ids or product_id not in index.products
+               for product_id, _ in stored):
+            return None
         
-        # Generate recommendations
         recommendations = []
+        for product_id, score in stored:
+            recommendation = dict(index.products[product_id])
+            recommendation["score"] = score
+            recommendation["promotions"] = index.promotions_for_product(product_id, active_ids)
+            recommendations.append(recommendation)
+        return recommendations
         
-        for product in all_products:
-            # Skip products the customer has already purchased
-            if product.id in purchased_product_ids:
-                continue
-                
-            # Calculate a recommendation score based on preferences
-            score = 1  # Base score
+    except Exception as e:
+        logger.exception("Error reading stored recommendations")
+        return None
+
+def get_recommendations_batch(customer_ids):
+    """
+    Generate recommendations for many customers at once.
+    
+    Preferences and purchases are loaded with one IN query per chunk of
+    customer ids instead of several queries per customer, and every customer
+    is ranked against the same catalog snapshot and point in time.
+    
+    Args:
+        customer_ids (list): IDs of the customers to generate recommendations for
+        
+    Returns:
+        dict: Customer ID -> list of recommendation dictionaries (the same
+            structure get_recommendations returns; empty for unknown customers)
+    """
+    customer_ids = list(dict.fromkeys(customer_ids))
+    try:
+        index = get_catalog_index()
+        copurchases = get_copurchase_index()
+        max_boost = current_app.config["COPURCHASE_MAX_BOOST"]
+        current_date = datetime.datetime.now()
+        results = {}
+        
+        for start in range(0, len(customer_ids), BATCH_QUERY_CHUNK_SIZE):
+            chunk = customer_ids[start:start + BATCH_QUERY_CHUNK_SIZE]
+            
+            preferred_categories = {customer_id: {} for customer_id in chunk}
+            for customer_id, category, level in db.session.query(
+                CustomerPreference.customer_id,
+                CustomerPreference.category,
+                CustomerPreference.preference_level
+            ).filter(CustomerPreference.customer_id.in_(chunk)):
+                preferred_categories[customer_id][category] = level
             
-            # Check if the product category is in the customer's preferences
-            if product.category in preferred_categories:
-                score += preferred_categories[product.category]
+            purchased_product_ids = {customer_id: set() for customer_id in chunk}
+            for customer_id, product_id in db.session.query(
+                Purchase.customer_id,
+                Purchase.product_id
+            ).filter(Purchase.customer_id.in_(chunk)):
+                purchased_product_ids[customer_id].add(product_id)
             
-            # Check if there's an active promotion for this product
-            applicable_promotions = []
-            for promotion in active_promotions:
-                if promotion.product_category == product.category or promotion.product_category == "All":
-                    applicable_promotions.append({
-                        "id": promotion.id,
-                        "name": promotion.name,
-                        "description": promotion.description,
-                        "discount_percentage": promotion.discount_percentage,
-                        "discounted_price": round(product.price * (1 - promotion.discount_percentage / 100), 2)
-                    })
-                    # Boost score for products with promotions
-                    score += 1
+            # Only customers with no preferences and no purchases can be missing entirely
+            unverified = [
+                customer_id for customer_id in chunk
+                if not preferred_categories[customer_id] and not purchased_product_ids[customer_id]
+            ]
+            missing = set(unverified)
+            if unverified:
+                missing -= {
+                    customer_id for (customer_id,) in
+                    db.session.query(Customer.id).filter(Customer.id.in_(unverified))
+                }
             
-            # Only include products that meet a minimum score threshold
-            if score >= 2:
-                recommendations.append({
-                    "product_id": product.id,
-                    "name": product.name,
-                    "category": product.category,
-                    "description": product.description,
-                    "price": product.price,
-                    "score": score,
-                    "promotions": applicable_promotions
-                })
-        
-        # Sort recommendations by score (highest first)
-        recommendations.sort(key=lambda x: x["score"], reverse=True)
-        
-        # Return top 5 recommendations
-        return recommendations[:5]
+            for customer_id in chunk:
+                if customer_id in missing:
+                    results[customer_id] = []
+                    continue
+                results[customer_id] = _rank_products(
+                    index,
+                    preferred_categories[customer_id],
+                    purchased_product_ids[customer_id],
+                    current_date,
+                    boosts=copurchases.boosts(purchased_product_ids[customer_id], max_boost)
+                )
+        
+        return results
         
     except Exception as e:
-        print(f"Error generating recommendations: {str(e)}")
-        return []
+        logger.exception("Error generating batch recommendations")
+        return {customer_id: [] for customer_id in customer_ids}
+
+def _rank_products(index, preferred_categories, purchased_product_ids, at, limit=RECOMMENDATION_LIMIT,
+                   boosts=None):
+    """
+    Rank catalog products for one customer.
+    
+    Every product in a category shares the same base score (1, plus the
+    customer's preference level, plus 1 per active promotion covering the
+    category), so categories are ranked instead of products and only as many
+    products are visited as it takes to fill the result. The few products
+    with a co-purchase boost are scored individually and merged in.
+    
+    Args:
+        index (CatalogIndex): Catalog snapshot to rank from
+        preferred_categories (dict): Category -> preference level
+        purchased_product_ids (set): Products the customer already owns
+        at (datetime): Point in time used to decide which promotions are active
+        limit (int): Maximum number of recommendations
+        boosts (dict): Product id -> co-purchase boost added to its score
+        
+    Returns:
+        list: Recommendation dictionaries, highest score first, ties in product id order
+    """
+    active_ids = index.active_promotion_ids(at)
+    promotions_by_category, global_promotions = index.active_promotion_counts(at)
+    boosts = boosts or {}
+    
+    def category_score(category):
+        return 1 + preferred_categories.get(category, 0) \
+            + promotions_by_category.get(category, 0) + global_promotions
+    
+    categories_by_score = {}
+    for category in index.products_by_category:
+        score = category_score(category)
+        if score >= MINIMUM_SCORE:
+            categories_by_score.setdefault(score, []).append(category)
+    
+    boosted = []
+    for product_id, boost in boosts.items():
+        product = index.products.get(product_id)
+        if product is None or product_id in purchased_product_ids:
+            continue
+        score = category_score(product["category"]) + boost
+        if score >= MINIMUM_SCORE:
+            boosted.append((-score, product_id))
+    boosted = heapq.nsmallest(limit, boosted)
+    
+    # Without boosts, no more than `limit` products can make the cut
+    unboosted = []
+    for score in sorted(categories_by_score, reverse=True):
+        product_ids = heapq.merge(*(
+            index.products_by_category[category] for category in categories_by_score[score]
+        ))
+        for product_id in product_ids:
+            if product_id in purchased_product_ids or product_id in boosts:
+                continue
+            unboosted.append((-score, product_id))
+            if len(unboosted) >= limit:
+                break
+        if len(unboosted) >= limit:
+            break
+    
+    recommendations = []
+    for negative_score, product_id in heapq.merge(boosted, unboosted):
+        recommendation = dict(index.products[product_id])
+        recommendation["score"] = -negative_score
+        recommendation["promotions"] = index.promotions_for_product(product_id, active_ids)
+        recommendations.append(recommendation)
+        if len(recommendations) >= limit:
+            break
+    
+    return recommendations
 
 def get_product_recommendations_by_category(category):
     """
@@ -99,17 +279,17 @@ def get_product_recommendations_by_category(category):
         list: List of products in the specified category
     """
     try:
-        products = Product.query.filter_by(category=category).all()
+        index = get_catalog_index()
         return [
             {
-                "id": p.id,
-                "name": p.name,
-                "category": p.category,
-                "description": p.description,
-                "price": p.price
+                "id": product_id,
+                "name": index.products[product_id]["name"],
+                "category": index.products[product_id]["category"],
+                "description": index.products[product_id]["description"],
+                "price": index.products[product_id]["price"]
             }
-            for p in products
+            for product_id in index.products_by_category.get(category, [])
         ]
     except Exception as e:
-        print(f"Error getting products by category: {str(e)}")
+        logger.exception("Error getting products by category")
         return []
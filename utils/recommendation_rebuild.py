@@ -0,0 +1,213 @@
+"""
+Parallel, resumable recommendation precompute.
+
+``flask recommendations rebuild`` splits the Customer.id range into
+shards and scores them on a process pool. The parent builds one
+ScoringModel, a read-only snapshot of the catalog, the active promotions
+and the co-purchase neighbours, and hands it to every worker once through
+the pool initializer. Each worker opens its own database connections and
+scores its shards chunk by chunk with the batch scorer.
+
+Every chunk's recommendations are written in the same transaction that
+advances its shard's RecommendationShard checkpoint. A run that was
+interrupted (Ctrl-C, a crash, a failed worker) is resumed by the next
+rebuild from the last committed chunk of each shard; resumed chunks are
+scored against a fresh snapshot.
+
+On SQLite the workers' writes are serialized by the database lock, so
+extra workers only speed up scoring, not writing.
+"""
+from app import db
+from models import Customer, RecommendationRun, RecommendationShard
+from utils.batch_scorer import DEFAULT_CHUNK_SIZE, build_scoring_model, score_chunk, store_chunk
+from sqlalchemy import func, insert, update
+from concurrent.futures import FIRST_EXCEPTION, ProcessPoolExecutor, wait
+import datetime
+import os
+import time
+
+# Shards per worker; more, smaller shards balance uneven id ranges
+SHARDS_PER_WORKER = 4
+# Seconds between progress reports
+PROGRESS_INTERVAL = 2.0
+
+# Per worker process: (ScoringModel, chunk size), set by the pool initializer
+_worker_state = None
+
+
+class RebuildProgress:
+    """Customers scored so far by a rebuild, for progress reports"""
+
+    def __init__(self, run_id, total, done, resumed):
+        self.run_id = run_id
+        self.total = total
+        self.done = done
+        self.resumed = resumed
+        self.started = time.perf_counter()
+        self._initial = done
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def customers_per_second(self):
+        """Throughput of this invocation, excluding work done before a resume"""
+        return (self.done - self._initial) / self.elapsed if self.elapsed else 0.0
+
+
+def plan_shards(first_id, last_id, shard_count):
+    """
+    Split [first_id, last_id] into up to shard_count contiguous id ranges.
+
+    Returns:
+        list: (first id, last id) pairs, inclusive
+    """
+    span = last_id - first_id + 1
+    if span <= 0:
+        return []
+    shard_count = max(1, min(shard_count, span))
+    bounds = [first_id + span * shard // shard_count for shard in range(shard_count + 1)]
+    return [(bounds[shard], bounds[shard + 1] - 1) for shard in range(shard_count)]
+
+
+def _start_run(shard_count):
+    first_id, last_id = db.session.query(func.min(Customer.id), func.max(Customer.id)).one()
+    run = RecommendationRun(max_customer_id=last_id or 0, customer_count=0)
+    db.session.add(run)
+    db.session.flush()
+    shards = plan_shards(first_id or 1, last_id or 0, shard_count)
+    if shards:
+        db.session.execute(insert(RecommendationShard), [
+            {"run_id": run.id, "shard": shard, "first_customer_id": first, "last_customer_id": last,
+             "scored_through_id": first - 1, "customer_count": 0}
+            for shard, (first, last) in enumerate(shards)
+        ])
+    db.session.commit()
+    return run.id
+
+
+def find_resumable_run():
+    """The most recent sharded run that never completed, or None"""
+    return db.session.query(RecommendationRun.id).filter(
+        RecommendationRun.completed_at.is_(None),
+        RecommendationRun.id.in_(db.session.query(RecommendationShard.run_id))
+    ).order_by(RecommendationRun.id.desc()).limit(1).scalar()
+
+
+def _scored(run_id):
+    done = db.session.query(func.coalesce(func.sum(RecommendationShard.customer_count), 0)).filter(
+        RecommendationShard.run_id == run_id
+    ).scalar()
+    # End the read transaction so the next poll sees the workers' commits
+    db.session.commit()
+    return done
+
+
+def _init_worker(model, chunk_size):
+    global _worker_state
+    from app import app
+
+    app.app_context().push()
+    # Connections inherited through fork belong to the parent; never reuse them
+    for engine in db.engines.values():
+        engine.dispose(close=False)
+    _worker_state = (model, chunk_size)
+
+
+def _score_shard(run_id, shard):
+    """Score the remaining customers of one shard; runs in a worker process"""
+    model, chunk_size = _worker_state
+    checkpoint = db.session.get(RecommendationShard, (run_id, shard))
+    last_id, end_id = checkpoint.scored_through_id, checkpoint.last_customer_id
+    db.session.commit()
+
+    while True:
+        customer_ids = [
+            customer_id for (customer_id,) in
+            db.session.query(Customer.id)
+            .filter(Customer.id > last_id, Customer.id <= end_id)
+            .order_by(Customer.id)
+            .limit(chunk_size)
+        ]
+        if not customer_ids:
+            break
+        store_chunk(run_id, customer_ids, *score_chunk(model, customer_ids))
+        db.session.execute(update(RecommendationShard).where(
+            RecommendationShard.run_id == run_id,
+            RecommendationShard.shard == shard
+        ).values(
+            scored_through_id=customer_ids[-1],
+            customer_count=RecommendationShard.customer_count + len(customer_ids)
+        ))
+        db.session.commit()
+        last_id = customer_ids[-1]
+
+    db.session.execute(update(RecommendationShard).where(
+        RecommendationShard.run_id == run_id,
+        RecommendationShard.shard == shard
+    ).values(completed_at=datetime.datetime.utcnow()))
+    db.session.commit()
+    return shard
+
+
+def rebuild_recommendations(workers=None, chunk_size=DEFAULT_CHUNK_SIZE, shards=None,
+                            restart=False, progress=None):
+    """
+    Score every customer on a process pool and store the top
+    recommendations, resuming an interrupted rebuild unless restart is set.
+
+    Args:
+        workers (int): Worker processes (default: one per CPU)
+        chunk_size (int): Customers scored and committed per chunk
+        shards (int): Id ranges for a new run (default: SHARDS_PER_WORKER per worker)
+        restart (bool): Start a new run even if an interrupted one exists
+        progress (callable): Optional callback receiving a RebuildProgress
+            at the start, every PROGRESS_INTERVAL seconds and at the end
+
+    Returns:
+        RecommendationRun: The completed run
+    """
+    workers = workers or os.cpu_count() or 1
+    run_id = None if restart else find_resumable_run()
+    resumed = run_id is not None
+    if run_id is None:
+        run_id = _start_run(shards or workers * SHARDS_PER_WORKER)
+
+    max_customer_id = db.session.get(RecommendationRun, run_id).max_customer_id
+    total = db.session.query(func.count(Customer.id)).filter(Customer.id <= max_customer_id).scalar()
+    pending = [
+        shard for (shard,) in db.session.query(RecommendationShard.shard).filter(
+            RecommendationShard.run_id == run_id,
+            RecommendationShard.completed_at.is_(None)
+        ).order_by(RecommendationShard.shard)
+    ]
+    status = RebuildProgress(run_id, total, _scored(run_id), resumed)
+    if progress:
+        progress(status)
+    model = build_scoring_model()
+    # Nothing may be open on the parent's connections when the pool forks
+    db.session.remove()
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending)), initializer=_init_worker,
+                                 initargs=(model, chunk_size)) as pool:
+            futures = {pool.submit(_score_shard, run_id, shard) for shard in pending}
+            while futures:
+                done, futures = wait(futures, timeout=PROGRESS_INTERVAL, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    if future.exception() is not None:
+                        for other in futures:
+                            other.cancel()
+                        raise future.exception()
+                if progress and futures:
+                    status.done = _scored(run_id)
+                    progress(status)
+
+    run = db.session.get(RecommendationRun, run_id)
+    run.customer_count = status.done = _scored(run_id)
+    run.completed_at = datetime.datetime.utcnow()
+    db.session.commit()
+    if progress:
+        progress(status)
+    return run
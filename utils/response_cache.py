@@ -0,0 +1,208 @@
+from models import Customer, Product, Promotion, Purchase, Interaction, CustomerPreference
+from utils import data_events
+from flask import current_app, request, make_response
+from werkzeug.http import generate_etag
+from collections import OrderedDict
+from functools import wraps
+import datetime
+import threading
+import time
+import uuid
+
+# Tag covering every analytics response
+ANALYTICS_TAG = "analytics"
+# Tag covering every recommendation response
+RECOMMENDATIONS_TAG = "recommendations"
+
+
+def customer_tag(customer_id):
+    """Tag covering every response derived from one customer's data"""
+    return f"customer:{customer_id}"
+
+
+class LRUCache:
+    """
+    Bounded in-process cache backend with optional per-entry expiry.
+
+    Any object with the same get/set/delete/clear methods (for example a
+    wrapper around a shared cache server) can be configured instead via
+    RESPONSE_CACHE_BACKEND.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class CachedResponse:
+    """Body and validators of a cached 200 response"""
+
+    def __init__(self, body, mimetype, tag_tokens):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = generate_etag(body)
+        self.last_modified = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0)
+        self.tag_tokens = tag_tokens
+
+
+class ResponseCache:
+    """
+    Response cache with tag-based invalidation.
+
+    Every tag has an opaque token stored in the backend; entries remember the
+    tokens of their tags when they are stored and are treated as misses once
+    any of those tokens has been replaced. Invalidating a tag is therefore a
+    single backend write, whatever the number of entries it covers.
+    """
+
+    def __init__(self):
+        self._backend = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        """(hits, misses) of this process, read together"""
+        with self._stats_lock:
+            return self.hits, self.misses
+
+    def _record(self, hit):
+        with self._stats_lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def backend(self):
+        if self._backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = current_app.config.get("RESPONSE_CACHE_BACKEND") or LRUCache(
+                        current_app.config.get("RESPONSE_CACHE_MAX_ENTRIES", 1024)
+                    )
+        return self._backend
+
+    def _tag_token(self, tag):
+        token = self.backend.get(f"tag:{tag}")
+        if token is None:
+            # Unknown (or evicted) tags get a fresh token, invalidating older entries
+            token = uuid.uuid4().hex
+            self.backend.set(f"tag:{tag}", token)
+        return token
+
+    def tag_tokens(self, tags):
+        """Current tokens of the given tags; capture them before computing a response"""
+        return [self._tag_token(tag) for tag in tags]
+
+    def get(self, key, tag_tokens):
+        entry = self.backend.get(f"response:{key}")
+        if entry is not None and entry.tag_tokens == tag_tokens:
+            self._record(True)
+            return entry
+        self._record(False)
+        return None
+
+    def set(self, key, tag_tokens, body, mimetype):
+        entry = CachedResponse(body, mimetype, tag_tokens)
+        self.backend.set(f"response:{key}", entry, current_app.config.get("RESPONSE_CACHE_TTL", 30))
+        return entry
+
+    def invalidate(self, *tags):
+        if self._backend is None:
+            return
+        for tag in tags:
+            self._backend.set(f"tag:{tag}", uuid.uuid4().hex)
+
+    def clear(self):
+        if self._backend is not None:
+            self._backend.clear()
+
+
+response_cache = ResponseCache()
+
+
+def cached_response(key, tags=lambda **view_args: ()):
+    """
+    Cache a view's 200 responses and answer conditional requests.
+
+    Responses carry ETag and Last-Modified validators with
+    ``Cache-Control: no-cache``, so browsers revalidate on every fetch and
+    get an empty 304 while the cached entry is still current.
+
+    Args:
+        key (callable): Builds the cache key from the view arguments
+        tags (callable): Builds the list of invalidation tags from the view arguments
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**view_args):
+            cache_key = key(**view_args)
+            tag_tokens = response_cache.tag_tokens(tags(**view_args))
+
+            entry = response_cache.get(cache_key, tag_tokens)
+            if entry is None:
+                response = make_response(view(**view_args))
+                if response.status_code != 200 or response.direct_passthrough:
+                    return response
+                entry = response_cache.set(cache_key, tag_tokens, response.get_data(), response.mimetype)
+
+            response = current_app.response_class(entry.body, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            response.last_modified = entry.last_modified
+            response.cache_control.no_cache = True
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
+
+
+_ANALYTICS_TABLES = {
+    model.__table__.name for model in (Customer, Product, Purchase, Interaction, CustomerPreference)
+}
+_CATALOG_TABLES = {model.__table__.name for model in (Product, Promotion)}
+_CUSTOMER_TABLES = {model.__table__.name for model in (Purchase, Interaction, CustomerPreference)}
+
+
+@data_events.on_commit
+def _invalidate_on_commit(changes):
+    tables = changes.tables
+    tags = set()
+    if tables & _ANALYTICS_TABLES:
+        tags.add(ANALYTICS_TAG)
+    if tables & _CATALOG_TABLES:
+        tags.add(RECOMMENDATIONS_TAG)
+    for table in tables & _CUSTOMER_TABLES:
+        rows = changes.inserted.get(table, []) + changes.deleted.get(table, [])
+        rows += [row for pair in changes.updated.get(table, []) for row in pair]
+        tags.update(customer_tag(row["customer_id"]) for row in rows if row.get("customer_id") is not None)
+    response_cache.invalidate(*tags)
@@ -0,0 +1,142 @@
+from app import db
+from models import User, Customer, Product, Interaction, CustomerPreference, Promotion, Purchase
+import datetime
+
+# Sample data for initial views
+# These would normally come from a database, but added here for demonstration
+sample_products = [
+    {"id": 1, "name": "Premium Account", "category": "Service", "price": 99.99, "description": "Top tier service with 24/7 support."},
+    {"id": 2, "name": "Basic Plan", "category": "Service", "price": 49.99, "description": "Entry level service with basic features."},
+    {"id": 3, "name": "Security Package", "category": "Software", "price": 149.99, "description": "Advanced security features for your account."},
+    {"id": 4, "name": "Mobile Add-on", "category": "Add-on", "price": 9.99, "description": "Mobile access to all services."},
+    {"id": 5, "name": "Business Analytics", "category": "Service", "price": 199.99, "description": "Detailed analytics for your business."},
+]
+
+sample_promotions = [
+    {"id": 1, "name": "Summer Discount", "discount_percentage": 20, "product_category": "Service", 
+     "description": "20% off all services for summer!", "start_date": "2023-06-01", "end_date": "2023-08-31"},
+    {"id": 2, "name": "New Customer", "discount_percentage": 15, "product_category": "All", 
+     "description": "15% off first purchase for new customers", "start_date": "2023-01-01", "end_date": "2023-12-31"},
+    {"id": 3, "name": "Software Bundle", "discount_percentage": 25, "product_category": "Software", 
+     "description": "25% off when buying multiple software products", "start_date": "2023-05-01", "end_date": "2023-07-31"},
+]
+
+def seed_sample_data():
+    """
+    Fill an empty database with the demo catalog, agent and customers.
+
+    Returns:
+        bool: True if sample data was added, False if the database already had products
+    """
+    if Product.query.count() == 0:
+        # Add sample products
+        for product_data in sample_products:
+            product = Product(
+                name=product_data["name"],
+                description=product_data["description"],
+                category=product_data["category"],
+                price=product_data["price"]
+            )
+            db.session.add(product)
+        
+        # Add sample promotions
+        for promo_data in sample_promotions:
+            promotion = Promotion(
+                name=promo_data["name"],
+                description=promo_data["description"],
+                discount_percentage=promo_data["discount_percentage"],
+                start_date=datetime.datetime.strptime(promo_data["start_date"], "%Y-%m-%d"),
+                end_date=datetime.datetime.strptime(promo_data["end_date"], "%Y-%m-%d"),
+                product_category=promo_data["product_category"]
+            )
+            db.session.add(promotion)
+        
+        # Create a sample agent
+        agent = User(
+            username="agent1",
+            email="agent1@example.com",
+            password_hash="$2b$12$tDCfUvdcgCwqVP7Fez2n8eI3JWtgX6F.ZRnJyQn3iKU2RGpx2wrQy"  # password is 'password'
+        )
+        db.session.add(agent)
+        
+        # Create some sample customers
+        customers = [
+            {"first_name": "John", "last_name": "Doe", "email": "john@example.com", "phone": "555-1234"},
+            {"first_name": "Jane", "last_name": "Smith", "email": "jane@example.com", "phone": "555-5678"},
+            {"first_name": "Bob", "last_name": "Johnson", "email": "bob@example.com", "phone": "555-9012"}
+        ]
+        
+        for customer_data in customers:
+            customer = Customer(
+                first_name=customer_data["first_name"],
+                last_name=customer_data["last_name"],
+                email=customer_data["email"],
+                phone=customer_data["phone"]
+            )
+            db.session.add(customer)
+        
+        db.session.commit()
+        
+        # Now add some relationships after initial commit
+        # Add agent to customers
+        agent = User.query.first()
+        for customer in Customer.query.all():
+            customer.agent_id = agent.id
+        
+        # Add some preferences
+        preferences = [
+            {"customer_id": 1, "category": "Software", "preference_level": 4},
+            {"customer_id": 1, "category": "Service", "preference_level": 3},
+            {"customer_id": 2, "category": "Add-on", "preference_level": 5},
+            {"customer_id": 3, "category": "Service", "preference_level": 4}
+        ]
+        
+        for pref_data in preferences:
+            pref = CustomerPreference(
+                customer_id=pref_data["customer_id"],
+                category=pref_data["category"],
+                preference_level=pref_data["preference_level"]
+            )
+            db.session.add(pref)
+        
+        # Add some interactions
+        interactions = [
+            {"customer_id": 1, "agent_id": 1, "interaction_type": "call", 
+             "notes": "Customer inquired about premium services", 
+             "recommendations": "Recommended Premium Account and Security Package"},
+            {"customer_id": 2, "agent_id": 1, "interaction_type": "email", 
+             "notes": "Customer had billing questions", 
+             "recommendations": "Explained billing process and recommended Mobile Add-on"},
+            {"customer_id": 3, "agent_id": 1, "interaction_type": "chat", 
+             "notes": "Customer needed technical support", 
+             "recommendations": "Resolved issue and recommended Security Package"}
+        ]
+        
+        for int_data in interactions:
+            interaction = Interaction(
+                customer_id=int_data["customer_id"],
+                agent_id=int_data["agent_id"],
+                interaction_type=int_data["interaction_type"],
+                notes=int_data["notes"],
+                recommendations=int_data["recommendations"]
+            )
+            db.session.add(interaction)
+        
+        # Add some purchases
+        purchases = [
+            {"customer_id": 1, "product_id": 1, "amount": 99.99},
+            {"customer_id": 2, "product_id": 4, "amount": 9.99},
+            {"customer_id": 3, "product_id": 2, "amount": 49.99}
+        ]
+        
+        for pur_data in purchases:
+            purchase = Purchase(
+                customer_id=pur_data["customer_id"],
+                product_id=pur_data["product_id"],
+                amount=pur_data["amount"]
+            )
+            db.session.add(purchase)
+        
+        db.session.commit()
+        return True
+    return False
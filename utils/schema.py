@@ -0,0 +1,108 @@
+from app import db
+from models import Customer, Product, CustomerPreference, Interaction, Purchase, Promotion, CustomerRecommendation
+from sqlalchemy import inspect, and_, or_, func, text
+from sqlalchemy.schema import CreateIndex
+import datetime
+
+
+def ensure_indexes():
+    """
+    Create indexes declared on the models that are missing from the database.
+
+    db.create_all() only creates indexes together with new tables, so indexes
+    added to existing tables would otherwise never reach databases created by
+    an earlier version of the app. CREATE INDEX IF NOT EXISTS is used because
+    expression indexes cannot be reflected on every backend.
+    """
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            for index in table.indexes:
+                connection.execute(CreateIndex(index, if_not_exists=True))
+
+
+def upgrade_schema():
+    """
+    Create or bring a database up to date: new tables first, then missing
+    indexes and the full-text index, then the analytics rollups,
+    co-purchase counts, time series buckets and segment sketches if they
+    were never built
+    """
+    from utils.analytics_rollups import ensure_rollups
+    from utils.copurchase import ensure_copurchases
+    from utils.timeseries import ensure_timeseries
+    from utils.segment_sketches import ensure_segment_sketches
+    from utils.interaction_search import ensure_search_index
+
+    db.create_all()
+    ensure_indexes()
+    ensure_search_index()
+    ensure_rollups()
+    ensure_copurchases()
+    ensure_timeseries()
+    ensure_segment_sketches()
+
+
+def hot_queries():
+    """
+    The queries behind the profile page, the recommender and the dashboard.
+
+    Returns:
+        list: (name, query, allow_sort) tuples; allow_sort marks queries whose
+            ORDER BY legitimately needs a sort step
+    """
+    now = datetime.datetime.now()
+    return [
+        ("interactions by customer, newest first",
+         Interaction.query.filter_by(customer_id=1).order_by(Interaction.created_at.desc()), False),
+        ("purchases by customer, newest first",
+         Purchase.query.filter_by(customer_id=1).order_by(Purchase.purchase_date.desc()), False),
+        ("purchased product ids by customer",
+         db.session.query(Purchase.product_id).filter_by(customer_id=1), False),
+        ("preferences by customer",
+         CustomerPreference.query.filter_by(customer_id=1), False),
+        ("preference for customer and category",
+         CustomerPreference.query.filter_by(customer_id=1, category="Service"), False),
+        ("active promotions",
+         Promotion.query.filter(Promotion.start_date <= now, Promotion.end_date >= now), False),
+        ("products by category",
+         Product.query.filter_by(category="Service"), False),
+        ("stored recommendations by customer",
+         CustomerRecommendation.query.filter_by(customer_id=1).order_by(CustomerRecommendation.rank), True),
+        ("customer prefix search",
+         Customer.query.filter(or_(*(
+             and_(func.lower(column) >= "jo", func.lower(column) < "jp")
+             for column in (Customer.first_name, Customer.last_name, Customer.email)
+         ))).order_by(Customer.id).limit(26), True),
+    ]
+
+
+def check_query_plans():
+    """
+    Run EXPLAIN QUERY PLAN on every hot query and report the ones that fall
+    back to a full table scan (or an avoidable sort). Only SQLite is checked.
+
+    Returns:
+        list: (name, plan detail lines) for every query with a bad plan
+    """
+    if db.engine.dialect.name != "sqlite":
+        raise RuntimeError("Query plan checks are only implemented for SQLite")
+
+    # EXPLAIN does not read the schema cookie, so make sure this connection
+    # has seen indexes created by other connections since it last read it
+    db.session.execute(text("SELECT count(*) FROM sqlite_master"))
+
+    problems = []
+    for name, query, allow_sort in hot_queries():
+        sql = str(query.statement.compile(db.engine, compile_kwargs={"literal_binds": True}))
+        details = [row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        full_scans = [
+            detail for detail in details
+            if detail.startswith("SCAN ") and "USING" not in detail
+        ]
+        sorts = [] if allow_sort else [detail for detail in details if "TEMP B-TREE" in detail]
+        if full_scans or sorts:
+            problems.append((name, details))
+    return problems
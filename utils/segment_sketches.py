@@ -0,0 +1,333 @@
+"""
+Sketch-based segment analytics.
+
+SegmentSketch rows hold, per day, a HyperLogLog of the customers who
+bought each product and of the customers each agent interacted with, and
+for the whole catalog a Space-Saving summary of the most purchased
+products next to a Count-Min sketch of purchase counts per product.
+Distinct customers per category come from the daily ActivityBucket
+sketches (see utils/timeseries.py). A flush hook folds inserted purchases
+and interactions into the current rows; every sketch merges across days,
+so the analytics for the last SEGMENT_WINDOW_DAYS days read a fixed
+number of small rows however many purchases they cover. Per product and
+agent, only the sketches of the few keys that can still make the top of
+their list are merged: keys are visited by event count, an upper bound on
+their distinct customers, until no remaining key could beat the list.
+
+The numbers are estimates: distinct customers are within about 1.6%
+(standard error), and top product counts overestimate by at most their
+reported error. Deletes and edits are not subtracted until
+``flask analytics rebuild-sketches``.
+"""
+from app import db
+from models import Product, Purchase, Interaction, User, ActivityBucket, SegmentSketch
+from utils import data_events
+from utils.analytics_rollups import from_key
+from utils.db_utils import upsert_increment
+from utils.sketches import HyperLogLog, CountMinSketch, SpaceSaving, merge_hll
+from utils.timeseries import PURCHASE, bucket_start
+from flask import current_app, has_app_context
+from sqlalchemy import and_, bindparam, delete, func, insert, select, update
+from collections import Counter, defaultdict
+import datetime
+import heapq
+
+PRODUCT = "product"
+AGENT = "agent"
+TOP_PRODUCTS = "top_products"
+PRODUCT_COUNTS = "product_counts"
+KEY_COLUMNS = ["dimension", "key", "day"]
+# Products tracked by each day's Space-Saving summary
+TOP_PRODUCTS_CAPACITY = 64
+# Count-Min shape: overestimates stay under e/512 (0.5%) of the window's
+# purchases with probability 1 - e**-4 (98%)
+COUNT_MIN_WIDTH = 512
+COUNT_MIN_DEPTH = 4
+# Entries per list in the segment analytics
+SEGMENT_LIST_SIZE = 5
+# Keys whose sketches are loaded per query while looking for the top reach
+REACH_CANDIDATE_BATCH = 10
+
+
+def _new_sketch(dimension):
+    if dimension == TOP_PRODUCTS:
+        return SpaceSaving(TOP_PRODUCTS_CAPACITY)
+    if dimension == PRODUCT_COUNTS:
+        return CountMinSketch(COUNT_MIN_WIDTH, COUNT_MIN_DEPTH)
+    return HyperLogLog()
+
+
+def _load_sketch(dimension, blob):
+    if not blob:
+        return _new_sketch(dimension)
+    if dimension == TOP_PRODUCTS:
+        return SpaceSaving.from_bytes(blob)
+    if dimension == PRODUCT_COUNTS:
+        return CountMinSketch.from_bytes(blob)
+    return HyperLogLog.from_bytes(blob)
+
+
+def _day(at):
+    return bucket_start(at or datetime.datetime.utcnow(), "day")
+
+
+class SketchDelta:
+    """Purchases and interactions to fold into SegmentSketch rows"""
+
+    def __init__(self):
+        self.events = defaultdict(int)
+        # (dimension, key, day) -> customer ids, for the HyperLogLog dimensions
+        self.customers = defaultdict(set)
+        # day -> product id -> purchases
+        self.product_counts = defaultdict(Counter)
+
+    def __bool__(self):
+        return bool(self.events)
+
+    def add_purchase(self, day, product_id, customer_id):
+        if product_id is None:
+            return
+        key = (PRODUCT, str(product_id), day)
+        self.events[key] += 1
+        if customer_id is not None:
+            self.customers[key].add(customer_id)
+        for dimension in (TOP_PRODUCTS, PRODUCT_COUNTS):
+            self.events[(dimension, "", day)] += 1
+        self.product_counts[day][product_id] += 1
+
+    def add_interaction(self, day, agent_id, customer_id):
+        if agent_id is None:
+            return
+        key = (AGENT, str(agent_id), day)
+        self.events[key] += 1
+        if customer_id is not None:
+            self.customers[key].add(customer_id)
+
+    def fold(self, key, sketch):
+        """Add this delta's values for key to sketch"""
+        dimension, _, day = key
+        if dimension in (TOP_PRODUCTS, PRODUCT_COUNTS):
+            return sketch.update(self.product_counts[day])
+        return sketch.update(self.customers[key])
+
+
+def _key_filter(key):
+    return and_(*(SegmentSketch.__table__.c[column] == value for column, value in zip(KEY_COLUMNS, key)))
+
+
+def apply_sketch_delta(connection, delta):
+    """
+    Write a SketchDelta: event counts with one upsert, which creates and
+    locks the rows, then the merged sketches.
+    """
+    if not delta:
+        return
+    table = SegmentSketch.__table__
+    upsert_increment(connection, table, KEY_COLUMNS, [
+        dict(zip(KEY_COLUMNS, key), event_count=count) for key, count in delta.events.items()
+    ])
+    rows = []
+    for key in delta.events:
+        blob = connection.execute(select(table.c.sketch).where(_key_filter(key))).scalar()
+        row = {f"b_{column}": value for column, value in zip(KEY_COLUMNS, key)}
+        row["b_sketch"] = delta.fold(key, _load_sketch(key[0], blob)).to_bytes()
+        rows.append(row)
+    connection.execute(
+        update(table)
+        .where(and_(*(table.c[column] == bindparam(f"b_{column}") for column in KEY_COLUMNS)))
+        .values(sketch=bindparam("b_sketch")),
+        rows
+    )
+
+
+@data_events.on_flush
+def _maintain_sketches(connection, changes):
+    delta = SketchDelta()
+    for row in changes.inserted.get(Purchase.__table__.name, []):
+        delta.add_purchase(_day(row.get("purchase_date")), row.get("product_id"), row.get("customer_id"))
+    for row in changes.inserted.get(Interaction.__table__.name, []):
+        delta.add_interaction(_day(row.get("created_at")), row.get("agent_id"), row.get("customer_id"))
+    apply_sketch_delta(connection, delta)
+
+
+def _write_day(delta):
+    rows = [
+        dict(zip(KEY_COLUMNS, key), event_count=count,
+             sketch=delta.fold(key, _new_sketch(key[0])).to_bytes())
+        for key, count in delta.events.items()
+    ]
+    if rows:
+        db.session.execute(insert(SegmentSketch.__table__), rows)
+
+
+def rebuild_segment_sketches(batch_size=10000):
+    """
+    Recompute every sketch from the base tables in one transaction.
+
+    Rows are read in date order and written one day at a time, so memory
+    is bounded by a single day's activity.
+    """
+    db.session.execute(delete(SegmentSketch.__table__))
+    sources = [
+        (select(Purchase.purchase_date, Purchase.product_id, Purchase.customer_id)
+         .where(Purchase.purchase_date.isnot(None))
+         .order_by(Purchase.purchase_date), SketchDelta.add_purchase),
+        (select(Interaction.created_at, Interaction.agent_id, Interaction.customer_id)
+         .where(Interaction.created_at.isnot(None))
+         .order_by(Interaction.created_at), SketchDelta.add_interaction)
+    ]
+    for query, add in sources:
+        delta, day, next_day = SketchDelta(), None, None
+        for at, dimension_id, customer_id in db.session.execute(query.execution_options(yield_per=batch_size)):
+            if day is None or at >= next_day:
+                _write_day(delta)
+                delta, day = SketchDelta(), _day(at)
+                next_day = day + datetime.timedelta(days=1)
+            add(delta, day, dimension_id, customer_id)
+        _write_day(delta)
+    db.session.commit()
+
+
+def ensure_segment_sketches():
+    """Build the sketches once for databases created before they existed"""
+    if db.session.query(SegmentSketch.day).first() is None and (
+            db.session.query(Purchase.id).first() is not None
+            or db.session.query(Interaction.id).first() is not None):
+        rebuild_segment_sketches()
+
+
+def _window_start(days):
+    today = bucket_start(datetime.datetime.utcnow(), "day")
+    return today - datetime.timedelta(days=days - 1)
+
+
+def _reach(rows):
+    """Merge (key, blob) rows per key into distinct-customer estimates, largest first"""
+    blobs = defaultdict(list)
+    for key, blob in rows:
+        blobs[key].append(blob)
+    return sorted(((key, merge_hll(key_blobs).estimate()) for key, key_blobs in blobs.items()),
+                  key=lambda item: item[1], reverse=True)
+
+
+def _top_reach(session, dimension, start, limit):
+    """
+    The limit keys of a dimension with the most distinct customers since start.
+
+    A key's distinct customers never exceed its events, so keys are merged
+    in event count order and the search stops once the next key has no
+    more events than the weakest entry of a full list.
+
+    Returns:
+        list: (key, estimated distinct customers), largest first
+    """
+    if limit <= 0:
+        return []
+    candidates = session.query(SegmentSketch.key, func.sum(SegmentSketch.event_count)).filter(
+        SegmentSketch.dimension == dimension,
+        SegmentSketch.day >= start
+    ).group_by(SegmentSketch.key).order_by(func.sum(SegmentSketch.event_count).desc(), SegmentSketch.key).all()
+
+    top = []  # min-heap of (customers, key)
+    for batch_start in range(0, len(candidates), REACH_CANDIDATE_BATCH):
+        batch = [
+            key for key, events in candidates[batch_start:batch_start + REACH_CANDIDATE_BATCH]
+            if len(top) < limit or events > top[0][0]
+        ]
+        if not batch:
+            break
+        blobs = defaultdict(list)
+        for key, blob in session.query(SegmentSketch.key, SegmentSketch.sketch).filter(
+                SegmentSketch.dimension == dimension,
+                SegmentSketch.key.in_(batch),
+                SegmentSketch.day >= start):
+            if blob:
+                blobs[key].append(blob)
+        for key in batch:
+            if not blobs[key]:
+                continue
+            entry = (merge_hll(blobs[key]).estimate(), key)
+            if len(top) < limit:
+                heapq.heappush(top, entry)
+            elif entry > top[0]:
+                heapq.heapreplace(top, entry)
+    return [(key, customers) for customers, key in sorted(top, reverse=True)]
+
+
+def get_segment_analytics(session, days=None, limit=SEGMENT_LIST_SIZE):
+    """
+    Distinct customers per category, product and agent, and the most
+    purchased products, over the last days days, from the sketches.
+
+    Args:
+        session: Session to read the sketches with
+        days (int): Window length in days, today included (default:
+            SEGMENT_WINDOW_DAYS)
+        limit (int): Entries in the product, agent and top product lists
+
+    Returns:
+        dict: Estimated counts; top products carry the most their count
+            may overestimate the true count as error
+    """
+    if days is None:
+        days = current_app.config.get("SEGMENT_WINDOW_DAYS", 30) if has_app_context() else 30
+    start = _window_start(days)
+
+    categories = _reach(session.query(ActivityBucket.category, ActivityBucket.customers).filter(
+        ActivityBucket.granularity == "day",
+        ActivityBucket.activity == PURCHASE,
+        ActivityBucket.bucket >= start
+    ))
+
+    products = _top_reach(session, PRODUCT, start, limit)
+    agents = _top_reach(session, AGENT, start, limit)
+
+    sketches = defaultdict(list)
+    for dimension, key, blob in session.query(
+            SegmentSketch.dimension, SegmentSketch.key, SegmentSketch.sketch
+    ).filter(SegmentSketch.dimension.in_([TOP_PRODUCTS, PRODUCT_COUNTS]), SegmentSketch.day >= start):
+        if blob:
+            sketches[dimension].append((key, blob))
+
+    top_products = SpaceSaving(TOP_PRODUCTS_CAPACITY)
+    for _, blob in sketches[TOP_PRODUCTS]:
+        top_products.merge(SpaceSaving.from_bytes(blob))
+    counts = None
+    for _, blob in sketches[PRODUCT_COUNTS]:
+        sketch = CountMinSketch.from_bytes(blob)
+        counts = sketch if counts is None else counts.merge(sketch)
+    # Space-Saving picks the candidates; the Count-Min estimate, tighter
+    # once many days are merged, ranks them
+    top = []
+    for product_id, count, error in top_products.top(TOP_PRODUCTS_CAPACITY):
+        lower = count - error
+        if counts is not None and counts.estimate(product_id) < count:
+            count = counts.estimate(product_id)
+            error = min(count - lower, counts.error_bound())
+        top.append((product_id, count, error))
+    top = sorted(top, key=lambda item: item[1], reverse=True)[:limit]
+
+    product_ids = {int(key) for key, _ in products} | {product_id for product_id, _, _ in top}
+    agent_ids = [int(key) for key, _ in agents]
+    names = dict(session.query(Product.id, Product.name).filter(Product.id.in_(product_ids))) if product_ids else {}
+    usernames = dict(session.query(User.id, User.username).filter(User.id.in_(agent_ids))) if agent_ids else {}
+
+    return {
+        "window_days": days,
+        "category_customers": [
+            {"category": from_key(category), "customers": customers}
+            for category, customers in categories
+        ],
+        "product_customers": [
+            {"id": int(key), "name": names.get(int(key)), "customers": customers}
+            for key, customers in products
+        ],
+        "agent_customers": [
+            {"id": int(key), "name": usernames.get(int(key)), "customers": customers}
+            for key, customers in agents
+        ],
+        "top_products": [
+            {"id": product_id, "name": names.get(product_id), "count": count, "error": error}
+            for product_id, count, error in top
+        ]
+    }
@@ -0,0 +1,290 @@
+"""
+Mergeable approximate-counting sketches, serializable to compact blobs.
+
+Values are hashed with BLAKE2b rather than hash(), so sketches built by
+different processes (and Python versions) agree and can be merged.
+"""
+from array import array
+import hashlib
+import heapq
+import json
+import math
+import struct
+import sys
+
+# Serialized layouts
+_DENSE = 1
+_SPARSE = 2
+# Maps every non-zero register to 1, to find them with bytes.find
+_NONZERO = bytes([0] + [1] * 255)
+
+
+def hash64(value):
+    """Stable 64-bit hash of a value's string form"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode(), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """
+    Distinct-count estimator.
+
+    2**precision one-byte registers; the standard error of the estimate is
+    about 1.04 / sqrt(2**precision), 1.6% at the default precision of 12.
+    Sketches of the same precision merge by taking the register-wise
+    maximum, so per-day sketches combine into any longer range. Values can
+    be added but not removed.
+    """
+
+    def __init__(self, precision=12, registers=None):
+        if not 4 <= precision <= 16:
+            raise ValueError("precision must be between 4 and 16")
+        self.precision = precision
+        self.registers = bytearray(registers) if registers is not None else bytearray(1 << precision)
+
+    def add(self, value):
+        x = hash64(value)
+        index = x >> (64 - self.precision)
+        rest = x & ((1 << (64 - self.precision)) - 1)
+        # Position of the first 1 bit in the remaining bits
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+        return self
+
+    def merge(self, other):
+        """Fold another sketch of the same precision into this one"""
+        if other.precision != self.precision:
+            raise ValueError("cannot merge HyperLogLogs of different precision")
+        self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        # Registers hold small ranks: sum per rank with C-level counts,
+        # stopping once every register is accounted for
+        total, remaining, rank = 0.0, m, 0
+        while remaining:
+            count = self.registers.count(rank)
+            total += count * 2.0 ** -rank
+            remaining -= count
+            rank += 1
+        raw = alpha * m * m / total
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+    def __len__(self):
+        return self.estimate()
+
+    def to_bytes(self):
+        """Serialize; sparse sketches store only their non-zero registers"""
+        registers = self.registers
+        used_count = len(registers) - registers.count(0)
+        if 3 * used_count >= len(registers):
+            return bytes([_DENSE, self.precision]) + bytes(registers)
+        if used_count < 128:
+            # Most per-bucket sketches are nearly empty: jump between set
+            # registers instead of visiting all of them
+            flags = registers.translate(_NONZERO)
+            used = []
+            index = flags.find(1)
+            while index != -1:
+                used.append((index, registers[index]))
+                index = flags.find(1, index + 1)
+        else:
+            used = [(index, rank) for index, rank in enumerate(registers) if rank]
+        return bytes([_SPARSE, self.precision]) + b"".join(
+            struct.pack(">HB", index, rank) for index, rank in used
+        )
+
+    @classmethod
+    def from_bytes(cls, data):
+        layout, precision = data[0], data[1]
+        if layout == _DENSE:
+            return cls(precision, data[2:])
+        if layout != _SPARSE:
+            raise ValueError("not a serialized HyperLogLog")
+        sketch = cls(precision)
+        for index, rank in struct.iter_unpack(">HB", data[2:]):
+            sketch.registers[index] = rank
+        return sketch
+
+
+def merge_hll(blobs, precision=12):
+    """
+    Merge serialized HyperLogLogs (None entries are skipped) into one sketch.
+
+    Sparse blobs are folded in register by register without being expanded,
+    which keeps merging many small per-bucket sketches cheap.
+    """
+    merged = HyperLogLog(precision)
+    registers = merged.registers
+    for blob in blobs:
+        if not blob:
+            continue
+        if blob[0] != _SPARSE:
+            merged.merge(HyperLogLog.from_bytes(blob))
+            continue
+        if blob[1] != precision:
+            raise ValueError("cannot merge HyperLogLogs of different precision")
+        for index, rank in struct.iter_unpack(">HB", blob[2:]):
+            if rank > registers[index]:
+                registers[index] = rank
+    return merged
+
+
+class CountMinSketch:
+    """
+    Frequency estimator.
+
+    depth rows of width counters; an estimate never undercounts, and
+    overcounts by more than e/width of the total added count with
+    probability at most e**-depth. Sketches of the same shape merge by
+    adding their counters.
+    """
+
+    def __init__(self, width=512, depth=4, counts=None):
+        self.width = width
+        self.depth = depth
+        self.counts = array("q", counts) if counts is not None else array("q", bytes(8 * width * depth))
+        self.total = 0
+
+    def _cells(self, value):
+        # Double hashing: depth indexes from one 64-bit hash
+        x = hash64(value)
+        low, high = x & 0xFFFFFFFF, x >> 32
+        return [row * self.width + (low + row * high) % self.width for row in range(self.depth)]
+
+    def add(self, value, count=1):
+        for cell in self._cells(value):
+            self.counts[cell] += count
+        self.total += count
+
+    def update(self, counts):
+        """Add a mapping of value -> count"""
+        for value, count in counts.items():
+            self.add(value, count)
+        return self
+
+    def estimate(self, value):
+        return min(self.counts[cell] for cell in self._cells(value))
+
+    def error_bound(self):
+        """Most an estimate overcounts, with probability 1 - e**-depth"""
+        return math.ceil(math.e / self.width * self.total)
+
+    def merge(self, other):
+        if (other.width, other.depth) != (self.width, self.depth):
+            raise ValueError("cannot merge CountMinSketches of different shape")
+        self.counts = array("q", map(int.__add__, self.counts, other.counts))
+        self.total += other.total
+        return self
+
+    def to_bytes(self):
+        counts = array("q", self.counts)
+        if sys.byteorder == "big":
+            counts.byteswap()
+        return struct.pack("<HHq", self.width, self.depth, self.total) + counts.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        width, depth, total = struct.unpack_from("<HHq", data)
+        counts = array("q")
+        counts.frombytes(data[struct.calcsize("<HHq"):])
+        if sys.byteorder == "big":
+            counts.byteswap()
+        sketch = cls(width, depth, counts)
+        sketch.total = total
+        return sketch
+
+
+class SpaceSaving:
+    """
+    Heavy hitters: the most frequent values, tracking at most capacity of them.
+
+    Every value added more than total / capacity times is tracked. A
+    tracked count overestimates the true count by at most its error, so
+    ``count - error`` is a lower bound. Summaries merge by adding counts
+    (an untracked value of a full summary may have been added up to that
+    summary's smallest count times) and keeping the largest capacity.
+    Values must be JSON serializable.
+    """
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        # value -> [count, error]
+        self.counters = {}
+
+    def add(self, value, count=1):
+        counter = self.counters.get(value)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[value] = [count, 0]
+        else:
+            # Replace the smallest counter; its count becomes the new value's error
+            smallest = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(smallest)[0]
+            self.counters[value] = [floor + count, floor]
+
+    def update(self, counts):
+        """
+        Add a mapping of value -> count (e.g. a Counter of one batch) in a
+        single pass, keeping the capacity largest counters.
+        """
+        floor = self._floor()
+        merged = dict(self.counters)
+        for value, count in counts.items():
+            counter = merged.get(value)
+            if counter is not None:
+                merged[value] = [counter[0] + count, counter[1]]
+            else:
+                merged[value] = [floor + count, floor]
+        self.counters = dict(heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0]))
+        return self
+
+    def _floor(self):
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def merge(self, other):
+        own_floor, other_floor = self._floor(), other._floor()
+        merged = {}
+        for value in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(value, (own_floor, own_floor))
+            other_count, other_error = other.counters.get(value, (other_floor, other_floor))
+            merged[value] = [count + other_count, error + other_error]
+        self.capacity = max(self.capacity, other.capacity)
+        self.counters = dict(heapq.nlargest(self.capacity, merged.items(), key=lambda item: item[1][0]))
+        return self
+
+    def top(self, n):
+        """
+        Returns:
+            list: Up to n (value, count, error) tuples, most frequent first
+        """
+        return [
+            (value, count, error)
+            for value, (count, error) in heapq.nlargest(n, self.counters.items(), key=lambda item: item[1][0])
+        ]
+
+    def to_bytes(self):
+        return json.dumps(
+            [self.capacity, [[value, count, error] for value, (count, error) in self.counters.items()]],
+            separators=(",", ":")
+        ).encode()
+
+    @classmethod
+    def from_bytes(cls, data):
+        capacity, counters = json.loads(data)
+        summary = cls(capacity)
+        summary.counters = {value: [count, error] for value, count, error in counters}
+        return summary
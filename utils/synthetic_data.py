@@ -0,0 +1,216 @@
+from app import db
+from models import User, Customer, Product, CustomerPreference, Interaction, Purchase, Promotion
+from utils.analytics_rollups import rebuild_rollups
+from utils.copurchase import rebuild_copurchases
+from utils.timeseries import rebuild_timeseries
+from utils.segment_sketches import rebuild_segment_sketches
+from utils.data_versions import bump_customer_versions
+from sqlalchemy import insert, func
+import datetime
+import itertools
+import random
+
+CATEGORIES = [
+    "Service", "Software", "Add-on", "Hardware", "Training", "Support",
+    "Security", "Storage", "Analytics", "Networking", "Mobile", "Consulting"
+]
+INTERACTION_TYPES = ["call", "email", "chat", "visit", "social"]
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda",
+    "William", "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Charles", "Karen", "Wei", "Aisha", "Carlos", "Yuki", "Olga"
+]
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Chen", "Khan", "Silva", "Sato"
+]
+NOTES = [
+    "Asked about upgrading the current plan",
+    "Reported a billing discrepancy",
+    "Needed help with account setup",
+    "Requested a product demo",
+    "Followed up on an open support ticket",
+    "Interested in the latest promotion"
+]
+
+
+class GenerationSettings:
+    """Size of a synthetic dataset"""
+
+    def __init__(self, customers=10000, products=200, purchases=200000, interactions=100000,
+                 agents=20, promotions=20, max_preferences=3, days=730):
+        self.customers = customers
+        self.products = products
+        self.purchases = purchases
+        self.interactions = interactions
+        self.agents = agents
+        self.promotions = promotions
+        self.max_preferences = max_preferences
+        self.days = days
+
+
+def _insert_chunks(model, rows, chunk_size, progress=None, returning=False):
+    """Insert an iterable of row dicts chunk by chunk, one commit per chunk"""
+    table = model.__table__
+    ids = []
+    done = 0
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            break
+        if returning:
+            ids += db.session.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), chunk
+            ).scalars().all()
+        else:
+            db.session.execute(insert(table), chunk)
+        db.session.commit()
+        done += len(chunk)
+        if progress:
+            progress(table.name, done)
+    return ids
+
+
+def _random_time(rng, end, days):
+    return end - datetime.timedelta(seconds=rng.randrange(days * 86400))
+
+
+def generate_dataset(settings, seed=42, end=None, chunk_size=10000, progress=None):
+    """
+    Add a reproducible synthetic dataset to the database.
+
+    The same settings, seed and end date always produce the same rows.
+    Product popularity and customer activity follow a long-tailed
+    distribution so hot customers and best sellers exist as in real data.
+    Rows are written with chunked Core INSERTs that bypass the ORM (and its
+    flush hooks), so the analytics rollups are rebuilt and the new
+    customers' data versions bumped once at the end.
+
+    Args:
+        settings (GenerationSettings): Number of rows of each kind
+        seed (int): Random seed
+        end (datetime): Latest timestamp generated; defaults to today at midnight
+        chunk_size (int): Rows per INSERT and commit
+        progress (callable): Optional callback receiving (table name, rows written)
+
+    Returns:
+        dict: Number of rows written per table
+    """
+    rng = random.Random(seed)
+    if end is None:
+        end = datetime.datetime.combine(datetime.date.today(), datetime.time())
+    # Offsets keep unique usernames and emails clear of existing rows
+    offset = (db.session.query(func.max(Customer.id)).scalar() or 0) + 1
+    agent_offset = (db.session.query(func.max(User.id)).scalar() or 0) + 1
+
+    agent_ids = _insert_chunks(User, (
+        {
+            "username": f"agent{agent_offset + i}",
+            "email": f"agent{agent_offset + i}@example.com",
+            "role": "agent",
+            "created_at": _random_time(rng, end, settings.days)
+        }
+        for i in range(settings.agents)
+    ), chunk_size, progress, returning=True)
+
+    product_rows = [
+        {
+            "name": f"{category} {i + 1}",
+            "description": f"Synthetic {category.lower()} product",
+            "category": category,
+            "price": round(rng.uniform(5, 500), 2),
+            "created_at": _random_time(rng, end, settings.days)
+        }
+        for i, category in enumerate(rng.choice(CATEGORIES) for _ in range(settings.products))
+    ]
+    product_ids = _insert_chunks(Product, product_rows, chunk_size, progress, returning=True)
+    prices = {product_id: row["price"] for product_id, row in zip(product_ids, product_rows)}
+
+    _insert_chunks(Promotion, (
+        {
+            "name": f"Promotion {i + 1}",
+            "description": "Synthetic promotion",
+            "discount_percentage": rng.choice([5, 10, 15, 20, 25, 30]),
+            "start_date": start,
+            "end_date": start + datetime.timedelta(days=rng.randint(7, 90)),
+            "product_category": rng.choice(CATEGORIES + ["All"])
+        }
+        for i in range(settings.promotions)
+        for start in [_random_time(rng, end + datetime.timedelta(days=30), 180)]
+    ), chunk_size, progress)
+
+    customer_ids = _insert_chunks(Customer, (
+        {
+            "first_name": rng.choice(FIRST_NAMES),
+            "last_name": rng.choice(LAST_NAMES),
+            "email": f"customer{offset + i}@example.com",
+            "phone": f"555-{rng.randrange(10000):04d}",
+            "agent_id": rng.choice(agent_ids) if agent_ids else None,
+            "created_at": _random_time(rng, end, settings.days)
+        }
+        for i in range(settings.customers)
+    ), chunk_size, progress, returning=True)
+
+    _insert_chunks(CustomerPreference, (
+        {
+            "customer_id": customer_id,
+            "category": category,
+            "preference_level": rng.randint(1, 5),
+            "created_at": _random_time(rng, end, settings.days)
+        }
+        for customer_id in customer_ids
+        for category in rng.sample(CATEGORIES, rng.randint(0, settings.max_preferences))
+    ), chunk_size, progress)
+
+    # Long-tailed weights: a few products and customers account for most rows
+    product_weights = list(itertools.accumulate(rng.paretovariate(1.2) for _ in product_ids))
+    customer_weights = list(itertools.accumulate(rng.paretovariate(1.5) for _ in customer_ids))
+
+    def pick(ids, weights):
+        return rng.choices(ids, cum_weights=weights)[0]
+
+    purchases = 0
+    if customer_ids and product_ids:
+        def purchase_rows():
+            for _ in range(settings.purchases):
+                product_id = pick(product_ids, product_weights)
+                yield {
+                    "customer_id": pick(customer_ids, customer_weights),
+                    "product_id": product_id,
+                    "purchase_date": _random_time(rng, end, settings.days),
+                    "amount": prices[product_id]
+                }
+        _insert_chunks(Purchase, purchase_rows(), chunk_size, progress)
+        purchases = settings.purchases
+
+    interactions = 0
+    if customer_ids:
+        def interaction_rows():
+            for _ in range(settings.interactions):
+                yield {
+                    "customer_id": pick(customer_ids, customer_weights),
+                    "agent_id": rng.choice(agent_ids) if agent_ids else None,
+                    "interaction_type": rng.choice(INTERACTION_TYPES),
+                    "notes": rng.choice(NOTES),
+                    "recommendations": None,
+                    "created_at": _random_time(rng, end, settings.days)
+                }
+        _insert_chunks(Interaction, interaction_rows(), chunk_size, progress)
+        interactions = settings.interactions
+
+    rebuild_rollups()
+    rebuild_copurchases()
+    rebuild_timeseries()
+    rebuild_segment_sketches()
+    # A customer id reused after a delete may still have cached fragments
+    bump_customer_versions(customer_ids, chunk_size)
+    return {
+        "agents": len(agent_ids),
+        "products": len(product_ids),
+        "promotions": settings.promotions,
+        "customers": len(customer_ids),
+        "purchases": purchases,
+        "interactions": interactions
+    }
@@ -0,0 +1,371 @@
+"""
+Pre-aggregated purchase and interaction time series.
+
+ActivityBucket rows hold, per hour or day, per activity (purchase or
+interaction), product category and interaction type: the number of
+events, the purchase amount and a HyperLogLog of the customers involved.
+A flush hook keeps them current. Hourly rows are only kept for the last
+TIMESERIES_HOURLY_DAYS days; daily rows are kept indefinitely, and weekly
+and monthly series are merged from them, so no query ever reads raw
+purchases or interactions.
+
+Deletes and edits decrement counts and amounts, but a HyperLogLog cannot
+forget a customer: distinct-customer estimates only shrink on
+``flask analytics rebuild-timeseries``. Changing a product's category
+affects later purchases only, until the same rebuild.
+"""
+from app import db
+from models import Product, Purchase, Interaction, ActivityBucket
+from utils import data_events
+from utils.analytics_rollups import to_key, from_key
+from utils.db_utils import upsert_increment, report_session
+from utils.sketches import HyperLogLog, merge_hll
+from flask import current_app, has_app_context
+from sqlalchemy import and_, bindparam, delete, insert, select, update
+from collections import defaultdict
+import datetime
+import time
+
+PURCHASE = "purchase"
+INTERACTION = "interaction"
+GRANULARITIES = ("hour", "day", "week", "month")
+# Granularities stored in ActivityBucket; coarser ones are merged from days
+STORED_GRANULARITIES = ("hour", "day")
+# Most buckets returned by one time series query
+MAX_BUCKETS = 2000
+KEY_COLUMNS = ["granularity", "bucket", "activity", "category", "interaction_type"]
+# Seconds between deletions of expired hourly buckets, per process
+PRUNE_INTERVAL = 3600
+
+_last_pruned = 0.0
+
+
+def bucket_start(at, granularity):
+    """Start of the hour, day, ISO week (Monday) or month containing at"""
+    if granularity == "hour":
+        return at.replace(minute=0, second=0, microsecond=0)
+    day = at.replace(hour=0, minute=0, second=0, microsecond=0)
+    if granularity == "day":
+        return day
+    if granularity == "week":
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == "month":
+        return day.replace(day=1)
+    raise ValueError(f"unknown granularity {granularity!r}")
+
+
+def next_bucket(start, granularity):
+    """Start of the bucket following the one starting at start"""
+    if granularity == "hour":
+        return start + datetime.timedelta(hours=1)
+    if granularity == "day":
+        return start + datetime.timedelta(days=1)
+    if granularity == "week":
+        return start + datetime.timedelta(weeks=1)
+    if start.month == 12:
+        return start.replace(year=start.year + 1, month=1)
+    return start.replace(month=start.month + 1)
+
+
+def hourly_cutoff(now=None):
+    """Hourly buckets starting before this are not kept"""
+    days = current_app.config.get("TIMESERIES_HOURLY_DAYS", 14) if has_app_context() else 14
+    return bucket_start((now or datetime.datetime.utcnow()) - datetime.timedelta(days=days), "hour")
+
+
+class BucketDelta:
+    """Pending changes to ActivityBucket rows"""
+
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.counts = defaultdict(int)
+        self.amounts = defaultdict(float)
+        self.customers = defaultdict(set)
+
+    def add(self, activity, at, category, interaction_type, amount, customer_id, sign=1):
+        at = at or datetime.datetime.utcnow()
+        for granularity in STORED_GRANULARITIES:
+            if granularity == "hour" and at < self.cutoff:
+                continue
+            key = (granularity, bucket_start(at, granularity), activity,
+                   to_key(category), to_key(interaction_type))
+            self.counts[key] += sign
+            self.amounts[key] += sign * (amount or 0)
+            if sign > 0 and customer_id is not None:
+                self.customers[key].add(customer_id)
+
+
+def compute_bucket_delta(connection, changes, cutoff=None):
+    """Translate purchase and interaction changes into bucket changes"""
+    delta = BucketDelta(cutoff or hourly_cutoff())
+    purchase_table = Purchase.__table__.name
+    interaction_table = Interaction.__table__.name
+
+    purchase_updates = [
+        (old, new) for old, new in changes.updated.get(purchase_table, [])
+        if any(old.get(column) != new.get(column)
+               for column in ("product_id", "purchase_date", "amount", "customer_id"))
+    ]
+    product_ids = {row.get("product_id") for row in changes.inserted.get(purchase_table, [])}
+    product_ids.update(row.get("product_id") for row in changes.deleted.get(purchase_table, []))
+    for old, new in purchase_updates:
+        product_ids.update((old.get("product_id"), new.get("product_id")))
+    product_ids.discard(None)
+    categories = {}
+    if product_ids:
+        categories = dict(connection.execute(
+            select(Product.id, Product.category).where(Product.id.in_(product_ids))
+        ).all())
+
+    def add_purchase(row, sign):
+        delta.add(PURCHASE, row.get("purchase_date"), categories.get(row.get("product_id")), None,
+                  row.get("amount"), row.get("customer_id"), sign)
+
+    def add_interaction(row, sign):
+        delta.add(INTERACTION, row.get("created_at"), None, row.get("interaction_type"),
+                  0, row.get("customer_id"), sign)
+
+    for row in changes.inserted.get(purchase_table, []):
+        add_purchase(row, 1)
+    for row in changes.deleted.get(purchase_table, []):
+        add_purchase(row, -1)
+    for old, new in purchase_updates:
+        add_purchase(old, -1)
+        add_purchase(new, 1)
+
+    for row in changes.inserted.get(interaction_table, []):
+        add_interaction(row, 1)
+    for row in changes.deleted.get(interaction_table, []):
+        add_interaction(row, -1)
+    for old, new in changes.updated.get(interaction_table, []):
+        if any(old.get(column) != new.get(column) for column in ("interaction_type", "created_at", "customer_id")):
+            add_interaction(old, -1)
+            add_interaction(new, 1)
+    return delta
+
+
+def _key_filter(keys):
+    return and_(*(ActivityBucket.__table__.c[column] == value for column, value in zip(KEY_COLUMNS, keys)))
+
+
+def apply_bucket_delta(connection, delta):
+    """
+    Write a BucketDelta: counts and amounts with one upsert, then the merged
+    customer sketches. The upsert locks the rows it touches (PostgreSQL) or
+    the database (SQLite), so concurrent writers cannot lose sketch updates.
+    """
+    table = ActivityBucket.__table__
+    keys = [key for key in delta.counts if delta.counts[key] or delta.amounts[key] or delta.customers[key]]
+    upsert_increment(connection, table, KEY_COLUMNS, [
+        dict(zip(KEY_COLUMNS, key), event_count=delta.counts[key], amount_sum=delta.amounts[key])
+        for key in keys
+    ])
+
+    rows = []
+    for key in keys:
+        if not delta.customers[key]:
+            continue
+        blob = connection.execute(select(table.c.customers).where(_key_filter(key))).scalar()
+        sketch = HyperLogLog.from_bytes(blob) if blob else HyperLogLog()
+        sketch.update(delta.customers[key])
+        row = {f"b_{column}": value for column, value in zip(KEY_COLUMNS, key)}
+        row["b_sketch"] = sketch.to_bytes()
+        rows.append(row)
+    if rows:
+        connection.execute(
+            update(table)
+            .where(and_(*(table.c[column] == bindparam(f"b_{column}") for column in KEY_COLUMNS)))
+            .values(customers=bindparam("b_sketch")),
+            rows
+        )
+
+
+def prune_hourly_buckets(connection, cutoff=None):
+    """Delete hourly buckets older than the retention window"""
+    connection.execute(delete(ActivityBucket.__table__).where(
+        ActivityBucket.granularity == "hour",
+        ActivityBucket.bucket < (cutoff or hourly_cutoff())
+    ))
+
+
+@data_events.on_flush
+def _maintain_buckets(connection, changes):
+    global _last_pruned
+    if not changes.touches(Purchase.__table__.name, Interaction.__table__.name):
+        return
+    apply_bucket_delta(connection, compute_bucket_delta(connection, changes))
+    if time.monotonic() - _last_pruned >= PRUNE_INTERVAL:
+        _last_pruned = time.monotonic()
+        prune_hourly_buckets(connection)
+
+
+def _insert_buckets(delta):
+    rows = [
+        dict(
+            zip(KEY_COLUMNS, key),
+            event_count=count,
+            amount_sum=delta.amounts[key],
+            customers=HyperLogLog().update(delta.customers[key]).to_bytes()
+        )
+        for key, count in delta.counts.items()
+    ]
+    if rows:
+        db.session.execute(insert(ActivityBucket.__table__), rows)
+
+
+def rebuild_timeseries(batch_size=10000):
+    """
+    Recompute every bucket from the base tables in one transaction.
+
+    Rows are read in time order and written one day at a time, so memory
+    is bounded by a single day's activity.
+    """
+    cutoff = hourly_cutoff()
+    db.session.execute(delete(ActivityBucket.__table__))
+    sources = [
+        (select(Purchase.purchase_date, Purchase.customer_id, Purchase.amount, Product.category)
+         .join(Product, Purchase.product_id == Product.id), Purchase.purchase_date,
+         lambda delta, at, customer_id, amount, category:
+             delta.add(PURCHASE, at, category, None, amount, customer_id)),
+        (select(Interaction.created_at, Interaction.customer_id, Interaction.interaction_type),
+         Interaction.created_at,
+         lambda delta, at, customer_id, interaction_type:
+             delta.add(INTERACTION, at, None, interaction_type, 0, customer_id))
+    ]
+    # Rows without a timestamp count as written now, as in the flush hook;
+    # their buckets may already exist, so they are merged in last
+    undated = BucketDelta(cutoff)
+    for query, column, add in sources:
+        delta, next_day = BucketDelta(cutoff), None
+        dated = query.where(column.isnot(None)).order_by(column).execution_options(yield_per=batch_size)
+        for row in db.session.execute(dated):
+            if next_day is None or row[0] >= next_day:
+                _insert_buckets(delta)
+                delta = BucketDelta(cutoff)
+                next_day = bucket_start(row[0], "day") + datetime.timedelta(days=1)
+            add(delta, *row)
+        _insert_buckets(delta)
+        for row in db.session.execute(query.where(column.is_(None)).execution_options(yield_per=batch_size)):
+            add(undated, *row)
+    apply_bucket_delta(db.session.connection(), undated)
+    db.session.commit()
+
+
+def ensure_timeseries():
+    """Build the buckets once for databases created before they existed"""
+    if db.session.query(ActivityBucket.bucket).first() is None and (
+            db.session.query(Purchase.id).first() is not None
+            or db.session.query(Interaction.id).first() is not None):
+        rebuild_timeseries()
+
+
+def _estimate(blobs):
+    return merge_hll(blobs).estimate() if blobs else 0
+
+
+class SeriesPoint:
+    """
+    Totals of one output bucket, merged from stored buckets. Customer
+    sketches are kept serialized and only merged by to_dict, one at a time,
+    so long hourly ranges do not hold thousands of expanded sketches.
+    """
+
+    def __init__(self):
+        self.purchases = 0
+        self.revenue = 0.0
+        self.interactions = 0
+        self.customers = []
+        # category -> [purchases, revenue, customer sketches]
+        self.categories = {}
+        # interaction type -> [interactions, customer sketches]
+        self.interaction_types = {}
+
+    def add(self, activity, category, interaction_type, count, amount, sketch):
+        if sketch:
+            self.customers.append(sketch)
+        if activity == PURCHASE:
+            self.purchases += count
+            self.revenue += amount
+            entry = self.categories.setdefault(from_key(category), [0, 0.0, []])
+            entry[0] += count
+            entry[1] += amount
+        else:
+            self.interactions += count
+            entry = self.interaction_types.setdefault(from_key(interaction_type), [0, []])
+            entry[0] += count
+        if sketch:
+            entry[-1].append(sketch)
+
+    def to_dict(self, bucket):
+        return {
+            "bucket": bucket.isoformat(),
+            "purchases": self.purchases,
+            "revenue": round(self.revenue, 2),
+            "interactions": self.interactions,
+            "customers": _estimate(self.customers),
+            "categories": [
+                {"category": category, "purchases": count, "revenue": round(revenue, 2),
+                 "customers": _estimate(sketches)}
+                for category, (count, revenue, sketches)
+                in sorted(self.categories.items(), key=lambda item: item[0] or "")
+            ],
+            "interaction_types": [
+                {"type": interaction_type, "interactions": count, "customers": _estimate(sketches)}
+                for interaction_type, (count, sketches)
+                in sorted(self.interaction_types.items(), key=lambda item: item[0] or "")
+            ]
+        }
+
+
+def get_timeseries(start, end, granularity="day"):
+    """
+    Purchase and interaction series between start (inclusive) and end (exclusive).
+
+    Args:
+        start (datetime): First instant covered; rounded down to its bucket
+        end (datetime): End of the range
+        granularity (str): hour, day, week or month
+
+    Returns:
+        list: One dict per bucket in order, including empty buckets, with
+            purchases, revenue, interactions, an estimate of distinct
+            customers and per-category / per-interaction-type breakdowns
+
+    Raises:
+        ValueError: For an unknown granularity, an empty range, a range
+            with more than MAX_BUCKETS buckets, or hourly data older than
+            the hourly retention window
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+    first = bucket_start(start, granularity)
+    if end <= first:
+        raise ValueError("'to' must be after 'from'")
+    if granularity == "hour" and first < hourly_cutoff():
+        raise ValueError("hourly data is only kept for the last "
+                         f"{current_app.config.get('TIMESERIES_HOURLY_DAYS', 14)} days")
+
+    points = {}
+    bucket = first
+    while bucket < end:
+        if len(points) >= MAX_BUCKETS:
+            raise ValueError(f"at most {MAX_BUCKETS} buckets can be requested at once")
+        points[bucket] = SeriesPoint()
+        bucket = next_bucket(bucket, granularity)
+
+    stored = "hour" if granularity == "hour" else "day"
+    with report_session() as session:
+        rows = session.query(
+            ActivityBucket.bucket, ActivityBucket.activity, ActivityBucket.category,
+            ActivityBucket.interaction_type, ActivityBucket.event_count,
+            ActivityBucket.amount_sum, ActivityBucket.customers
+        ).filter(
+            ActivityBucket.granularity == stored,
+            ActivityBucket.bucket >= first,
+            ActivityBucket.bucket < end
+        ).all()
+
+    for row_bucket, activity, category, interaction_type, count, amount, customers in rows:
+        point = points[bucket_start(row_bucket, granularity)]
+        point.add(activity, category, interaction_type, count, amount, customers)
+    return [point.to_dict(bucket) for bucket, point in points.items()]